@@ -0,0 +1,68 @@
+from typing import Mapping
+
+from fastapi import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class BodySizeLimitMiddleware:
+    """
+    Reject request bodies larger than ``max_bytes`` with 413.
+
+    Paths listed in ``path_limits`` get their own limit instead, so that
+    batch endpoints can accept many files while a single-file endpoint stops
+    an oversized upload long before the batch limit.
+
+    A declared Content-Length over the limit is refused before any of the
+    body is read. Bodies without one, or that send more than they declared,
+    are counted as they stream in and aborted as soon as they cross the
+    limit, so an oversized upload is never fully parsed or spooled.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int, path_limits: Mapping[str, int] = {}):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.path_limits = dict(path_limits)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        max_bytes = self.path_limits.get(scope["path"], self.max_bytes)
+        headers = dict(scope["headers"])
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            await self._reject(send, max_bytes)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    raise HTTPException(status_code=413, detail=_detail(max_bytes))
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send: Send, max_bytes: int) -> None:
+        body = f'{{"detail":"{_detail(max_bytes)}"}}'.encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                    (b"connection", b"close"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+def _detail(max_bytes: int) -> str:
+    return f"Request body too large. The limit is {max_bytes} bytes"
@@ -1,37 +1,317 @@
 # NOTE: This file was partially generated using AI assistance.
-from io import BytesIO
+import asyncio
+import json
+import time
+from contextlib import nullcontext
+from pathlib import Path, PurePath
+from typing import List
 
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile
-from fastapi.responses import StreamingResponse
+from fastapi import (
+    APIRouter,
+    Depends,
+    File,
+    Form,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    UploadFile,
+)
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import ValidationError
 
+from ..core import metrics
+from ..core.admission import (
+    AdmissionController,
+    DeadlineExceededError,
+    OverloadedError,
+    current_deadline,
+)
+from ..core.config import settings
+from ..core.encoding import OutputOptions, iter_chunks
+from ..core.engine import ProcessingEngine
 from ..core.image_processor import (
     AspectRatio,
+    Detection,
+    FaceFraming,
     ImageProcessingError,
     ImageProcessingParams,
-    ImageProcessor,
+    ImageTooLargeError,
+    Rendition,
 )
+from ..core.jobs import JobManager, JobQueueFullError, JobUpload
+from ..core.pipeline import crop_to_file_task
+from ..core.service import CropResult, CropService, content_hash, output_etag
+from ..core.video import VideoParams
+from ..utils.zip_stream import ZipStream
+from .schemas import (
+    DetectionResponse,
+    GeometryResponse,
+    JobStatus,
+    PathRequest,
+    PathResponse,
+)
+from .timing import record_upload_time
+
+router = APIRouter(dependencies=[Depends(record_upload_time)])
+# Routes that read the body themselves and record their own upload stage
+raw_router = APIRouter()
+engine = ProcessingEngine()
+crop_service = CropService(engine)
+admission = AdmissionController()
+job_manager = JobManager(crop_service)
+
+# Seconds between comments on an idle progress stream, so proxies keep it open
+_SSE_KEEPALIVE_SECONDS = 15.0
+
+
+def _parse_processing_params(
+    aspect_ratio: str, zoom: str, framing: str = FaceFraming.LARGEST.value
+) -> ImageProcessingParams:
+    """Validate the raw form fields and build the processing parameters."""
+    # Validate aspect ratio
+    try:
+        aspect_ratio_enum = AspectRatio(aspect_ratio)
+    except ValueError:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Invalid aspect ratio. Must be one of: {[e.value for e in AspectRatio]}",
+        )
+
+    # Validate zoom
+    try:
+        zoom_float = float(zoom)
+        if not 0.0 <= zoom_float <= 1.0:
+            raise HTTPException(
+                status_code=422,
+                detail="Zoom must be between 0.0 and 1.0",
+            )
+    except ValueError:
+        raise HTTPException(
+            status_code=422,
+            detail="Invalid zoom value. Must be a number between 0.0 and 1.0",
+        )
+
+    # Validate framing
+    try:
+        framing_enum = FaceFraming(framing)
+    except ValueError:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Invalid framing. Must be one of: {[e.value for e in FaceFraming]}",
+        )
+
+    return ImageProcessingParams(
+        aspect_ratio=aspect_ratio_enum, zoom=zoom_float, framing=framing_enum
+    )
+
+
+def _http_error(error: ImageProcessingError) -> HTTPException:
+    """Map a processing failure to the HTTP error reported to the client."""
+    if isinstance(error, DeadlineExceededError):
+        status_code = 504
+    elif isinstance(error, ImageTooLargeError):
+        status_code = 413
+    else:
+        status_code = 422
+    return HTTPException(status_code=status_code, detail=str(error))
+
+
+def _request_deadline(timeout: str | None) -> float | None:
+    """Wall-clock deadline from an X-Request-Timeout header, counted from the request's arrival."""
+    if timeout is None:
+        return None
+    try:
+        seconds = float(timeout)
+    except ValueError:
+        seconds = float("nan")
+    if not seconds > 0:
+        raise HTTPException(
+            status_code=400, detail="X-Request-Timeout must be a positive number of seconds"
+        )
+    timer = metrics.current_request.get()
+    arrived = time.time() - (timer.elapsed() if timer is not None else 0.0)
+    return arrived + seconds
+
+
+async def _admit(x_request_timeout: str | None = Header(None)):
+    """
+    Dependency holding an admission slot while a processing endpoint runs.
+
+    Clients may send ``X-Request-Timeout`` (seconds) to say when the result
+    stops being useful. A request that would be admitted, or whose queued
+    work would start, after that is answered with 504 instead of processed;
+    a request shed on overload gets 503 with ``Retry-After``.
+    """
+    deadline = _request_deadline(x_request_timeout)
+    try:
+        async with admission.admit(deadline):
+            current_deadline.set(deadline)
+            yield
+    except OverloadedError as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)}
+        )
+    except DeadlineExceededError as e:
+        raise _http_error(e)
 
-router = APIRouter()
-image_processor = ImageProcessor()
 
+def _check_upload_size(file: UploadFile) -> None:
+    """Reject an uploaded file over the per-image size limit before reading it."""
+    if file.size is not None and file.size > settings.max_upload_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. The limit is {settings.max_upload_bytes} bytes",
+        )
+
+
+def _check_batch_size(files: List[UploadFile] | None) -> None:
+    """Reject a batch without files or with more than the per-request limit."""
+    if not files:
+        raise HTTPException(status_code=400, detail="No files provided")
+    if len(files) > settings.max_batch_files:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many files. The limit is {settings.max_batch_files} per request",
+        )
+
+
+def _parse_output_options(
+    output_format: str | None = Form(None),
+    quality: int | None = Form(None),
+    progressive: bool | None = Form(None),
+    optimize: bool | None = Form(None),
+    subsampling: str | None = Form(None),
+    max_edge: int | None = Form(None),
+    keep_icc_profile: bool | None = Form(None),
+    keep_exif: bool | None = Form(None),
+) -> OutputOptions:
+    """Build the output encoding options from the form fields that were sent."""
+    return _build_output_options(
+        format=output_format,
+        quality=quality,
+        progressive=progressive,
+        optimize=optimize,
+        subsampling=subsampling,
+        max_edge=max_edge,
+        keep_icc_profile=keep_icc_profile,
+        keep_exif=keep_exif,
+    )
+
+
+def _parse_output_query(
+    output_format: str | None = Query(None),
+    quality: int | None = Query(None),
+    progressive: bool | None = Query(None),
+    optimize: bool | None = Query(None),
+    subsampling: str | None = Query(None),
+    max_edge: int | None = Query(None),
+    keep_icc_profile: bool | None = Query(None),
+    keep_exif: bool | None = Query(None),
+) -> OutputOptions:
+    """Build the output encoding options from the query parameters that were sent."""
+    return _build_output_options(
+        format=output_format,
+        quality=quality,
+        progressive=progressive,
+        optimize=optimize,
+        subsampling=subsampling,
+        max_edge=max_edge,
+        keep_icc_profile=keep_icc_profile,
+        keep_exif=keep_exif,
+    )
+
+
+def _build_output_options(**fields) -> OutputOptions:
+    try:
+        return OutputOptions(**{k: v for k, v in fields.items() if v is not None})
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an If-None-Match header lists the ETag (weak comparison, as for GET)."""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(
+        candidate.removeprefix("W/") == etag for candidate in candidates
+    )
+
+
+def _unchanged_response(cache_headers: dict[str, str], method: str) -> Response:
+    """
+    Answer a request whose If-None-Match lists the current ETag, without a body.
+
+    GET gets 304 Not Modified. Any other method gets 412 Precondition Failed,
+    as RFC 9110 (13.1.2) requires; for the POST routes it tells the client
+    that the crop it holds is still current.
+    """
+    status_code = 304 if method in ("GET", "HEAD") else 412
+    return Response(status_code=status_code, headers=cache_headers)
+
+
+def _cache_headers(etag: str, shared: bool = False) -> dict[str, str]:
+    """Validator and freshness headers of a crop; only token URLs may be shared caches."""
+    scope = "public" if shared else "private"
+    return {
+        "ETag": etag,
+        "Cache-Control": f"{scope}, max-age={settings.cache_max_age_seconds}",
+    }
+
+
+def _output_filename(filename: str | None, output: OutputOptions) -> str:
+    """Name of the processed file, with the extension of the output format."""
+    stem = PurePath(PurePath(filename or "").name or "image").stem
+    return f"processed_{stem}.{output.format.extension}"
 
-@router.post("/process-image")
+
+def _image_response(
+    result: CropResult,
+    output: OutputOptions,
+    filename: str | None,
+    cache_headers: dict[str, str] | None = None,
+) -> StreamingResponse:
+    """Stream an encoded crop to the client in fixed-size chunks."""
+    return StreamingResponse(
+        iter_chunks(result.content),
+        media_type=output.format.media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{_output_filename(filename, output)}"',
+            "Content-Length": str(len(result.content)),
+            **_detection_headers(result.detection),
+            **(cache_headers or {}),
+        },
+    )
+
+
+@router.post("/process-image", dependencies=[Depends(_admit)])
 async def process_image(
     file: UploadFile = File(None),
     aspect_ratio: str = Form(AspectRatio.ORIGINAL.value),
     zoom: str = Form("0.2"),
+    framing: str = Form(FaceFraming.LARGEST.value),
+    output: OutputOptions = Depends(_parse_output_options),
+    if_none_match: str | None = Header(None),
 ):
     """
     Process an uploaded image to detect and crop faces.
 
+    The response carries an ETag derived from the image content, the
+    parameters and the processor version; a request whose If-None-Match
+    lists it is answered with 412 before any processing.
+
     Args:
         file (UploadFile): The image file to process
         aspect_ratio (str): Desired aspect ratio for the output image
         zoom (str): Zoom level (0.0 means maximum padding, 1.0 means tight crop)
+        framing (str): Frame the "largest" face or the whole "group" of faces
+        output (OutputOptions): Output encoding (format, quality, progressive,
+            optimize, chroma subsampling, max edge, ICC/EXIF passthrough)
+        if_none_match (str | None): ETags of crops the client already has
 
     Returns:
-        StreamingResponse: The processed image
+        StreamingResponse: The processed image, or 412 if the client has it
 
     Raises:
         HTTPException: If the file is invalid or processing fails
@@ -42,60 +322,926 @@ async def process_image(
     if not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Invalid image format")
 
-    # Validate aspect ratio
+    params = _parse_processing_params(aspect_ratio, zoom, framing)
+
+    # Read the file
+    _check_upload_size(file)
+    contents = await file.read()
+    if not contents:
+        raise HTTPException(status_code=400, detail="Empty file provided")
+    metrics.UPLOAD_BYTES.observe(len(contents))
+
+    return await _process_image_contents(contents, params, output, file.filename, if_none_match)
+
+
+async def _read_raw_image(request: Request) -> bytearray:
+    """
+    Dependency reading a raw image request body into a single buffer.
+
+    With a Content-Length the buffer is allocated once at that size and the
+    body's chunks are copied straight into it as they arrive; chunked bodies
+    are appended instead. The size limit is enforced while reading.
+    """
+    media_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if not (media_type.startswith("image/") or media_type == "application/octet-stream"):
+        raise HTTPException(status_code=400, detail="Invalid image format")
+
+    too_large = HTTPException(
+        status_code=413, detail=f"File too large. The limit is {settings.max_upload_bytes} bytes"
+    )
+    declared = request.headers.get("content-length")
+    if declared is not None and not declared.isdigit():
+        raise HTTPException(status_code=400, detail="Invalid Content-Length")
+    if declared is not None and int(declared) > settings.max_upload_bytes:
+        raise too_large
+
+    start = time.perf_counter()
+    buffer = bytearray(int(declared or 0))
+    received = 0
+    with memoryview(buffer) if declared is not None else nullcontext() as view:
+        async for chunk in request.stream():
+            end = received + len(chunk)
+            if end > settings.max_upload_bytes:
+                raise too_large
+            if view is None:
+                buffer += chunk
+            elif end > len(view):
+                raise HTTPException(status_code=400, detail="Body longer than its Content-Length")
+            else:
+                view[received:end] = chunk
+            received = end
+    if received < len(buffer):
+        raise HTTPException(status_code=400, detail="Body shorter than its Content-Length")
+    if not received:
+        raise HTTPException(status_code=400, detail="Empty file provided")
+
+    metrics.UPLOAD_BYTES.observe(received)
+    metrics.record_stage("upload", time.perf_counter() - start)
+    return buffer
+
+
+@raw_router.post("/process-image-raw")
+async def process_image_raw(
+    contents: bytearray = Depends(_read_raw_image),
+    _: None = Depends(_admit),
+    aspect_ratio: str = Query(AspectRatio.ORIGINAL.value),
+    zoom: str = Query("0.2"),
+    framing: str = Query(FaceFraming.LARGEST.value),
+    filename: str | None = Query(None),
+    output: OutputOptions = Depends(_parse_output_query),
+    if_none_match: str | None = Header(None),
+):
+    """
+    Process an image sent as the raw request body, without multipart encoding.
+
+    Behaves like ``/process-image``, but the body is the image itself
+    (``Content-Type: image/*`` or ``application/octet-stream``) and the
+    parameters are query parameters. Skipping multipart parsing and upload
+    spooling saves CPU time and copies on large images.
+
+    Args:
+        contents (bytearray): The request body
+        aspect_ratio (str): Desired aspect ratio for the output image
+        zoom (str): Zoom level (0.0 means maximum padding, 1.0 means tight crop)
+        framing (str): Frame the "largest" face or the whole "group" of faces
+        filename (str | None): Name of the source file, used for the output's name
+        output (OutputOptions): Output encoding options
+        if_none_match (str | None): ETags of crops the client already has
+
+    Returns:
+        StreamingResponse: The processed image, or 412 if the client has it
+
+    Raises:
+        HTTPException: If the body is invalid or processing fails
+    """
+    params = _parse_processing_params(aspect_ratio, zoom, framing)
+    return await _process_image_contents(contents, params, output, filename, if_none_match)
+
+
+async def _process_image_contents(
+    contents: bytes | bytearray,
+    params: ImageProcessingParams,
+    output: OutputOptions,
+    filename: str | None,
+    if_none_match: str | None,
+) -> Response:
+    """Crop an uploaded image, answering 412 if the client already has the result."""
     try:
-        aspect_ratio_enum = AspectRatio(aspect_ratio)
-    except ValueError:
+        digest = content_hash(contents)
+        cache_headers = _cache_headers(output_etag(digest, params, output))
+        if _etag_matches(if_none_match, cache_headers["ETag"]):
+            return _unchanged_response(cache_headers, "POST")
+
+        # Process and encode the image in a worker
+        result = await crop_service.crop(contents, params, output, digest=digest)
+
+        return _image_response(result, output, filename, cache_headers)
+    except HTTPException:
+        raise
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ImageProcessingError as e:
+        raise _http_error(e)
+    except Exception as e:
         raise HTTPException(
-            status_code=422,
-            detail=f"Invalid aspect ratio. Must be one of: {[e.value for e in AspectRatio]}",
+            status_code=500, detail=f"An unexpected error occurred: {str(e)}"
         )
 
-    # Validate zoom
+
+def _detection_headers(detection: Detection) -> dict[str, str]:
+    """Response headers describing how the faces were found."""
+    return {"X-Detector-Tier": detection.tier or "none"}
+
+
+def _unique_archive_name(
+    filename: str | None, index: int, used: set[str], output: OutputOptions
+) -> str:
+    """Build a collision-free archive member name for a processed upload."""
+    path = PurePath(_output_filename(filename or f"image_{index}", output))
+    candidate = path.name
+    counter = 1
+    while candidate in used:
+        candidate = f"{path.stem}_{counter}{path.suffix}"
+        counter += 1
+    used.add(candidate)
+    return candidate
+
+
+async def _process_upload(
+    file: UploadFile, params: ImageProcessingParams, output: OutputOptions
+) -> tuple[CropResult | None, str | None]:
+    """Process a single batch member, returning either the crop or an error message."""
+    if not file.content_type or not file.content_type.startswith("image/"):
+        return None, "Invalid image format"
+
+    if file.size is not None and file.size > settings.max_upload_bytes:
+        return None, f"File too large. The limit is {settings.max_upload_bytes} bytes"
+
     try:
-        zoom_float = float(zoom)
-        if not 0.0 <= zoom_float <= 1.0:
-            raise HTTPException(
-                status_code=422,
-                detail="Zoom must be between 0.0 and 1.0",
-            )
-    except ValueError:
+        contents = await file.read()
+        if not contents:
+            return None, "Empty file provided"
+        metrics.UPLOAD_BYTES.observe(len(contents))
+
+        return await crop_service.crop(contents, params, output), None
+    except ImageProcessingError as e:
+        return None, str(e)
+    except Exception as e:
+        return None, f"An unexpected error occurred: {str(e)}"
+
+
+async def _stream_batch(
+    files: List[UploadFile], params: ImageProcessingParams, output: OutputOptions
+):
+    """Yield a ZIP archive whose members are written as soon as each crop finishes."""
+    semaphore = asyncio.Semaphore(settings.batch_concurrency)
+
+    async def run(index: int, file: UploadFile):
+        async with semaphore:
+            return index, *await _process_upload(file, params, output)
+
+    tasks = [asyncio.create_task(run(index, file)) for index, file in enumerate(files)]
+    archive = ZipStream()
+    used_names: set[str] = set()
+    manifest: list[dict | None] = [None] * len(files)
+
+    try:
+        for completed in asyncio.as_completed(tasks):
+            index, result, error = await completed
+            filename = files[index].filename
+            if error is not None:
+                manifest[index] = {"filename": filename, "status": "error", "error": error}
+                continue
+
+            name = _unique_archive_name(filename, index, used_names, output)
+            manifest[index] = {
+                "filename": filename,
+                "status": "ok",
+                "output": name,
+                "detector_tier": result.detection.tier,
+            }
+            yield archive.add(name, result.content)
+
+        yield archive.add(
+            "manifest.json", json.dumps({"files": manifest}, indent=2).encode(), True
+        )
+        yield archive.close()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@router.post("/process-batch", dependencies=[Depends(_admit)])
+async def process_batch(
+    files: List[UploadFile] = File(None),
+    aspect_ratio: str = Form(AspectRatio.ORIGINAL.value),
+    zoom: str = Form("0.2"),
+    framing: str = Form(FaceFraming.LARGEST.value),
+    output: OutputOptions = Depends(_parse_output_options),
+):
+    """
+    Process many uploaded images with the same settings and stream back a ZIP.
+
+    Crops are added to the archive in completion order. Files that cannot be
+    processed do not abort the batch; they are listed with their error in the
+    archive's ``manifest.json``.
+
+    Args:
+        files (List[UploadFile]): The image files to process
+        aspect_ratio (str): Desired aspect ratio for the output images
+        zoom (str): Zoom level (0.0 means maximum padding, 1.0 means tight crop)
+        framing (str): Frame the "largest" face or the whole "group" of faces
+        output (OutputOptions): Output encoding applied to every image
+
+    Returns:
+        StreamingResponse: ZIP archive of the processed images
+
+    Raises:
+        HTTPException: If no or too many files are provided, or the parameters are invalid
+    """
+    _check_batch_size(files)
+    params = _parse_processing_params(aspect_ratio, zoom, framing)
+
+    # The uploads are read, and the admission slot held, while the body streams;
+    # FastAPI closes both only after the response (>= 0.118, see pyproject.toml)
+    return StreamingResponse(
+        _stream_batch(files, params, output),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="processed_images.zip"'},
+    )
+
+
+async def _read_upload(file: UploadFile | None, media_type: str = "image") -> bytes:
+    """Validate an upload of the given top-level media type and return its contents."""
+    if not file:
+        raise HTTPException(status_code=400, detail="No file provided")
+
+    if not file.content_type or not file.content_type.startswith(f"{media_type}/"):
+        raise HTTPException(status_code=400, detail=f"Invalid {media_type} format")
+
+    _check_upload_size(file)
+    contents = await file.read()
+    if not contents:
+        raise HTTPException(status_code=400, detail="Empty file provided")
+    metrics.UPLOAD_BYTES.observe(len(contents))
+    return contents
+
+
+@router.post(
+    "/detect", response_model=DetectionResponse, dependencies=[Depends(_admit)]
+)
+async def detect_faces(file: UploadFile = File(None)):
+    """
+    Detect faces in an uploaded image and keep the image for later crops.
+
+    The returned token can be passed to ``/crop`` with any processing
+    parameters, so changing the settings does not require uploading the image
+    again. Stored images expire after a period without use. An upload larger
+    than the whole image store is not kept and gets no token.
+
+    Args:
+        file (UploadFile): The image file to analyse
+
+    Returns:
+        DetectionResponse: Image token, image dimensions and detected face boxes
+
+    Raises:
+        HTTPException: If the file is invalid or detection fails
+    """
+    contents = await _read_upload(file)
+    try:
+        token, detection = await crop_service.detect(contents)
+    except ImageProcessingError as e:
+        raise _http_error(e)
+    return DetectionResponse.from_detection(token, detection)
+
+
+@router.post(
+    "/geometry", response_model=GeometryResponse, dependencies=[Depends(_admit)]
+)
+async def crop_geometry(
+    file: UploadFile = File(None),
+    original_width: int = Form(..., ge=1),
+    original_height: int = Form(..., ge=1),
+    aspect_ratio: str = Form(AspectRatio.ORIGINAL.value),
+    zoom: str = Form("0.2"),
+    framing: str = Form(FaceFraming.LARGEST.value),
+):
+    """
+    Plan a crop from a small preview, for clients that crop the original themselves.
+
+    Faces are detected on the preview and the crop is calculated for the
+    original's dimensions, returning only coordinates; no image is encoded.
+    The preview must be the original scaled down, with the same aspect ratio.
+
+    Args:
+        file (UploadFile): Downscaled preview of the original image
+        original_width (int): Width of the original image in pixels
+        original_height (int): Height of the original image in pixels
+        aspect_ratio (str): Desired aspect ratio of the crop
+        zoom (str): Zoom level (0.0 means maximum padding, 1.0 means tight crop)
+        framing (str): Frame the "largest" face or the whole "group" of faces
+
+    Returns:
+        GeometryResponse: Face boxes and the crop in original coordinates
+
+    Raises:
+        HTTPException: If the preview is invalid or detection fails
+    """
+    params = _parse_processing_params(aspect_ratio, zoom, framing)
+    contents = await _read_upload(file)
+    original_size = (original_width, original_height)
+    try:
+        detection, faces, box = await crop_service.geometry(contents, params, original_size)
+    except ImageProcessingError as e:
+        raise _http_error(e)
+    return GeometryResponse.from_geometry(original_size, detection, faces, box)
+
+
+@router.post("/crop", dependencies=[Depends(_admit)])
+async def crop_image(
+    image_token: str = Form(...),
+    aspect_ratio: str = Form(AspectRatio.ORIGINAL.value),
+    zoom: str = Form("0.2"),
+    framing: str = Form(FaceFraming.LARGEST.value),
+    output: OutputOptions = Depends(_parse_output_options),
+    if_none_match: str | None = Header(None),
+):
+    """
+    Crop an image previously uploaded to ``/detect``.
+
+    Face detection is not repeated; only the crop geometry, the crop and the
+    encoding run.
+
+    Args:
+        image_token (str): Token returned by ``/detect``
+        aspect_ratio (str): Desired aspect ratio for the output image
+        zoom (str): Zoom level (0.0 means maximum padding, 1.0 means tight crop)
+        framing (str): Frame the "largest" face or the whole "group" of faces
+        output (OutputOptions): Output encoding options
+        if_none_match (str | None): ETags of crops the client already has
+
+    Returns:
+        StreamingResponse: The processed image, or 412 if the client has it
+
+    Raises:
+        HTTPException: If the token is unknown or expired, or processing fails
+    """
+    params = _parse_processing_params(aspect_ratio, zoom, framing)
+    return await _crop_stored_response(image_token, params, output, if_none_match, "POST")
+
+
+async def _crop_stored_response(
+    image_token: str,
+    params: ImageProcessingParams,
+    output: OutputOptions,
+    if_none_match: str | None,
+    method: str,
+) -> Response:
+    """Crop a stored image, unless the client already has this crop."""
+    # The token is the content hash, so the ETag is known without the image;
+    # only the GET URL may be stored by shared caches
+    etag = output_etag(image_token, params, output)
+    cache_headers = _cache_headers(etag, shared=method == "GET")
+    if _etag_matches(if_none_match, cache_headers["ETag"]):
+        return _unchanged_response(cache_headers, method)
+
+    try:
+        result = await crop_service.crop_stored(image_token, params, output)
+    except ImageProcessingError as e:
+        raise _http_error(e)
+
+    if result is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired image token")
+
+    return _image_response(result, output, None, cache_headers)
+
+
+@router.get("/images/{image_token}", dependencies=[Depends(_admit)])
+async def get_image_crop(
+    image_token: str,
+    aspect_ratio: str = Query(AspectRatio.ORIGINAL.value),
+    zoom: str = Query("0.2"),
+    framing: str = Query(FaceFraming.LARGEST.value),
+    output: OutputOptions = Depends(_parse_output_query),
+    if_none_match: str | None = Header(None),
+):
+    """
+    Crop an image previously uploaded to ``/detect``, addressed by URL.
+
+    The same as ``POST /crop`` with the parameters in the query string, so
+    browsers and CDNs can cache the result: it is marked public and
+    revalidates with If-None-Match, which is answered with 304 without
+    touching the image.
+
+    Args:
+        image_token (str): Token returned by ``/detect``
+        aspect_ratio (str): Desired aspect ratio for the output image
+        zoom (str): Zoom level (0.0 means maximum padding, 1.0 means tight crop)
+        framing (str): Frame the "largest" face or the whole "group" of faces
+        output (OutputOptions): Output encoding options
+        if_none_match (str | None): ETags of crops the client already has
+
+    Returns:
+        StreamingResponse: The processed image, or 304 if the client has it
+
+    Raises:
+        HTTPException: If the token is unknown or expired, or processing fails
+    """
+    params = _parse_processing_params(aspect_ratio, zoom, framing)
+    return await _crop_stored_response(image_token, params, output, if_none_match, "GET")
+
+
+def _parse_renditions(
+    aspect_ratios: List[str], widths: List[int] | None, zoom: str
+) -> tuple[List[Rendition], float]:
+    """Validate the requested renditions: every aspect ratio at every width."""
+    requested = {}
+    for aspect_ratio in aspect_ratios:
+        params = _parse_processing_params(aspect_ratio, zoom)
+        for width in widths or [None]:
+            try:
+                rendition = Rendition(aspect_ratio=params.aspect_ratio, width=width)
+            except ValidationError as e:
+                raise HTTPException(status_code=422, detail=str(e))
+            requested[(rendition.aspect_ratio, rendition.width)] = rendition
+
+    if len(requested) > settings.max_renditions:
         raise HTTPException(
             status_code=422,
-            detail="Invalid zoom value. Must be a number between 0.0 and 1.0",
+            detail=f"Too many renditions requested. At most {settings.max_renditions} are allowed",
         )
+    return list(requested.values()), params.zoom
 
-    try:
-        # Read the file
-        contents = await file.read()
-        if not contents:
-            raise HTTPException(status_code=400, detail="Empty file provided")
 
-        input_image = BytesIO(contents)
+@router.post("/process-renditions", dependencies=[Depends(_admit)])
+async def process_renditions(
+    file: UploadFile = File(None),
+    aspect_ratios: List[str] = Form(None),
+    widths: List[int] = Form(None),
+    zoom: str = Form("0.2"),
+    output: OutputOptions = Depends(_parse_output_options),
+):
+    """
+    Produce several crops of one image, decoding and detecting faces only once.
 
-        # Create processing parameters
-        params = ImageProcessingParams(aspect_ratio=aspect_ratio_enum, zoom=zoom_float)
+    Every requested aspect ratio is rendered at every requested width (or at
+    its native crop size when no widths are given). The renditions are
+    returned together in a ZIP with a ``renditions.json`` index.
 
-        # Process the image
-        processed_image = await image_processor.process_image(input_image, params)
+    Args:
+        file (UploadFile): The image file to process
+        aspect_ratios (List[str]): Aspect ratios to render
+        widths (List[int]): Target widths in pixels; crops are never upscaled
+        zoom (str): Zoom level (0.0 means maximum padding, 1.0 means tight crop)
+        output (OutputOptions): Output encoding applied to every rendition
 
-        # Prepare the response
-        output = BytesIO()
-        processed_image.save(output, format="JPEG")
-        output.seek(0)
+    Returns:
+        StreamingResponse: ZIP archive of the renditions
 
-        return StreamingResponse(
-            output,
-            media_type="image/jpeg",
-            headers={
-                "Content-Disposition": f'attachment; filename="processed_{file.filename}"'
-            },
+    Raises:
+        HTTPException: If the file or parameters are invalid or processing fails
+    """
+    if not aspect_ratios:
+        raise HTTPException(status_code=422, detail="No aspect ratios requested")
+    renditions, zoom_float = _parse_renditions(aspect_ratios, widths, zoom)
+    contents = await _read_upload(file)
+
+    try:
+        detection, encoded = await crop_service.renditions(
+            contents, renditions, zoom_float, output
         )
-    except ValidationError as e:
-        raise HTTPException(status_code=422, detail=str(e))
     except ImageProcessingError as e:
-        raise HTTPException(status_code=422, detail=str(e))
-    except Exception as e:
+        raise _http_error(e)
+
+    stem = PurePath(_output_filename(file.filename, output)).stem
+
+    def stream():
+        archive = ZipStream()
+        index = []
+        for rendition, data in zip(renditions, encoded):
+            name = f"{stem}_{rendition.label}.{output.format.extension}"
+            index.append(
+                {
+                    "file": name,
+                    "aspect_ratio": rendition.aspect_ratio.value,
+                    "width": rendition.width,
+                }
+            )
+            yield archive.add(name, data)
+        summary = {"detector_tier": detection.tier, "renditions": index}
+        yield archive.add("renditions.json", json.dumps(summary, indent=2).encode(), True)
+        yield archive.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{stem}_renditions.zip"',
+            **_detection_headers(detection),
+        },
+    )
+
+
+@router.post("/process-faces", dependencies=[Depends(_admit)])
+async def process_faces(
+    file: UploadFile = File(None),
+    aspect_ratio: str = Form(AspectRatio.ORIGINAL.value),
+    zoom: str = Form("0.2"),
+    min_face_size: float = Form(settings.min_relative_face_size, ge=0.0, le=1.0),
+    output: OutputOptions = Depends(_parse_output_options),
+):
+    """
+    Crop every face of a group photo, decoding and detecting faces only once.
+
+    Overlapping detections count as one face, and faces much smaller than the
+    largest one (background people, false positives) are skipped. The crops
+    are returned in a ZIP, largest face first, with a ``faces.json`` index of
+    the face boxes.
+
+    Args:
+        file (UploadFile): The image file to process
+        aspect_ratio (str): Desired aspect ratio for every crop
+        zoom (str): Zoom level (0.0 means maximum padding, 1.0 means tight crop)
+        min_face_size (float): Smallest face to crop, as a fraction of the largest
+            face's side
+        output (OutputOptions): Output encoding applied to every crop
+
+    Returns:
+        StreamingResponse: ZIP archive of the face crops
+
+    Raises:
+        HTTPException: If the file or parameters are invalid or processing fails
+    """
+    params = _parse_processing_params(aspect_ratio, zoom)
+    contents = await _read_upload(file)
+
+    try:
+        detection, crops = await crop_service.faces(contents, params, min_face_size, output)
+    except ImageProcessingError as e:
+        raise _http_error(e)
+
+    stem = PurePath(_output_filename(file.filename, output)).stem
+
+    def stream():
+        archive = ZipStream()
+        index = []
+        for number, (face, data) in enumerate(crops, start=1):
+            name = f"{stem}_face{number}.{output.format.extension}"
+            x, y, width, height = (int(v) for v in face)
+            index.append(
+                {"file": name, "box": {"x": x, "y": y, "width": width, "height": height}}
+            )
+            yield archive.add(name, data)
+        summary = {"detector_tier": detection.tier, "faces": index}
+        yield archive.add("faces.json", json.dumps(summary, indent=2).encode(), True)
+        yield archive.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{stem}_faces.zip"',
+            **_detection_headers(detection),
+        },
+    )
+
+
+@router.post("/process-video", response_model=JobStatus, status_code=202)
+async def process_video(
+    file: UploadFile = File(None),
+    aspect_ratio: str = Form(AspectRatio.PORTRAIT.value),
+    zoom: str = Form("0.0"),
+    keyframe_interval: int = Form(settings.video_keyframe_interval, ge=1),
+    smoothing: float = Form(settings.video_smoothing, gt=0.0, le=1.0),
+):
+    """
+    Queue a video to be reframed around the main face.
+
+    Faces are detected on keyframes and scene cuts only; the crop window is
+    interpolated between them and smoothed over time. The video is processed
+    as a background job with a single item: follow it like any job from
+    ``/jobs/{job_id}`` or ``/jobs/{job_id}/events``, then download the
+    MPEG-4 result from ``/jobs/{job_id}/results/0``. The item's ``video``
+    field reports frame counts and the processing throughput.
+
+    The output has no audio track: OpenCV's video writer only writes video
+    frames, so any audio in the upload is dropped.
+
+    Args:
+        file (UploadFile): The video file to process
+        aspect_ratio (str): Aspect ratio of the output video
+        zoom (str): 0.0 uses the largest window that fits the frame, 1.0 half of it
+        keyframe_interval (int): Run face detection on every n-th frame
+        smoothing (float): Weight of the new position when smoothing the window
+
+    Returns:
+        JobStatus: The queued job
+
+    Raises:
+        HTTPException: If the file or parameters are invalid, or 503 if the job
+            queue is full
+    """
+    processing = _parse_processing_params(aspect_ratio, zoom)
+    params = VideoParams(
+        aspect_ratio=processing.aspect_ratio,
+        zoom=processing.zoom,
+        keyframe_interval=keyframe_interval,
+        smoothing=smoothing,
+    )
+    if not file:
+        raise HTTPException(status_code=400, detail="No file provided")
+    if not file.content_type or not file.content_type.startswith("video/"):
+        raise HTTPException(status_code=400, detail="Invalid video format")
+    _check_upload_size(file)
+    if not file.size:
+        raise HTTPException(status_code=400, detail="Empty file provided")
+    metrics.UPLOAD_BYTES.observe(file.size)
+
+    stem = PurePath(file.filename or "video").stem
+    upload = JobUpload(file.filename, f"processed_{stem}.mp4", file.file)
+    try:
+        job_id = await job_manager.submit_video(upload, params)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return _job_status(job_id)
+
+
+def _resolve_within(path: str, roots: List[Path], strict: bool) -> Path:
+    """Resolve a path (following symlinks) and require it to lie inside one of the roots."""
+    try:
+        resolved = Path(path).resolve(strict=strict)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"File not found: {path}")
+    except (OSError, RuntimeError):
+        raise HTTPException(status_code=400, detail=f"Invalid path: {path}")
+
+    if not any(resolved.is_relative_to(root.resolve()) for root in roots):
         raise HTTPException(
-            status_code=500, detail=f"An unexpected error occurred: {str(e)}"
+            status_code=403, detail=f"Path is outside the allowed directories: {path}"
+        )
+    return resolved
+
+
+@router.post(
+    "/process-path", response_model=PathResponse, dependencies=[Depends(_admit)]
+)
+async def process_path(request: PathRequest):
+    """
+    Crop an image on the server's filesystem and write the result next to it.
+
+    For callers on the same host or volume: the worker memory-maps the source
+    and writes the encoded crop to the target itself, so no image bytes travel
+    through the request or the response. Both paths must lie inside the
+    configured ``local_read_roots`` and ``local_write_roots``; the endpoint is
+    disabled while no read roots are configured.
+
+    Args:
+        request (PathRequest): Source and target paths, processing parameters
+            and output encoding
+
+    Returns:
+        PathResponse: Target path, bytes written and the detected faces
+
+    Raises:
+        HTTPException: If the endpoint is disabled, a path is not allowed or
+            missing, or processing fails
+    """
+    if not settings.local_read_roots:
+        raise HTTPException(status_code=403, detail="Local path processing is disabled")
+
+    source = _resolve_within(request.source, settings.local_read_roots, strict=True)
+    target = _resolve_within(request.target, settings.local_write_roots, strict=False)
+    if not source.is_file():
+        raise HTTPException(status_code=400, detail=f"Not a file: {request.source}")
+    if target.is_dir():
+        raise HTTPException(status_code=400, detail=f"Target is a directory: {request.target}")
+
+    size = source.stat().st_size
+    if size == 0:
+        raise HTTPException(status_code=400, detail="Empty file provided")
+    if size > settings.max_upload_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. The limit is {settings.max_upload_bytes} bytes",
+        )
+
+    try:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        detection, written = await engine.run_file(
+            crop_to_file_task, str(source), request.params, request.output, str(target)
         )
+    except ImageProcessingError as e:
+        raise _http_error(e)
+    except OSError as e:
+        raise HTTPException(status_code=500, detail=f"Could not write the output: {e}")
+
+    return PathResponse.from_detection(str(source), str(target), written, detection)
+
+
+def _job_status(job_id: str, include_items: bool = True) -> JobStatus:
+    """Current state of a job; 404 if it does not exist (or has expired)."""
+    job = job_manager.store.get_job(job_id) if job_manager.store else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return JobStatus.from_rows(job, job_manager.store.get_items(job_id), include_items)
+
+
+@router.post("/jobs", response_model=JobStatus, status_code=202)
+async def submit_job(
+    files: List[UploadFile] = File(None),
+    aspect_ratio: str = Form(AspectRatio.ORIGINAL.value),
+    zoom: str = Form("0.2"),
+    framing: str = Form(FaceFraming.LARGEST.value),
+    output: OutputOptions = Depends(_parse_output_options),
+):
+    """
+    Queue a batch of images for background processing.
+
+    The job ID is returned immediately. Progress can be polled from
+    ``/jobs/{job_id}`` or followed live from ``/jobs/{job_id}/events``; results
+    are downloaded one by one or as a ZIP once the job is done.
+
+    Args:
+        files (List[UploadFile]): The image files to process
+        aspect_ratio (str): Desired aspect ratio for the output images
+        zoom (str): Zoom level (0.0 means maximum padding, 1.0 means tight crop)
+        framing (str): Frame the "largest" face or the whole "group" of faces
+        output (OutputOptions): Output encoding applied to every image
+
+    Returns:
+        JobStatus: The queued job
+
+    Raises:
+        HTTPException: If a file or the parameters are invalid, or 503 if the job
+            queue is full
+    """
+    _check_batch_size(files)
+    params = _parse_processing_params(aspect_ratio, zoom, framing)
+    used_names: set[str] = set()
+    uploads = []
+    for index, file in enumerate(files):
+        if not file.content_type or not file.content_type.startswith("image/"):
+            raise HTTPException(status_code=400, detail=f"Invalid image format: {file.filename}")
+        _check_upload_size(file)
+        name = _unique_archive_name(file.filename, index, used_names, output)
+        uploads.append(JobUpload(file.filename, name, file.file))
+
+    try:
+        job_id = await job_manager.submit(uploads, params, output)
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+    return _job_status(job_id)
+
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """
+    Report the progress of a job and the status of each of its images.
+
+    Args:
+        job_id (str): ID returned when the job was submitted
+
+    Returns:
+        JobStatus: Job status with per-image results
+
+    Raises:
+        HTTPException: If the job does not exist
+    """
+    return _job_status(job_id)
+
+
+@router.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Stream the progress of a job as Server-Sent Events.
+
+    A ``progress`` event with the job counters is sent right away and after
+    every processed image; the final event is ``done``, after which the
+    stream ends.
+
+    Args:
+        job_id (str): ID returned when the job was submitted
+
+    Returns:
+        StreamingResponse: ``text/event-stream`` of job progress
+
+    Raises:
+        HTTPException: If the job does not exist
+    """
+    status = _job_status(job_id, include_items=False)
+
+    async def events():
+        nonlocal status
+        version = job_manager.version
+        while True:
+            event = "done" if status.status == "done" else "progress"
+            yield f"event: {event}\ndata: {status.model_dump_json(exclude_none=True)}\n\n"
+            if event == "done":
+                return
+
+            previous = status
+            while status == previous:
+                version = await job_manager.wait_for_change(version, _SSE_KEEPALIVE_SECONDS)
+                try:
+                    status = _job_status(job_id, include_items=False)
+                except HTTPException:
+                    return
+                if status == previous:
+                    yield ": keepalive\n\n"
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/jobs/{job_id}/results/{index}")
+async def get_job_result(job_id: str, index: int):
+    """
+    Download one processed image, or the reframed video, of a job.
+
+    Args:
+        job_id (str): ID returned when the job was submitted
+        index (int): Position of the image in the submitted batch
+
+    Returns:
+        FileResponse: The processed file
+
+    Raises:
+        HTTPException: If the job or image does not exist, or the image is not processed
+    """
+    status = _job_status(job_id)
+    if not 0 <= index < status.total:
+        raise HTTPException(status_code=404, detail="Unknown image index")
+
+    item = status.items[index]
+    if item.status != "ok":
+        detail = item.error or "Image has not been processed yet"
+        raise HTTPException(status_code=409, detail=detail)
+
+    if status.kind == "video":
+        media_type = "video/mp4"
+    else:
+        output = OutputOptions.model_validate_json(job_manager.store.get_job(job_id)["output"])
+        media_type = output.format.media_type
+    return FileResponse(
+        job_manager.result_path(job_id, item.output), media_type=media_type, filename=item.output
+    )
+
+
+@router.get("/jobs/{job_id}/archive")
+async def get_job_archive(job_id: str):
+    """
+    Download all processed images of a finished job as a ZIP.
+
+    The archive has the same layout as the ``/process-batch`` response,
+    including a ``manifest.json`` listing every image and its status.
+
+    Args:
+        job_id (str): ID returned when the job was submitted
+
+    Returns:
+        StreamingResponse: ZIP archive of the processed images
+
+    Raises:
+        HTTPException: If the job does not exist or is not done yet
+    """
+    status = _job_status(job_id)
+    if status.status != "done":
+        raise HTTPException(status_code=409, detail="Job is not done yet")
+
+    def stream():
+        archive = ZipStream()
+        manifest = []
+        for item in status.items:
+            entry = {"filename": item.filename, "status": item.status}
+            if item.status == "ok":
+                entry.update(output=item.output, detector_tier=item.detector_tier)
+                path = job_manager.result_path(job_id, item.output)
+                yield archive.add(item.output, path.read_bytes())
+            else:
+                entry["error"] = item.error
+            manifest.append(entry)
+        yield archive.add(
+            "manifest.json", json.dumps({"files": manifest}, indent=2).encode(), True
+        )
+        yield archive.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="job_{job_id}.zip"'},
+    )
+
+
+@router.get("/cache-stats")
+async def cache_stats():
+    """
+    Report hit, miss and eviction counters of the result caches.
+
+    Returns:
+        dict: Counters and sizes of the detection and output caches
+    """
+    return crop_service.stats()
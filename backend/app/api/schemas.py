@@ -0,0 +1,184 @@
+from typing import List, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+from ..core.encoding import OutputOptions
+from ..core.image_processor import Detection, ImageProcessingParams
+
+
+class FaceBox(BaseModel):
+    """A detected face in image pixel coordinates."""
+
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class DetectionResponse(BaseModel):
+    """Faces found in an uploaded image, and the token to crop it later."""
+
+    image_token: str | None = Field(
+        description="Token referencing the stored upload; null if the upload could not be "
+        "kept, in which case it must be sent again to be cropped"
+    )
+    stored: bool = Field(description="Whether the upload was kept for later crops")
+    width: int = Field(description="Width of the uploaded image in pixels")
+    height: int = Field(description="Height of the uploaded image in pixels")
+    faces: List[FaceBox]
+    detector_tier: str | None = Field(
+        default=None, description="Detector tier that found the faces, if any"
+    )
+
+    @classmethod
+    def from_detection(cls, token: str | None, detection: Detection) -> "DetectionResponse":
+        return cls(
+            image_token=token,
+            stored=token is not None,
+            width=detection.width,
+            height=detection.height,
+            faces=_face_boxes(detection.faces),
+            detector_tier=detection.tier,
+        )
+
+
+class CropBox(BaseModel):
+    """A crop rectangle in image pixel coordinates."""
+
+    x: int
+    y: int
+    width: int
+    height: int
+
+
+class GeometryResponse(BaseModel):
+    """Where the faces are and where to crop, in the original image's coordinates."""
+
+    width: int = Field(description="Width of the original image in pixels")
+    height: int = Field(description="Height of the original image in pixels")
+    faces: List[FaceBox]
+    crop: CropBox = Field(description="Crop to cut from the original; all of it without faces")
+    detector_tier: str | None = Field(
+        default=None, description="Detector tier that found the faces, if any"
+    )
+
+    @classmethod
+    def from_geometry(
+        cls,
+        original_size: Tuple[int, int],
+        detection: Detection,
+        faces: np.ndarray,
+        box: Tuple[int, int, int, int],
+    ) -> "GeometryResponse":
+        start_x, start_y, end_x, end_y = box
+        return cls(
+            width=original_size[0],
+            height=original_size[1],
+            faces=_face_boxes(faces),
+            crop=CropBox(x=start_x, y=start_y, width=end_x - start_x, height=end_y - start_y),
+            detector_tier=detection.tier,
+        )
+
+
+def _face_boxes(faces: np.ndarray) -> List[FaceBox]:
+    return [FaceBox(x=x, y=y, width=w, height=h) for x, y, w, h in faces.tolist()]
+
+
+class PathRequest(BaseModel):
+    """Crop an image on the server's filesystem into another file there."""
+
+    source: str = Field(description="Absolute path of the image, inside a configured read root")
+    target: str = Field(description="Path to write the crop to, inside a configured write root")
+    params: ImageProcessingParams = ImageProcessingParams()
+    output: OutputOptions = OutputOptions()
+
+
+class PathResponse(BaseModel):
+    """Where a crop was written and what was found in the source image."""
+
+    source: str
+    target: str
+    bytes_written: int
+    width: int = Field(description="Width of the source image in pixels")
+    height: int = Field(description="Height of the source image in pixels")
+    faces: List[FaceBox]
+    detector_tier: str | None = None
+
+    @classmethod
+    def from_detection(
+        cls, source: str, target: str, bytes_written: int, detection: Detection
+    ) -> "PathResponse":
+        return cls(
+            source=source,
+            target=target,
+            bytes_written=bytes_written,
+            width=detection.width,
+            height=detection.height,
+            faces=_face_boxes(detection.faces),
+            detector_tier=detection.tier,
+        )
+
+
+class VideoSummary(BaseModel):
+    """Frame counts, output size and processing throughput of a reframed video."""
+
+    frames: int
+    keyframes: int = Field(description="Frames face detection ran on")
+    scene_cuts: int
+    width: int = Field(description="Width of the output video in pixels")
+    height: int = Field(description="Height of the output video in pixels")
+    fps: float = Field(description="Frame rate of the video")
+    seconds: float = Field(description="Processing time")
+    frames_per_second: float = Field(description="Processing throughput")
+
+
+class JobItem(BaseModel):
+    """One image or video of a job."""
+
+    index: int
+    filename: str | None
+    status: str = Field(description="pending, ok or error")
+    output: str | None = Field(default=None, description="Name of the processed file")
+    error: str | None = None
+    detector_tier: str | None = None
+    video: VideoSummary | None = Field(default=None, description="For reframed videos")
+
+
+class JobStatus(BaseModel):
+    """Progress of a job."""
+
+    job_id: str
+    kind: str = Field(description="images or video")
+    status: str = Field(description="queued, running or done")
+    total: int
+    completed: int = Field(description="Images processed successfully")
+    failed: int = Field(description="Images that could not be processed")
+    items: List[JobItem] | None = None
+
+    @classmethod
+    def from_rows(cls, job: dict, items: List[dict], include_items: bool = True) -> "JobStatus":
+        return cls(
+            job_id=job["id"],
+            kind=job["kind"],
+            status=job["status"],
+            total=len(items),
+            completed=sum(item["status"] == "ok" for item in items),
+            failed=sum(item["status"] == "error" for item in items),
+            items=[
+                JobItem(
+                    index=item["idx"],
+                    filename=item["filename"],
+                    status=item["status"],
+                    output=item["output_name"] if item["status"] == "ok" else None,
+                    error=item["error"],
+                    detector_tier=item["detector_tier"],
+                    video=VideoSummary.model_validate_json(item["stats"])
+                    if item["stats"]
+                    else None,
+                )
+                for item in items
+            ]
+            if include_items
+            else None,
+        )
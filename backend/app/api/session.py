@@ -0,0 +1,183 @@
+"""Crop a stream of images over one WebSocket connection."""
+
+import asyncio
+import json
+from typing import Any, Set
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+
+from ..core import metrics
+from ..core.admission import OverloadedError
+from ..core.config import settings
+from ..core.encoding import OutputOptions
+from ..core.image_processor import ImageProcessingError, ImageProcessingParams
+from .routes import (
+    _build_output_options,
+    _http_error,
+    _parse_processing_params,
+    admission,
+    crop_service,
+)
+
+# A separate router: the HTTP router's dependencies need a Request
+router = APIRouter()
+
+
+class CropSession:
+    """
+    One client's interactive cropping session.
+
+    Protocol, all text frames being JSON objects with a ``type``:
+
+    - On connect the server sends ``session`` with the current ``params``,
+      ``output`` and ``max_in_flight``.
+    - The client sends ``params`` to change any of ``aspect_ratio``,
+      ``zoom``, ``framing`` and ``output`` (the output options of
+      ``/process-image``); the server answers with the settings now in effect.
+      They apply to every image sent after the message.
+    - Every binary frame is one image; images are numbered from 0 in the
+      order they are sent. For each, the server sends either a ``result``
+      (``id``, ``media_type``, ``size``, ``detector_tier``) immediately
+      followed by the crop as a binary frame, or an ``error`` (``id``,
+      ``status``, ``detail``). Results are sent as they complete, which
+      need not be in order.
+
+    At most ``max_in_flight`` images are processed at once. While that many
+    are in flight the session stops reading frames, so a client sending
+    faster than the server crops is held back by the connection itself.
+    """
+
+    def __init__(self, websocket: WebSocket, max_in_flight: int):
+        self.websocket = websocket
+        self.max_in_flight = max_in_flight
+        self.params = ImageProcessingParams()
+        self.output = OutputOptions()
+        self._window = asyncio.Semaphore(max_in_flight)
+        self._send_lock = asyncio.Lock()
+        self._tasks: Set[asyncio.Task] = set()
+        self._next_id = 0
+
+    async def run(self) -> None:
+        """Serve the session until the client disconnects."""
+        await self.websocket.accept()
+        await self._send(
+            {"type": "session", "max_in_flight": self.max_in_flight, **self._settings()}
+        )
+        try:
+            while True:
+                # Flow control: wait for a free slot before reading the next frame
+                await self._window.acquire()
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    self._start(message["bytes"])
+                else:
+                    self._window.release()
+                    await self._handle_text(message.get("text") or "")
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _start(self, data: bytes) -> None:
+        image_id, self._next_id = self._next_id, self._next_id + 1
+        task = asyncio.create_task(self._process(image_id, data, self.params, self.output))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle_text(self, text: str) -> None:
+        try:
+            message = json.loads(text)
+        except json.JSONDecodeError:
+            await self._send_error(None, 400, "Messages must be JSON")
+            return
+        if not isinstance(message, dict) or message.get("type") != "params":
+            await self._send_error(None, 400, "Unknown message type")
+            return
+
+        try:
+            params = _parse_processing_params(
+                message.get("aspect_ratio", self.params.aspect_ratio.value),
+                message.get("zoom", self.params.zoom),
+                message.get("framing", self.params.framing.value),
+            )
+            output = self.output
+            if "output" in message:
+                fields = {**self.output.model_dump(), **message["output"]}
+                output = _build_output_options(**fields)
+        except (HTTPException, TypeError) as e:
+            await self._send_error(None, 422, getattr(e, "detail", str(e)))
+            return
+        self.params, self.output = params, output
+        await self._send({"type": "params", **self._settings()})
+
+    async def _process(
+        self,
+        image_id: int,
+        data: bytes,
+        params: ImageProcessingParams,
+        output: OutputOptions,
+    ) -> None:
+        try:
+            if not data:
+                raise HTTPException(status_code=400, detail="Empty file provided")
+            if len(data) > settings.max_upload_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File too large. The limit is {settings.max_upload_bytes} bytes",
+                )
+            metrics.UPLOAD_BYTES.observe(len(data))
+            async with admission.admit():
+                result = await crop_service.crop(data, params, output)
+        except OverloadedError as e:
+            await self._send_error(image_id, 503, str(e), retry_after=e.retry_after)
+        except HTTPException as e:
+            await self._send_error(image_id, e.status_code, e.detail)
+        except ImageProcessingError as e:
+            error = _http_error(e)
+            await self._send_error(image_id, error.status_code, error.detail)
+        except Exception as e:
+            await self._send_error(image_id, 500, f"An unexpected error occurred: {str(e)}")
+        else:
+            header = {
+                "type": "result",
+                "id": image_id,
+                "media_type": output.format.media_type,
+                "size": len(result.content),
+                "detector_tier": result.detection.tier,
+            }
+            await self._send(header, result.content)
+        finally:
+            self._window.release()
+
+    def _settings(self) -> dict:
+        return {
+            "params": self.params.model_dump(mode="json"),
+            "output": self.output.model_dump(mode="json"),
+        }
+
+    async def _send_error(self, image_id: int | None, status: int, detail: str, **extra) -> None:
+        await self._send(
+            {"type": "error", "id": image_id, "status": status, "detail": detail, **extra}
+        )
+
+    async def _send(self, message: dict[str, Any], content: bytes | None = None) -> None:
+        """Send a JSON message, and the binary frame belonging to it right after."""
+        async with self._send_lock:
+            try:
+                await self.websocket.send_text(json.dumps(message))
+                if content is not None:
+                    await self.websocket.send_bytes(content)
+            except (WebSocketDisconnect, RuntimeError):
+                pass  # The client has gone; the receive loop ends the session
+
+
+@router.websocket("/session")
+async def crop_session(websocket: WebSocket):
+    """
+    Crop images streamed over a WebSocket, with settings changeable mid-session.
+
+    See ``CropSession`` for the message protocol.
+    """
+    await CropSession(websocket, settings.session_max_in_flight).run()
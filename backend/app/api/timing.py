@@ -0,0 +1,73 @@
+from fastapi import Request
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from ..core import memory, metrics
+from ..core.config import settings
+
+
+class MetricsMiddleware:
+    """
+    Count requests and report each request's stage breakdown.
+
+    Every HTTP request gets a ``RequestTimer`` that the pipeline stages add
+    to; when the response starts, the collected durations are sent in its
+    ``Server-Timing`` header and the request is counted by endpoint and status.
+
+    With ``memory_tracing`` enabled, a request sent with an ``X-Memory-Trace``
+    header has its pipeline tasks traced and their peak memory reported in an
+    ``X-Memory-Usage`` header.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = metrics.RequestTimer()
+        token = metrics.current_request.set(timer)
+        trace_token = memory.current_trace.set(settings.memory_tracing and _wants_trace(scope))
+        status = 500
+
+        async def timed_send(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                metrics.REQUEST_SECONDS.observe(timer.elapsed(), endpoint=_endpoint(scope))
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timer.header())
+                if timer.memory is not None:
+                    headers.append("X-Memory-Usage", timer.memory.header())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timed_send)
+        finally:
+            memory.current_trace.reset(trace_token)
+            metrics.current_request.reset(token)
+            metrics.REQUESTS.inc(method=scope["method"], endpoint=_endpoint(scope), status=str(status))
+
+
+def _wants_trace(scope: Scope) -> bool:
+    return any(name == b"x-memory-trace" for name, _ in scope["headers"])
+
+
+def _endpoint(scope: Scope) -> str:
+    """Name of the matched endpoint, so that metric labels stay bounded."""
+    route = scope.get("route")
+    return getattr(route, "name", None) or "unmatched"
+
+
+async def record_upload_time(request: Request) -> None:
+    """
+    Router dependency recording how long receiving and parsing the request body took.
+
+    FastAPI resolves dependencies after the form has been parsed, so the time
+    since the request started is the upload stage.
+    """
+    timer = metrics.current_request.get()
+    if timer is not None and request.method != "GET":
+        metrics.record_stage("upload", timer.elapsed())
@@ -0,0 +1,373 @@
+"""
+Crop every image below a directory, without going through the HTTP API.
+
+Usage:
+    face-cropper SOURCE OUTPUT [--aspect-ratio 9:16] [--zoom 0.2] [--framing group]
+        [--format webp] [--quality 80] [--workers 8] [--manifest PATH]
+
+Images are processed in a process pool and written to the same relative path
+below OUTPUT, with the extension of the output format. Files that would be
+written to the same crop, such as ``a/photo.jpg`` and ``a/photo.png``, are
+not processed and are reported as failed instead. Every result is
+appended to a JSON-lines manifest (``OUTPUT/.face-cropper-manifest.jsonl`` by
+default) recording the source's content hash, the parameters and the status,
+so an interrupted run picks up where it stopped and files that are unchanged
+since a successful run are skipped.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Iterator, List, NamedTuple
+
+from .core.config import settings
+from .core.encoding import OutputFormat, OutputOptions
+from .core.engine import ProcessingEngine
+from .core.image_processor import AspectRatio, FaceFraming, ImageProcessingParams
+from .core.pipeline import crop_task
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff", ".gif"}
+MANIFEST_NAME = ".face-cropper-manifest.jsonl"
+
+# How often the progress line is refreshed, in seconds
+_PROGRESS_INTERVAL = 1.0
+
+
+class SourceFile(NamedTuple):
+    """An image found below the source directory."""
+
+    path: Path
+    relative: str
+    size: int
+    mtime_ns: int
+
+
+class Manifest:
+    """
+    Append-only record of processed files, keyed by their path relative to the source.
+
+    Each line is one JSON entry; when a file appears several times the last
+    entry wins. ``compact`` rewrites the file with one entry per path.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries: dict[str, dict] = {}
+        if path.exists():
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # A line cut short by an interrupted run
+                    self.entries[entry["path"]] = entry
+        self._file = None
+
+    def record(self, entry: dict) -> None:
+        """Append an entry and flush it, so it survives an interruption."""
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+        self.entries[entry["path"]] = entry
+
+    def compact(self) -> None:
+        """Rewrite the manifest with only the latest entry per file."""
+        self.close()
+        temporary = self.path.with_suffix(".tmp")
+        with open(temporary, "w", encoding="utf-8") as f:
+            for entry in self.entries.values():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(temporary, self.path)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class Progress:
+    """Counts results and periodically prints a progress and throughput line."""
+
+    def __init__(self, total: int, stream=None):
+        self.total = total
+        self.stream = stream
+        self.processed = self.skipped = self.failed = 0
+        self.start = time.perf_counter()
+        self._last_report = 0.0
+
+    @property
+    def done(self) -> int:
+        return self.processed + self.skipped + self.failed
+
+    def update(self, status: str) -> None:
+        if status == "ok":
+            self.processed += 1
+        elif status == "skipped":
+            self.skipped += 1
+        else:
+            self.failed += 1
+
+        now = time.perf_counter()
+        if now - self._last_report >= _PROGRESS_INTERVAL:
+            self._last_report = now
+            self.report()
+
+    def report(self) -> None:
+        elapsed = time.perf_counter() - self.start
+        rate = self.processed / elapsed if elapsed else 0.0
+        print(
+            f"[{self.done}/{self.total}] {self.processed} processed, {self.skipped} skipped, "
+            f"{self.failed} failed, {rate:.1f} images/s",
+            file=self.stream or sys.stderr,
+            flush=True,
+        )
+
+
+def find_images(source: Path, exclude: Path | None = None) -> Iterator[SourceFile]:
+    """
+    Walk the source tree in a stable order, yielding image files by extension.
+
+    ``exclude`` prunes a directory from the walk, such as an output directory
+    placed inside the source.
+    """
+    excluded = exclude.resolve() if exclude else None
+    for directory, subdirectories, filenames in os.walk(source):
+        subdirectories[:] = sorted(
+            name for name in subdirectories if (Path(directory) / name).resolve() != excluded
+        )
+        for filename in sorted(filenames):
+            if Path(filename).suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            path = Path(directory) / filename
+            stat = path.stat()
+            yield SourceFile(
+                path, path.relative_to(source).as_posix(), stat.st_size, stat.st_mtime_ns
+            )
+
+
+def output_path(output: Path, relative: str, options: OutputOptions) -> Path:
+    """Location of a file's crop below the output directory."""
+    return (output / relative).with_suffix(f".{options.format.extension}")
+
+
+def find_collisions(
+    files: List[SourceFile], output: Path, options: OutputOptions
+) -> dict[str, str]:
+    """
+    Files that share their crop with another file.
+
+    Returns:
+        dict[str, str]: Relative path of each such file -> the error to report for it
+    """
+    by_target: dict[Path, List[str]] = defaultdict(list)
+    for file in files:
+        by_target[output_path(output, file.relative, options)].append(file.relative)
+
+    collisions = {}
+    for target, sources in by_target.items():
+        if len(sources) > 1:
+            for source in sources:
+                others = ", ".join(other for other in sources if other != source)
+                collisions[source] = (
+                    f"Output {target.relative_to(output).as_posix()} is also the output of "
+                    f"{others}; rename one of them"
+                )
+    return collisions
+
+
+async def process_tree(
+    source: Path,
+    output: Path,
+    params: ImageProcessingParams,
+    options: OutputOptions,
+    engine: ProcessingEngine,
+    manifest: Manifest,
+    force: bool = False,
+) -> Progress:
+    """
+    Crop every image below ``source`` that has not been processed with these settings.
+
+    A file is skipped when the manifest has a successful entry for it with the
+    same parameters and its crop still exists, and either its size and
+    modification time or its content hash are unchanged. Files that cannot be
+    read, cropped or written, and files whose crop would collide with another
+    file's, are recorded as failed without stopping the run.
+
+    Returns:
+        Progress: The final counts
+    """
+    settings_key = {
+        "params": params.model_dump(mode="json"),
+        "output": options.model_dump(mode="json"),
+    }
+    files = list(find_images(source, exclude=output))
+    progress = Progress(len(files))
+    collisions = find_collisions(files, output, options)
+    for file in files:
+        if file.relative in collisions:
+            manifest.record(
+                {
+                    **_entry(file, settings_key),
+                    "status": "error",
+                    "error": collisions[file.relative],
+                }
+            )
+            progress.update("error")
+    remaining = (file for file in files if file.relative not in collisions)
+
+    # Twice as many feeders as workers, so that reading and hashing overlap the crops
+    async def feed() -> None:
+        for file in remaining:
+            status = await _process_file(
+                file, output, params, options, settings_key, engine, manifest, force
+            )
+            progress.update(status)
+
+    await asyncio.gather(*(feed() for _ in range(engine.workers * 2)))
+    return progress
+
+
+async def _process_file(
+    file: SourceFile,
+    output: Path,
+    params: ImageProcessingParams,
+    options: OutputOptions,
+    settings_key: dict,
+    engine: ProcessingEngine,
+    manifest: Manifest,
+    force: bool,
+) -> str:
+    """Crop one file unless it is up to date; returns its status."""
+    target = output_path(output, file.relative, options)
+    previous = manifest.entries.get(file.relative)
+    reusable = (
+        not force
+        and previous is not None
+        and previous["status"] == "ok"
+        and previous["settings"] == settings_key
+        and target.exists()
+    )
+    if reusable and (previous["size"], previous["mtime_ns"]) == (file.size, file.mtime_ns):
+        return "skipped"
+
+    entry = _entry(file, settings_key)
+    try:
+        data = file.path.read_bytes()
+        entry["hash"] = hashlib.sha256(data).hexdigest()
+        if reusable and previous["hash"] == entry["hash"]:
+            # Touched but unchanged; remember the new timestamp
+            manifest.record({**entry, "status": "ok", "output": previous["output"]})
+            return "skipped"
+
+        _, content = await engine.run(crop_task, data, params, options)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        temporary = target.with_name(f".{target.name}.tmp")
+        temporary.write_bytes(content)
+        os.replace(temporary, target)
+    except Exception as e:
+        # Includes unreadable files, full disks and crashed workers, whose pool
+        # the engine replaces; the file is retried by the next run
+        manifest.record({**entry, "status": "error", "error": str(e) or type(e).__name__})
+        return "error"
+
+    manifest.record(
+        {**entry, "status": "ok", "output": target.relative_to(output).as_posix()}
+    )
+    return "ok"
+
+
+def _entry(file: SourceFile, settings_key: dict) -> dict:
+    return {
+        "path": file.relative,
+        "size": file.size,
+        "mtime_ns": file.mtime_ns,
+        "settings": settings_key,
+    }
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="face-cropper",
+        description="Crop the faces in every image below a directory.",
+    )
+    parser.add_argument("source", type=Path, help="Directory to read images from")
+    parser.add_argument("output", type=Path, help="Directory to write the crops to")
+    parser.add_argument(
+        "--aspect-ratio",
+        choices=[ratio.value for ratio in AspectRatio],
+        default=AspectRatio.ORIGINAL.value,
+    )
+    parser.add_argument("--zoom", type=float, default=0.2)
+    parser.add_argument(
+        "--framing",
+        choices=[framing.value for framing in FaceFraming],
+        default=FaceFraming.LARGEST.value,
+    )
+    parser.add_argument(
+        "--format",
+        choices=[output_format.value for output_format in OutputFormat],
+        default=OutputFormat.JPEG.value,
+    )
+    parser.add_argument("--quality", type=int, default=OutputOptions().quality)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=settings.engine_workers,
+        help="Worker processes (default: one per CPU)",
+    )
+    parser.add_argument(
+        "--manifest",
+        type=Path,
+        help=f"Manifest file (default: OUTPUT/{MANIFEST_NAME})",
+    )
+    parser.add_argument(
+        "--force", action="store_true", help="Reprocess files even if they are up to date"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Console entry point; returns 1 if any file failed."""
+    args = _parse_args(argv)
+    if not args.source.is_dir():
+        print(f"Not a directory: {args.source}", file=sys.stderr)
+        return 2
+
+    try:
+        params = ImageProcessingParams(
+            aspect_ratio=AspectRatio(args.aspect_ratio),
+            zoom=args.zoom,
+            framing=FaceFraming(args.framing),
+        )
+        options = OutputOptions(format=args.format, quality=args.quality)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+
+    manifest = Manifest(args.manifest or args.output / MANIFEST_NAME)
+    engine = ProcessingEngine(mode="process", workers=max(1, args.workers))
+    try:
+        progress = asyncio.run(
+            process_tree(args.source, args.output, params, options, engine, manifest, args.force)
+        )
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume", file=sys.stderr)
+        return 130
+    finally:
+        engine.shutdown()
+        manifest.compact()
+
+    progress.report()
+    return 1 if progress.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
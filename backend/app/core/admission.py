@@ -0,0 +1,151 @@
+"""Admission control: bound the requests being processed and shed the excess."""
+
+import asyncio
+import math
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Deque
+
+from . import metrics
+from .config import settings
+from .image_processor import ImageProcessingError
+
+# Wall-clock (time.time) deadline of the request being handled, if it has one.
+# It is read by the engine so that workers can drop work that is already late.
+current_deadline: ContextVar[float | None] = ContextVar("current_deadline", default=None)
+
+# Weight of the newest sample in the moving average of slot hold times
+_HOLD_TIME_WEIGHT = 0.2
+
+
+class OverloadedError(Exception):
+    """The server is at capacity; the client should retry after ``retry_after`` seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class DeadlineExceededError(ImageProcessingError):
+    """The request's deadline passed before its work started."""
+
+    pass
+
+
+def check_deadline(deadline: float | None) -> None:
+    """
+    Raise if a wall-clock deadline has passed.
+
+    Raises:
+        DeadlineExceededError: If ``deadline`` is in the past
+    """
+    if deadline is not None and time.time() >= deadline:
+        raise DeadlineExceededError("Deadline exceeded before processing started")
+
+
+class AdmissionController:
+    """
+    Limit how many requests are processed at once.
+
+    Up to ``max_in_flight`` requests hold a slot; later ones wait in FIFO
+    order, at most ``max_queued`` of them and for at most
+    ``queue_timeout`` seconds or until their deadline. A request that finds
+    the queue full or times out waiting is shed with ``OverloadedError``;
+    one whose deadline passes first raises ``DeadlineExceededError``.
+
+    Slots are handed directly from a finishing request to the next waiter,
+    so a newcomer cannot overtake the queue.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = settings.admission_max_in_flight,
+        max_queued: int = settings.admission_max_queued,
+        queue_timeout: float = settings.admission_queue_timeout_seconds,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._hold_time = 1.0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @asynccontextmanager
+    async def admit(self, deadline: float | None = None) -> AsyncIterator[None]:
+        """
+        Hold a processing slot for the duration of the block.
+
+        Args:
+            deadline (float | None): Wall-clock time after which the request is useless
+
+        Raises:
+            OverloadedError: If no slot became free in time
+            DeadlineExceededError: If the deadline passed before a slot was free
+        """
+        try:
+            check_deadline(deadline)
+            await self._acquire(deadline)
+        except DeadlineExceededError:
+            metrics.ADMISSIONS.inc(outcome="expired")
+            raise
+        except OverloadedError:
+            metrics.ADMISSIONS.inc(outcome="shed")
+            raise
+        metrics.ADMISSIONS.inc(outcome="admitted")
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            held = time.perf_counter() - start
+            self._hold_time += (held - self._hold_time) * _HOLD_TIME_WEIGHT
+            self._release()
+
+    def retry_after(self) -> int:
+        """Seconds until the queue ahead of a new request has likely drained."""
+        batches = (self.queued + 1) / self.max_in_flight
+        return max(1, math.ceil(self._hold_time * batches))
+
+    async def _acquire(self, deadline: float | None) -> None:
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queued:
+            raise OverloadedError("Server is overloaded, try again later", self.retry_after())
+
+        timeout = self.queue_timeout
+        if deadline is not None:
+            timeout = min(timeout, deadline - time.time())
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # A released slot is handed over by resolving the waiter
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()  # Handed a slot just as the wait timed out
+            check_deadline(deadline)
+            raise OverloadedError(
+                "Timed out waiting for a processing slot, try again later", self.retry_after()
+            )
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
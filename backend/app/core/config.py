@@ -0,0 +1,205 @@
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Literal
+
+from pydantic import Field, model_validator
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+# Allowance for multipart part headers and form fields on top of the files
+REQUEST_OVERHEAD_BYTES = 1024 * 1024
+
+
+class Settings(BaseSettings):
+    """Runtime configuration, overridable through FACE_CROPPER_* environment variables."""
+
+    model_config = SettingsConfigDict(env_prefix="FACE_CROPPER_")
+
+    max_upload_bytes: int = Field(
+        default=50 * 1024 * 1024,
+        ge=1,
+        description="Largest single image file accepted",
+    )
+    max_batch_files: int = Field(
+        default=20,
+        ge=1,
+        description="Most files accepted by one batch or job request",
+    )
+    max_request_bytes: int | None = Field(
+        default=None,
+        ge=1,
+        description="Largest batch or job request body accepted, enforced while the body "
+        "streams in; defaults to max_batch_files full-size uploads plus overhead",
+    )
+    max_megapixels: float = Field(
+        default=100.0,
+        gt=0,
+        description="Largest image accepted, checked from the image header before decoding",
+    )
+    batch_concurrency: int = Field(
+        default=4,
+        ge=1,
+        description="Maximum number of images processed at once by a batch request",
+    )
+    session_max_in_flight: int = Field(
+        default=4,
+        ge=1,
+        description="Images of one WebSocket session processed at once; no further frames "
+        "are read from the client until one finishes",
+    )
+    max_renditions: int = Field(
+        default=24,
+        ge=1,
+        description="Maximum number of renditions one request may ask for",
+    )
+    detection_max_edge: int = Field(
+        default=1024,
+        ge=0,
+        description="Long edge (px) the image is downscaled to for face detection, 0 disables",
+    )
+    min_face_fraction: float = Field(
+        default=0.02,
+        ge=0.0,
+        le=1.0,
+        description="Smallest detectable face as a fraction of the image's short edge",
+    )
+    detector_tiers: List[str] = Field(
+        default=["default", "alt2", "profile"],
+        min_length=1,
+        description="Face detectors tried in order until one finds a face (see app.core.detectors)",
+    )
+    face_overlap_threshold: float = Field(
+        default=0.3,
+        ge=0.0,
+        le=1.0,
+        description="Overlap (IoU) above which two detected faces count as the same face",
+    )
+    min_relative_face_size: float = Field(
+        default=0.25,
+        ge=0.0,
+        le=1.0,
+        description="Smallest face kept in multi-face modes, relative to the largest face's side",
+    )
+    video_keyframe_interval: int = Field(
+        default=12,
+        ge=1,
+        description="Run face detection on every n-th video frame; frames in between are interpolated",
+    )
+    video_scene_threshold: float = Field(
+        default=0.2,
+        gt=0.0,
+        le=1.0,
+        description="Mean absolute frame difference (0-1) treated as a scene cut, forcing a keyframe",
+    )
+    video_smoothing: float = Field(
+        default=0.3,
+        gt=0.0,
+        le=1.0,
+        description="Weight of the new position when smoothing the crop window (1.0 disables smoothing)",
+    )
+    engine_mode: Literal["thread", "process"] = Field(
+        default="thread",
+        description="Whether the processing pipeline runs in a thread or a process pool",
+    )
+    engine_workers: int = Field(
+        default_factory=lambda: os.cpu_count() or 1,
+        ge=1,
+        description="Number of pipeline workers, each with its own face detection model",
+    )
+    cv2_threads: int = Field(
+        default=1,
+        ge=0,
+        description="OpenCV threads per worker (cv2.setNumThreads), 0 disables OpenCV threading",
+    )
+    preload_model: bool = Field(
+        default=False,
+        description="Load the face detection model at import, so that servers which fork "
+        "after importing the app (gunicorn --preload) share it between workers",
+    )
+    warm_up: bool = Field(
+        default=True,
+        description="Run a synthetic crop on every worker at startup before reporting ready",
+    )
+    admission_max_in_flight: int = Field(
+        default_factory=lambda: 2 * (os.cpu_count() or 1),
+        ge=1,
+        description="Requests processed at once; further requests wait for a slot",
+    )
+    admission_max_queued: int = Field(
+        default=64,
+        ge=0,
+        description="Requests waiting for a slot before new ones are shed with 503",
+    )
+    admission_queue_timeout_seconds: float = Field(
+        default=10.0,
+        gt=0,
+        description="Longest a request waits for a slot before it is shed with 503",
+    )
+    memory_tracing: bool = Field(
+        default=False,
+        description="Let requests with an X-Memory-Trace header have their peak memory "
+        "measured; traced requests run severalfold slower and one at a time per process",
+    )
+    detection_cache_bytes: int = Field(
+        default=8 * 1024 * 1024,
+        ge=0,
+        description="Memory budget of the content hash -> detected faces cache, 0 disables it",
+    )
+    output_cache_bytes: int = Field(
+        default=256 * 1024 * 1024,
+        ge=0,
+        description="Memory budget of the content hash + params -> encoded output cache, 0 disables it",
+    )
+    image_store_bytes: int = Field(
+        default=512 * 1024 * 1024,
+        ge=0,
+        description="Memory budget for uploads kept server-side by the detect endpoint",
+    )
+    image_store_ttl_seconds: float = Field(
+        default=15 * 60,
+        gt=0,
+        description="Seconds an uploaded image stays available after its last use",
+    )
+    cache_max_age_seconds: int = Field(
+        default=24 * 60 * 60,
+        ge=0,
+        description="max-age of the Cache-Control header sent with crops",
+    )
+    local_read_roots: List[Path] = Field(
+        default=[],
+        description="Directories /process-path may read images from; empty disables the endpoint",
+    )
+    local_write_roots: List[Path] = Field(
+        default=[],
+        description="Directories /process-path may write crops to",
+    )
+    jobs_dir: Path = Field(
+        default=Path(tempfile.gettempdir()) / "face-cropper-jobs",
+        description="Directory holding the job database, job uploads and job results",
+    )
+    job_queue_size: int = Field(
+        default=16,
+        ge=1,
+        description="Jobs that may wait for a worker before new submissions are refused",
+    )
+    job_workers: int = Field(
+        default=1,
+        ge=1,
+        description="Jobs processed at the same time; images within a job use batch_concurrency",
+    )
+    job_ttl_seconds: float = Field(
+        default=24 * 60 * 60,
+        gt=0,
+        description="Seconds a finished job and its results are kept",
+    )
+
+    @model_validator(mode="after")
+    def _derive_request_limit(self) -> "Settings":
+        if self.max_request_bytes is None:
+            self.max_request_bytes = (
+                self.max_upload_bytes * self.max_batch_files + REQUEST_OVERHEAD_BYTES
+            )
+        return self
+
+
+settings = Settings()
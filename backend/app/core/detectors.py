@@ -0,0 +1,117 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, NamedTuple, Sequence, Tuple
+
+import cv2
+import numpy as np
+
+Size = Tuple[int, int]
+
+
+class FaceDetector(ABC):
+    """Finds faces in a grayscale image, returning (x, y, w, h) boxes in its coordinates."""
+
+    name: str
+
+    @abstractmethod
+    def detect(self, gray_image: np.ndarray, min_size: Size, max_size: Size) -> np.ndarray:
+        """Detect faces no smaller than ``min_size`` and no larger than ``max_size``."""
+
+
+class HaarCascadeDetector(FaceDetector):
+    """
+    A Haar cascade from ``cv2.data.haarcascades`` with its own parameter set.
+
+    With ``mirror`` the cascade also runs on the horizontally flipped image,
+    which lets one-sided models such as the profile cascade find faces turned
+    either way.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        filename: str,
+        scale_factor: float,
+        min_neighbors: int,
+        mirror: bool = False,
+    ):
+        self.name = name
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.mirror = mirror
+        self.cascade = cv2.CascadeClassifier(cv2.data.haarcascades + filename)
+        if self.cascade.empty():
+            raise ValueError(f"Failed to load face detection model {filename}")
+
+    def detect(self, gray_image: np.ndarray, min_size: Size, max_size: Size) -> np.ndarray:
+        faces = self._detect(gray_image, min_size, max_size)
+        if self.mirror:
+            mirrored = self._detect(cv2.flip(gray_image, 1), min_size, max_size)
+            mirrored[:, 0] = gray_image.shape[1] - mirrored[:, 0] - mirrored[:, 2]
+            faces = np.concatenate([faces, mirrored])
+        return faces
+
+    def _detect(self, gray_image: np.ndarray, min_size: Size, max_size: Size) -> np.ndarray:
+        faces = self.cascade.detectMultiScale(
+            gray_image,
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=min_size,
+            maxSize=max_size,
+        )
+        return np.asarray(faces, dtype=np.int32).reshape(-1, 4)
+
+
+# Cascades shipped with OpenCV, roughly ordered from cheapest to most thorough
+DETECTORS: Dict[str, Callable[[], FaceDetector]] = {
+    "default": lambda: HaarCascadeDetector(
+        "default", "haarcascade_frontalface_default.xml", 1.3, 5
+    ),
+    "alt2": lambda: HaarCascadeDetector(
+        "alt2", "haarcascade_frontalface_alt2.xml", 1.2, 4
+    ),
+    "alt": lambda: HaarCascadeDetector("alt", "haarcascade_frontalface_alt.xml", 1.2, 4),
+    "alt_tree": lambda: HaarCascadeDetector(
+        "alt_tree", "haarcascade_frontalface_alt_tree.xml", 1.1, 2
+    ),
+    "profile": lambda: HaarCascadeDetector(
+        "profile", "haarcascade_profileface.xml", 1.2, 4, mirror=True
+    ),
+}
+
+
+def create_detector(name: str) -> FaceDetector:
+    """Instantiate a registered detector by name."""
+    try:
+        factory = DETECTORS[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown face detector {name!r}. Must be one of: {list(DETECTORS)}"
+        )
+    return factory()
+
+
+class TieredResult(NamedTuple):
+    faces: np.ndarray
+    tier: str | None
+
+
+class TieredDetector:
+    """
+    Runs detectors in order and stops at the first one that finds a face.
+
+    Put cheap, coarse detectors first: images with an obvious frontal face
+    then never pay for the slower tiers, which only run when nothing was found.
+    """
+
+    def __init__(self, tiers: Sequence[str]):
+        if not tiers:
+            raise ValueError("At least one detector tier is required")
+        self.tiers: List[FaceDetector] = [create_detector(name) for name in tiers]
+
+    def detect(self, gray_image: np.ndarray, min_size: Size, max_size: Size) -> TieredResult:
+        """Return the faces and the name of the tier that found them (None if none did)."""
+        for detector in self.tiers:
+            faces = detector.detect(gray_image, min_size, max_size)
+            if len(faces):
+                return TieredResult(faces, detector.name)
+        return TieredResult(np.empty((0, 4), dtype=np.int32), None)
@@ -0,0 +1,130 @@
+from enum import Enum
+from io import BytesIO
+from typing import Iterator
+
+from PIL import Image
+from pydantic import BaseModel, Field
+
+from . import memory
+
+# Size of the pieces an encoded image is streamed to the client in
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class OutputFormat(str, Enum):
+    """Supported output image formats."""
+
+    JPEG = "jpeg"
+    WEBP = "webp"
+    PNG = "png"
+
+    @property
+    def media_type(self) -> str:
+        return f"image/{self.value}"
+
+    @property
+    def extension(self) -> str:
+        return "jpg" if self == OutputFormat.JPEG else self.value
+
+
+class ChromaSubsampling(str, Enum):
+    """JPEG chroma subsampling modes."""
+
+    S444 = "4:4:4"
+    S422 = "4:2:2"
+    S420 = "4:2:0"
+
+
+class OutputOptions(BaseModel):
+    """How the processed image is encoded."""
+
+    format: OutputFormat = Field(
+        default=OutputFormat.JPEG, description="Output image format"
+    )
+    quality: int = Field(
+        default=75, ge=1, le=100, description="Encoder quality for JPEG and WebP"
+    )
+    progressive: bool = Field(
+        default=False, description="Write a progressive JPEG (or an interlaced PNG)"
+    )
+    optimize: bool = Field(
+        default=False, description="Spend extra encoder time on a smaller file"
+    )
+    subsampling: ChromaSubsampling | None = Field(
+        default=None, description="JPEG chroma subsampling, encoder default if unset"
+    )
+    max_edge: int | None = Field(
+        default=None, ge=1, description="Downscale so the long edge is at most this many pixels"
+    )
+    keep_icc_profile: bool = Field(
+        default=True, description="Copy the input's ICC colour profile to the output"
+    )
+    keep_exif: bool = Field(
+        default=False, description="Copy the input's EXIF metadata to the output"
+    )
+
+
+def encode_image(image: Image.Image, options: OutputOptions = OutputOptions()) -> bytes:
+    """
+    Encode an image according to the output options.
+
+    Modes the target format cannot store are converted first: alpha is flattened
+    onto white for JPEG, palette images are expanded.
+    """
+    if options.max_edge and max(image.size) > options.max_edge:
+        image = image.copy()
+        image.thumbnail((options.max_edge, options.max_edge), Image.Resampling.LANCZOS)
+
+    image = _convert_for_format(image, options.format)
+
+    save_kwargs = {}
+    if options.keep_icc_profile and image.info.get("icc_profile"):
+        save_kwargs["icc_profile"] = image.info["icc_profile"]
+    if options.keep_exif and image.info.get("exif"):
+        save_kwargs["exif"] = image.info["exif"]
+
+    if options.format == OutputFormat.JPEG:
+        save_kwargs.update(
+            quality=options.quality,
+            progressive=options.progressive,
+            optimize=options.optimize,
+        )
+        if options.subsampling is not None:
+            save_kwargs["subsampling"] = options.subsampling.value
+    elif options.format == OutputFormat.WEBP:
+        save_kwargs.update(quality=options.quality, method=6 if options.optimize else 4)
+    else:
+        save_kwargs.update(optimize=options.optimize, interlace=options.progressive)
+
+    output = BytesIO()
+    image.save(output, format=options.format.value.upper(), **save_kwargs)
+    encoded = output.getvalue()
+    memory.track(encoded)
+    return encoded
+
+
+def _convert_for_format(image: Image.Image, output_format: OutputFormat) -> Image.Image:
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (
+        image.mode == "P" and "transparency" in image.info
+    )
+    if output_format == OutputFormat.JPEG:
+        if has_alpha:
+            rgba = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            background.info = dict(image.info)
+            return background
+        return image if image.mode in ("RGB", "L", "CMYK") else image.convert("RGB")
+
+    if image.mode in ("RGB", "RGBA", "L", "LA") or (
+        output_format == OutputFormat.PNG and image.mode == "P"
+    ):
+        return image
+    return image.convert("RGBA" if has_alpha else "RGB")
+
+
+def iter_chunks(data: bytes, chunk_size: int = STREAM_CHUNK_SIZE) -> Iterator[memoryview]:
+    """Split encoded bytes into fixed-size pieces for streaming, without copying."""
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield view[start : start + chunk_size]
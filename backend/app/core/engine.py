@@ -0,0 +1,449 @@
+import asyncio
+import io
+import logging
+import mmap
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from multiprocessing.context import BaseContext
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Awaitable, BinaryIO, Callable, Literal, NamedTuple, TypeVar
+
+import cv2
+from PIL import Image
+
+from . import memory, metrics
+from .admission import DeadlineExceededError, check_deadline, current_deadline
+from .config import settings
+from .image_processor import AspectRatio, ImageProcessingParams, ImageProcessor
+from .pipeline import crop_task
+
+T = TypeVar("T")
+
+logger = logging.getLogger(__name__)
+
+# How long a warm-up task waits for every other worker to take its own, and
+# how often a failed warm-up is retried on a fresh pool
+_WARM_UP_TIMEOUT_SECONDS = 120.0
+_WARM_UP_ATTEMPTS = 3
+_WARM_UP_RETRY_DELAY_SECONDS = 5.0
+
+# Task result, the stages it timed, its run time inside the worker and, if
+# requested, its memory use
+_TimedResult = tuple[Any, metrics.StageTimings, float, memory.MemoryReport | None]
+
+
+class _TaskContext(NamedTuple):
+    """What a worker needs to know about the request a task runs for."""
+
+    deadline: float | None
+    trace_memory: bool
+
+
+def _task_context() -> _TaskContext:
+    return _TaskContext(current_deadline.get(), memory.current_trace.get())
+
+# Each worker thread (or the main thread of each worker process) owns one processor
+_worker_state = threading.local()
+
+# A processor loaded ahead of the workers, handed to the first one that starts
+_preloaded: ImageProcessor | None = None
+_preloaded_lock = threading.Lock()
+
+
+def preload_processor() -> None:
+    """
+    Load the face detection model in this process before any worker exists.
+
+    When the process is then forked (the process pool's fork server, or a
+    pre-forking server such as ``gunicorn --preload``), each child inherits
+    the loaded model copy-on-write and its first worker adopts it instead of
+    reading the cascades again.
+    """
+    global _preloaded
+    with _preloaded_lock:
+        if _preloaded is None:
+            _preloaded = ImageProcessor()
+
+
+def _take_preloaded() -> ImageProcessor | None:
+    global _preloaded
+    with _preloaded_lock:
+        processor, _preloaded = _preloaded, None
+        return processor
+
+
+def _init_worker(cv2_threads: int, warm_up_barrier: Any) -> None:
+    """Executor initializer: configure OpenCV and load this worker's face detection model."""
+    cv2.setNumThreads(cv2_threads)
+    _worker_state.processor = _take_preloaded() or ImageProcessor()
+    _worker_state.warm_up_barrier = warm_up_barrier
+
+
+def _process_context() -> BaseContext:
+    """
+    Start worker processes from a fork server that has already loaded the model.
+
+    Forking from it is much faster than spawning a fresh interpreter that
+    re-imports OpenCV and re-reads the cascades. Platforms without a fork
+    server fall back to spawning.
+    """
+    if "forkserver" not in multiprocessing.get_all_start_methods():
+        return get_context("spawn")
+    context = get_context("forkserver")
+    context.set_forkserver_preload([f"{__package__}.preload"])
+    return context
+
+
+def _warm_up_image() -> bytes:
+    """A small faceless JPEG; without faces every detector tier runs once."""
+    buffer = io.BytesIO()
+    Image.linear_gradient("L").resize((320, 240)).convert("RGB").save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def _warm_up_task(
+    processor: ImageProcessor, image_data: BinaryIO, params: ImageProcessingParams
+) -> None:
+    """
+    Run a warm-up crop, then hold this worker until every worker has run one.
+
+    Without the barrier a worker that finishes early could take a second
+    warm-up task and leave another worker cold.
+    """
+    crop_task(processor, image_data, params)
+    _worker_state.warm_up_barrier.wait(timeout=_WARM_UP_TIMEOUT_SECONDS)
+
+
+def _timed(
+    task: Callable[..., T], image_data: BinaryIO, args: tuple, context: _TaskContext
+) -> _TimedResult:
+    """Run a task, collecting the stages it times, its total run time and its memory use."""
+    # Work that waited in the executor queue past its deadline is dropped unstarted
+    check_deadline(context.deadline)
+    start = time.perf_counter()
+    reports: list[memory.MemoryReport] = []
+    with metrics.collect_stages() as stages:
+        if context.trace_memory:
+            with memory.trace_memory() as reports:
+                result = task(_worker_state.processor, image_data, *args)
+        else:
+            result = task(_worker_state.processor, image_data, *args)
+    report = reports[0] if reports else None
+    return result, stages, time.perf_counter() - start, report
+
+
+def _run_in_thread(
+    task: Callable[..., T], data: bytes, args: tuple, context: _TaskContext
+) -> _TimedResult:
+    # Reads the caller's buffer in place; BytesIO would copy a bytearray
+    with _MemoryReader(memoryview(data)) as reader:
+        return _timed(task, reader, args, context)
+
+
+def _run_in_process(
+    task: Callable[..., T], shm_name: str, size: int, args: tuple, context: _TaskContext
+) -> _TimedResult:
+    shm = SharedMemory(name=shm_name)
+    try:
+        with _MemoryReader(shm.buf[:size]) as reader:
+            return _timed(task, reader, args, context)
+    finally:
+        shm.close()
+
+
+def _run_on_file(
+    task: Callable[..., T], path: str, args: tuple, context: _TaskContext
+) -> _TimedResult:
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with _MemoryReader(memoryview(mapped)) as reader:
+            return _timed(task, reader, args, context)
+
+
+def _run_on_path(
+    task: Callable[..., T], path: str, args: tuple, context: _TaskContext
+) -> _TimedResult:
+    return _timed(task, path, args, context)
+
+
+class _MemoryReader(io.RawIOBase):
+    """Seekable, read-only file object over a memoryview, without copying it."""
+
+    def __init__(self, view: memoryview):
+        self._view = view
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        chunk = self._view[self._position : self._position + len(buffer)]
+        buffer[: len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self) -> None:
+        if not self.closed:
+            self._view.release()
+        super().close()
+
+
+class ProcessingEngine:
+    """
+    Runs CPU-bound pipeline tasks off the event loop in a dedicated worker pool.
+
+    Every worker loads its own ImageProcessor (and with it its own cascade) once
+    at startup, so no classifier is shared between threads. In process mode the
+    image bytes are handed over through shared memory instead of being pickled.
+
+    Tasks are module-level callables ``task(processor, image_data, *args)`` where
+    ``image_data`` is a readable, seekable binary file object. Stages a task
+    marks with ``metrics.stage`` are reported back from the worker, together
+    with the time the task spent waiting for one (``queue``).
+    """
+
+    def __init__(
+        self,
+        mode: Literal["thread", "process"] = settings.engine_mode,
+        workers: int = settings.engine_workers,
+        cv2_threads: int = settings.cv2_threads,
+    ):
+        self.mode = mode
+        self.workers = workers
+        self.cv2_threads = cv2_threads
+        self._executor: Executor | None = None
+        self._warm_up_barrier: Any = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.warm_up_seconds: float | None = None
+
+    @property
+    def ready(self) -> bool:
+        """Whether every worker has been started and has run a warm-up crop."""
+        return self.warm_up_seconds is not None
+
+    @property
+    def queue_depth(self) -> int:
+        """Submitted tasks still waiting for a free worker."""
+        return max(0, self.in_flight - self.workers)
+
+    @property
+    def executor(self) -> Executor:
+        """The worker pool, created on first use."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create_executor()
+            return self._executor
+
+    def _create_executor(self) -> Executor:
+        if self.mode == "process":
+            context = _process_context()
+            self._warm_up_barrier = context.Barrier(self.workers)
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(self.cv2_threads, self._warm_up_barrier),
+            )
+        self._warm_up_barrier = threading.Barrier(self.workers)
+        return ThreadPoolExecutor(
+            max_workers=self.workers,
+            thread_name_prefix="image-worker",
+            initializer=_init_worker,
+            initargs=(self.cv2_threads, self._warm_up_barrier),
+        )
+
+    async def run(self, task: Callable[..., T], data: bytes, *args: Any) -> T:
+        """
+        Run a pipeline task on the image bytes in a worker.
+
+        If the calling request has a deadline (``admission.current_deadline``)
+        and it passes while the task waits for a worker, the task is dropped
+        with ``DeadlineExceededError`` instead of being run. If it asked for
+        memory accounting (``memory.current_trace``), the task runs traced.
+
+        Args:
+            task (Callable): Module-level function called as ``task(processor, image_data, *args)``
+            data (bytes): Encoded image bytes
+            *args: Extra arguments passed through to the task
+
+        Returns:
+            The task's return value
+        """
+        loop = asyncio.get_event_loop()
+        executor = self.executor
+        return await self._measure(task, executor, self._submit(loop, executor, task, data, args))
+
+    async def run_file(self, task: Callable[..., T], path: str, *args: Any) -> T:
+        """
+        Run a pipeline task on an image file that the worker memory-maps itself.
+
+        The file's bytes never pass through the event loop's process, so
+        nothing is copied on the way in, in either engine mode.
+
+        Args:
+            task (Callable): Module-level function called as ``task(processor, image_data, *args)``
+            path (str): Path of a non-empty image file readable by the workers
+            *args: Extra arguments passed through to the task
+
+        Returns:
+            The task's return value
+        """
+        loop = asyncio.get_event_loop()
+        executor = self.executor
+        return await self._measure(
+            task,
+            executor,
+            loop.run_in_executor(executor, _run_on_file, task, path, args, _task_context()),
+        )
+
+    async def run_path(self, task: Callable[..., T], path: str, *args: Any) -> T:
+        """
+        Run a pipeline task that opens a file by path itself.
+
+        For inputs that libraries only read from paths, such as videos for
+        OpenCV; the worker neither reads nor maps the file.
+
+        Args:
+            task (Callable): Module-level function called as ``task(processor, path, *args)``
+            path (str): Path of a file readable by the workers
+            *args: Extra arguments passed through to the task
+
+        Returns:
+            The task's return value
+        """
+        loop = asyncio.get_event_loop()
+        executor = self.executor
+        return await self._measure(
+            task,
+            executor,
+            loop.run_in_executor(executor, _run_on_path, task, path, args, _task_context()),
+        )
+
+    async def _measure(
+        self, task: Callable, executor: Executor, submission: Awaitable[_TimedResult]
+    ) -> Any:
+        """Await a submitted task, recording its queue time, stages, memory and failures."""
+        start = time.perf_counter()
+        self.in_flight += 1
+        try:
+            result, stages, run_time, report = await submission
+        except Exception as e:
+            metrics.ERRORS.inc(error=type(e).__name__)
+            if isinstance(e, DeadlineExceededError):
+                metrics.ADMISSIONS.inc(outcome="expired")
+            if isinstance(e, BrokenProcessPool):
+                self._discard(executor)
+            raise
+        finally:
+            self.in_flight -= 1
+
+        metrics.record_stage("queue", max(0.0, time.perf_counter() - start - run_time))
+        for name, seconds in stages:
+            metrics.record_stage(name, seconds)
+        if report is not None:
+            memory.record(task.__name__, report)
+        return result
+
+    async def _submit(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        executor: Executor,
+        task: Callable[..., T],
+        data: bytes,
+        args: tuple,
+    ) -> _TimedResult:
+        context = _task_context()
+        if self.mode != "process":
+            return await loop.run_in_executor(executor, _run_in_thread, task, data, args, context)
+
+        shm = SharedMemory(create=True, size=max(len(data), 1))
+        try:
+            shm.buf[: len(data)] = data
+            return await loop.run_in_executor(
+                executor, _run_in_process, task, shm.name, len(data), args, context
+            )
+        finally:
+            shm.close()
+            shm.unlink()
+
+    async def warm_up(
+        self,
+        attempts: int = _WARM_UP_ATTEMPTS,
+        retry_delay: float = _WARM_UP_RETRY_DELAY_SECONDS,
+    ) -> float:
+        """
+        Start every worker and run one synthetic crop on each.
+
+        This loads each worker's model and initialises OpenCV's and Pillow's
+        lazy state, so the first real requests do not pay for it. The
+        warm-up tasks wait for each other on a barrier, so each worker runs
+        exactly one. A failed attempt is logged and retried on a fresh pool.
+
+        Args:
+            attempts (int): Attempts before giving up
+            retry_delay (float): Seconds between attempts
+
+        Returns:
+            float: Seconds the warm-up took
+
+        Raises:
+            Exception: The last attempt's error; the engine then stays unready
+        """
+        start = time.perf_counter()
+        image = _warm_up_image()
+        params = ImageProcessingParams(aspect_ratio=AspectRatio.SQUARE)
+        for attempt in range(1, attempts + 1):
+            executor = self.executor
+            barrier = self._warm_up_barrier
+            try:
+                await asyncio.gather(
+                    *(self.run(_warm_up_task, image, params) for _ in range(self.workers))
+                )
+                break
+            except Exception:
+                logger.exception("Engine warm-up attempt %d of %d failed", attempt, attempts)
+                # Release the workers still waiting for the failed ones
+                barrier.abort()
+                self._discard(executor)
+                if attempt == attempts:
+                    raise
+                await asyncio.sleep(retry_delay)
+        self.warm_up_seconds = time.perf_counter() - start
+        return self.warm_up_seconds
+
+    def _discard(self, executor: Executor) -> None:
+        """Drop a pool whose worker died, so that the next task starts a fresh one."""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self) -> None:
+        """Stop the worker pool; it is recreated on the next run."""
+        with self._lock:
+            self.warm_up_seconds = None
+            if self._warm_up_barrier is not None:
+                # A warm-up cut short must not hold its workers until the timeout
+                self._warm_up_barrier.abort()
+                self._warm_up_barrier = None
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
@@ -1,14 +1,18 @@
 # NOTE: This file was partially generated using AI assistance.
-import asyncio
+from contextlib import contextmanager
 from enum import Enum
-from io import BytesIO
-from typing import Tuple
+from typing import BinaryIO, NamedTuple, Sequence, Tuple
 
 import cv2
 import numpy as np
 from PIL import Image
 from pydantic import BaseModel, Field
 
+from . import memory
+from .config import settings
+from .detectors import TieredDetector
+from .metrics import stage
+
 
 class AspectRatio(str, Enum):
     """Valid aspect ratios for image cropping."""
@@ -18,17 +22,33 @@ class AspectRatio(str, Enum):
     PHOTO = "2:3"
     ORIGINAL = "original"
 
-    def get_ratio(self) -> float | None:
-        """Convert aspect ratio string to float value."""
+    def get_fraction(self) -> Tuple[int, int] | None:
+        """Width and height terms of the aspect ratio, in lowest terms."""
         if self == AspectRatio.PORTRAIT:
-            return 9 / 16
+            return (9, 16)
         elif self == AspectRatio.SQUARE:
-            return 1.0
+            return (1, 1)
         elif self == AspectRatio.PHOTO:
-            return 2 / 3
+            return (2, 3)
         else:  # ORIGINAL
             return None
 
+    def get_ratio(self) -> float | None:
+        """Convert aspect ratio string to float value."""
+        fraction = self.get_fraction()
+        return fraction[0] / fraction[1] if fraction else None
+
+
+class FaceFraming(str, Enum):
+    """Which of the detected faces a crop is framed around."""
+
+    LARGEST = "largest"
+    GROUP = "group"
+
+
+# Modes Image.reduce() handles directly; others are converted to grayscale first
+_REDUCIBLE_MODES = {"L", "LA", "RGB", "RGBA", "RGBX"}
+
 
 class ImageProcessingParams(BaseModel):
     """Parameters for image processing."""
@@ -43,6 +63,30 @@ class ImageProcessingParams(BaseModel):
         le=1.0,
         description="Zoom level (0.0 means maximum padding, 1.0 means tight crop)",
     )
+    framing: FaceFraming = Field(
+        default=FaceFraming.LARGEST,
+        description="Frame the largest face, or all faces together",
+    )
+
+
+class Rendition(BaseModel):
+    """One output variant of an image: an aspect ratio at an optional target width."""
+
+    aspect_ratio: AspectRatio = Field(
+        default=AspectRatio.ORIGINAL,
+        description="Aspect ratio of the rendition",
+    )
+    width: int | None = Field(
+        default=None,
+        ge=1,
+        description="Target width in pixels; crops narrower than this are not upscaled",
+    )
+
+    @property
+    def label(self) -> str:
+        """Short, filename-safe description such as ``9x16_640``."""
+        ratio = self.aspect_ratio.value.replace(":", "x")
+        return f"{ratio}_{self.width}" if self.width else ratio
 
 
 class ImageProcessingError(Exception):
@@ -51,87 +95,285 @@ class ImageProcessingError(Exception):
     pass
 
 
+class ImageTooLargeError(ImageProcessingError):
+    """The image exceeds the configured size limits."""
+
+    pass
+
+
+@contextmanager
+def processing_errors():
+    """Translate failures while processing an image into ImageProcessingError."""
+    try:
+        yield
+    except ImageProcessingError:
+        raise
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
+    except (IOError, SyntaxError) as e:
+        raise ImageProcessingError(f"Invalid image format: {str(e)}")
+    except Exception as e:
+        raise ImageProcessingError(f"Failed to process image: {str(e)}")
+
+
+class Detection(NamedTuple):
+    """Decoded image dimensions, the faces found in it and the detector tier that found them."""
+
+    width: int
+    height: int
+    faces: np.ndarray
+    tier: str | None = None
+
+
+def select_faces(
+    faces: np.ndarray,
+    overlap_threshold: float = settings.face_overlap_threshold,
+    min_relative_size: float = settings.min_relative_face_size,
+) -> np.ndarray:
+    """
+    Reduce raw detections to distinct, sufficiently large faces.
+
+    Boxes are visited from largest to smallest; a box is dropped when it
+    overlaps an already kept one by more than ``overlap_threshold`` (IoU) or
+    when its side is below ``min_relative_size`` of the largest face's side.
+
+    Returns:
+        np.ndarray: The kept boxes, largest first
+    """
+    if len(faces) == 0:
+        return faces
+    faces = faces[np.argsort(-(faces[:, 2] * faces[:, 3]), kind="stable")]
+    largest_side = np.sqrt(faces[0, 2] * faces[0, 3])
+
+    kept: list = []
+    for face in faces:
+        if np.sqrt(face[2] * face[3]) < min_relative_size * largest_side:
+            break  # Sorted by area, so every remaining face is smaller
+        if all(_iou(face, other) <= overlap_threshold for other in kept):
+            kept.append(face)
+    return np.array(kept, dtype=faces.dtype).reshape(-1, 4)
+
+
+def fit_aspect_ratio(
+    image_shape: Tuple[int, ...],
+    crop_coords: Tuple[int, int, int, int],
+    aspect_ratio: AspectRatio,
+) -> Tuple[int, int, int, int]:
+    """
+    Fit crop coordinates to an aspect ratio exactly, inside the image.
+
+    The result is the largest box of the ratio that fits in ``crop_coords``,
+    centred on it. Its sides are whole multiples of the ratio's terms, so
+    width / height equals the ratio exactly and the crop never has to be
+    resampled. A box smaller than one such multiple grows to it and is
+    shifted, not squashed, to stay inside the image.
+
+    Args:
+        image_shape (Tuple[int, ...]): Height and width of the image
+        crop_coords (Tuple[int, int, int, int]): Box (start_x, start_y, end_x, end_y)
+            inside the image
+        aspect_ratio (AspectRatio): Target aspect ratio
+
+    Returns:
+        Tuple[int, int, int, int]: The fitted box. It is ``crop_coords`` unchanged
+            for the original ratio, or for an image too small to hold the
+            ratio at all (under 16 pixels high for 9:16).
+    """
+    fraction = aspect_ratio.get_fraction()
+    if fraction is None:
+        return crop_coords
+    image_height, image_width = image_shape[:2]
+    ratio_width, ratio_height = fraction
+    start_x, start_y, end_x, end_y = (int(value) for value in crop_coords)
+
+    scale = max(1, min((end_x - start_x) // ratio_width, (end_y - start_y) // ratio_height))
+    scale = min(scale, image_width // ratio_width, image_height // ratio_height)
+    if scale == 0:
+        return crop_coords
+    width, height = ratio_width * scale, ratio_height * scale
+
+    left = min(max(0, (start_x + end_x - width) // 2), image_width - width)
+    top = min(max(0, (start_y + end_y - height) // 2), image_height - height)
+    return (left, top, left + width, top + height)
+
+
+def _iou(a: np.ndarray, b: np.ndarray) -> float:
+    """Intersection over union of two (x, y, w, h) boxes."""
+    overlap_w = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    overlap_h = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    if overlap_w <= 0 or overlap_h <= 0:
+        return 0.0
+    intersection = float(overlap_w) * float(overlap_h)
+    return intersection / (float(a[2]) * a[3] + float(b[2]) * b[3] - intersection)
+
+
 class ImageProcessor:
-    def __init__(self):
-        # Load the pre-trained face detection model
-        self.face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
-        )
-        if self.face_cascade.empty():
-            raise ImageProcessingError("Failed to load face detection model")
+    def __init__(
+        self,
+        detection_max_edge: int | None = settings.detection_max_edge,
+        min_face_fraction: float = settings.min_face_fraction,
+        detector_tiers: Sequence[str] = settings.detector_tiers,
+        max_megapixels: float | None = settings.max_megapixels,
+    ):
+        """
+        Args:
+            detection_max_edge (int | None): Cap on the long edge of the image used for
+                face detection. Larger images are downscaled before detection and the
+                boxes are mapped back. ``None`` or 0 detects on the full resolution.
+            min_face_fraction (float): Smallest face to look for, as a fraction of the
+                image's short edge
+            detector_tiers (Sequence[str]): Registered detectors to try in order; later
+                tiers only run when the earlier ones found nothing
+            max_megapixels (float | None): Largest image accepted, checked from the
+                image header before any pixel data is decoded
+        """
+        self.detection_max_edge = detection_max_edge or None
+        self.min_face_fraction = min_face_fraction
+        self.max_megapixels = max_megapixels
 
-    async def process_image(
+        # Load the pre-trained face detection models
+        try:
+            self.detector = TieredDetector(detector_tiers)
+        except ValueError as e:
+            raise ImageProcessingError(str(e))
+
+    def crop_image(
         self,
-        image_data: BytesIO,
+        image_data: BinaryIO,
         params: ImageProcessingParams = ImageProcessingParams(),
+        faces: np.ndarray | None = None,
     ) -> Image.Image:
         """
-        Process the image asynchronously to detect and crop faces.
+        Detect and crop faces synchronously, on the calling thread.
+
+        This is the whole CPU-bound pipeline; execution engines call it from their
+        workers, each with its own ImageProcessor. The detectors are not thread-safe,
+        so an instance must not be shared between threads; from async code, run
+        tasks through a ``ProcessingEngine``.
 
         Args:
-            image_data (BytesIO): Input image data
+            image_data (BinaryIO): Readable, seekable input image data
             params (ImageProcessingParams): Processing parameters for aspect ratio and zoom
+            faces (np.ndarray | None): Previously detected faces in full-resolution
+                coordinates; detection is skipped when given
 
         Returns:
             Image.Image: Processed image with faces cropped
 
         Raises:
             ImageProcessingError: If image processing fails
-            ValueError: If input is invalid
         """
-        if not image_data or image_data.getbuffer().nbytes == 0:
-            raise ValueError("Empty image data provided")
+        with processing_errors():
+            pil_image = self.load_image(image_data)
+            if faces is None:
+                faces = self.detect(pil_image).faces
+            return self.crop_faces(pil_image, faces, params)
 
-        try:
-            # Load and validate image
-            pil_image = self._load_and_validate_image(image_data)
-            cv_image = self._convert_to_opencv(pil_image)
-
-            # Detect faces
-            faces = await self._detect_faces(cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY))
-            if len(faces) == 0:
-                return pil_image
-
-            # Get crop coordinates
-            crop_coords = self._calculate_crop_coordinates(
-                cv_image.shape, faces, params.zoom
+    def load_image(self, image_data: BinaryIO) -> Image.Image:
+        """
+        Load and validate the input image with a single decode.
+
+        Raises:
+            ImageTooLargeError: If the header announces more pixels than allowed
+        """
+        image = Image.open(image_data)  # Only parses the header
+        megapixels = image.width * image.height / 1_000_000
+        if self.max_megapixels and megapixels > self.max_megapixels:
+            raise ImageTooLargeError(
+                f"Image is {megapixels:.1f} megapixels, the limit is {self.max_megapixels:g}"
             )
+        image.load()  # Fully decode now so corrupt data fails here
+        memory.track(image)
+        return image
 
-            # Adjust for aspect ratio if needed
-            if params.aspect_ratio != AspectRatio.ORIGINAL:
-                crop_coords = self._adjust_crop_for_aspect_ratio(
-                    cv_image.shape, crop_coords, params.aspect_ratio
-                )
+    def detect(self, image: Image.Image) -> Detection:
+        """Detect faces on a decoded image, with boxes in its own coordinates."""
+        # Build a small luminance plane for detection
+        gray_image, reduction = self._luminance_plane(image)
 
-            # Perform the crop
-            cropped_image = self._crop_and_convert_image(cv_image, crop_coords)
+        # Detect faces and map them back to full-resolution coordinates
+        faces, tier = self._run_detection(gray_image)
+        faces = self._rescale_faces(faces, 1 / reduction, (image.height, image.width))
+        return Detection(image.width, image.height, faces, tier)
 
-            # Verify and fix aspect ratio if needed
-            if params.aspect_ratio != AspectRatio.ORIGINAL:
-                cropped_image = self._verify_and_fix_aspect_ratio(
-                    cropped_image, params.aspect_ratio
-                )
+    def detect_frame(self, gray_frame: np.ndarray) -> Detection:
+        """Detect faces on an already decoded grayscale frame, such as a video frame."""
+        faces, tier = self._run_detection(gray_frame)
+        return Detection(gray_frame.shape[1], gray_frame.shape[0], faces, tier)
 
-            return cropped_image
+    def crop_faces(
+        self, image: Image.Image, faces: np.ndarray, params: ImageProcessingParams
+    ) -> Image.Image:
+        """Crop a decoded image around the detected faces; without faces it is returned as is."""
+        if len(faces) == 0:
+            return image
+        crop_coords = self.crop_box((image.height, image.width), faces, params)
 
-        except (IOError, SyntaxError) as e:
-            raise ImageProcessingError(f"Invalid image format: {str(e)}")
-        except Exception as e:
-            raise ImageProcessingError(f"Failed to process image: {str(e)}")
+        # Perform the crop
+        with stage("crop"):
+            return self._crop_image(image, crop_coords)
 
-    def _load_and_validate_image(self, image_data: BytesIO) -> Image.Image:
-        """Load and validate the input image."""
-        image = Image.open(image_data)
-        image.verify()  # Verify it's a valid image
-        image_data.seek(0)  # Reset buffer position after verify
-        return Image.open(image_data)  # Reopen after verify
+    def crop_box(
+        self, image_shape: Tuple[int, ...], faces: np.ndarray, params: ImageProcessingParams
+    ) -> Tuple[int, int, int, int]:
+        """
+        Calculate the crop of an image around its faces, without touching any pixels.
 
-    def _convert_to_opencv(self, pil_image: Image.Image) -> np.ndarray:
-        """Convert PIL Image to OpenCV format."""
-        return cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+        Args:
+            image_shape (Tuple[int, ...]): Height and width of the image
+            faces (np.ndarray): Face boxes (x, y, width, height) in the image's coordinates
+            params (ImageProcessingParams): Processing parameters
+
+        Returns:
+            Tuple[int, int, int, int]: The crop (start_x, start_y, end_x, end_y); the
+                whole image when there are no faces
+        """
+        if len(faces) == 0:
+            return (0, 0, image_shape[1], image_shape[0])
+
+        # Get crop coordinates
+        if params.framing == FaceFraming.GROUP:
+            crop_coords = self._calculate_group_coordinates(
+                image_shape, select_faces(faces), params.zoom
+            )
+        else:
+            crop_coords = self._calculate_crop_coordinates(image_shape, faces, params.zoom)
+
+        # Adjust for aspect ratio if needed; the box then has the exact ratio
+        crop_coords = fit_aspect_ratio(image_shape, crop_coords, params.aspect_ratio)
+        return tuple(int(value) for value in crop_coords)
+
+    def _luminance_plane(self, image: Image.Image) -> Tuple[np.ndarray, int]:
+        """
+        Build the grayscale plane used for face detection.
+
+        The decoded image is first shrunk by the largest integer factor that keeps
+        it at or above the detection resolution, so no full-frame grayscale copy is
+        ever allocated.
+
+        Returns:
+            Tuple[np.ndarray, int]: The grayscale plane and the reduction factor
+                relative to the decoded image
+        """
+        reduction = 1
+        if self.detection_max_edge:
+            reduction = max(1, max(image.size) // self.detection_max_edge)
+
+        if image.mode in _REDUCIBLE_MODES:
+            if reduction > 1:
+                image = image.reduce(reduction)
+            gray = image.convert("L") if image.mode != "L" else image
+        else:
+            gray = image.convert("L")
+            if reduction > 1:
+                gray = gray.reduce(reduction)
+
+        plane = np.asarray(gray)
+        memory.track(plane)
+        return plane, reduction
 
     def _calculate_crop_coordinates(
-        self, image_shape: Tuple[int, int, int], faces: np.ndarray, zoom: float
+        self, image_shape: Tuple[int, ...], faces: np.ndarray, zoom: float
     ) -> Tuple[int, int, int, int]:
         """Calculate initial crop coordinates based on face detection and zoom."""
         # Get the largest face
@@ -150,145 +392,87 @@ class ImageProcessor:
             min(image_shape[0], y + h + padding_y),
         )
 
-    def _adjust_crop_for_aspect_ratio(
-        self,
-        image_shape: Tuple[int, int, int],
-        crop_coords: Tuple[int, int, int, int],
-        aspect_ratio: AspectRatio,
+    def _calculate_group_coordinates(
+        self, image_shape: Tuple[int, ...], faces: np.ndarray, zoom: float
     ) -> Tuple[int, int, int, int]:
-        """Adjust crop coordinates to match the desired aspect ratio."""
-        start_x, start_y, end_x, end_y = crop_coords
-        current_width = end_x - start_x
-        current_height = end_y - start_y
-        target_ratio = aspect_ratio.get_ratio()
-
-        if target_ratio < 1:  # Portrait mode
-            return self._adjust_for_portrait_ratio(
-                image_shape,
-                start_x,
-                start_y,
-                end_x,
-                end_y,
-                current_width,
-                current_height,
-                target_ratio,
-            )
-        else:  # Landscape or square mode
-            return self._adjust_for_landscape_ratio(
-                image_shape,
-                start_x,
-                start_y,
-                end_x,
-                end_y,
-                current_width,
-                current_height,
-                target_ratio,
-            )
-
-    def _adjust_for_portrait_ratio(
-        self,
-        image_shape: Tuple[int, int, int],
-        start_x: int,
-        start_y: int,
-        end_x: int,
-        end_y: int,
-        current_width: int,
-        current_height: int,
-        target_ratio: float,
-    ) -> Tuple[int, int, int, int]:
-        """Adjust crop coordinates for portrait aspect ratio."""
-        new_width = int(current_height * target_ratio)
-        if new_width > current_width:
-            # Scale height up instead
-            new_height = int(current_width / target_ratio)
-            diff = new_height - current_height
-            if diff > 0:
-                start_y = max(0, start_y - diff // 2)
-                end_y = min(image_shape[0], end_y + (diff - diff // 2))
-        else:
-            # Adjust width equally on both sides
-            diff = current_width - new_width
-            start_x += diff // 2
-            end_x -= diff - (diff // 2)
-
-        return (start_x, start_y, end_x, end_y)
-
-    def _adjust_for_landscape_ratio(
-        self,
-        image_shape: Tuple[int, int, int],
-        start_x: int,
-        start_y: int,
-        end_x: int,
-        end_y: int,
-        current_width: int,
-        current_height: int,
-        target_ratio: float,
-    ) -> Tuple[int, int, int, int]:
-        """Adjust crop coordinates for landscape or square aspect ratio."""
-        new_height = int(current_width / target_ratio)
-        if new_height > current_height:
-            # Scale width up instead
-            new_width = int(current_height * target_ratio)
-            diff = current_width - new_width
-            start_x += diff // 2
-            end_x -= diff - (diff // 2)
-        else:
-            # Adjust height equally on both sides
-            diff = current_height - new_height
-            start_y += diff // 2
-            end_y -= diff - (diff // 2)
-
-        return (start_x, start_y, end_x, end_y)
+        """Calculate crop coordinates framing all faces, padded like the largest one."""
+        start_x = faces[:, 0].min()
+        start_y = faces[:, 1].min()
+        end_x = (faces[:, 0] + faces[:, 2]).max()
+        end_y = (faces[:, 1] + faces[:, 3]).max()
+
+        # Pad by the largest face's size, as for a single-face crop
+        _, _, w, h = max(faces, key=lambda face: face[2] * face[3])
+        padding_factor = 1.0 - zoom
+        padding_x = int(w * padding_factor)
+        padding_y = int(h * padding_factor)
 
-    def _crop_and_convert_image(
-        self, cv_image: np.ndarray, crop_coords: Tuple[int, int, int, int]
-    ) -> Image.Image:
-        """Crop the image and convert back to PIL format."""
-        start_x, start_y, end_x, end_y = crop_coords
-        cropped_cv = cv_image[start_y:end_y, start_x:end_x]
-        return Image.fromarray(cv2.cvtColor(cropped_cv, cv2.COLOR_BGR2RGB))
+        return (
+            int(max(0, start_x - padding_x)),
+            int(max(0, start_y - padding_y)),
+            int(min(image_shape[1], end_x + padding_x)),
+            int(min(image_shape[0], end_y + padding_y)),
+        )
 
-    def _verify_and_fix_aspect_ratio(
-        self, image: Image.Image, aspect_ratio: AspectRatio
+    def _crop_image(
+        self, image: Image.Image, crop_coords: Tuple[int, int, int, int]
     ) -> Image.Image:
-        """Verify and fix the aspect ratio of the image if needed."""
-        width, height = image.size
-        current_ratio = width / height
-        target_ratio = aspect_ratio.get_ratio()
-
-        if abs(current_ratio - target_ratio) > 0.01:
-            if target_ratio < 1:  # Portrait
-                new_width = int(height * target_ratio)
-                new_height = height
-            else:  # Landscape or square
-                new_width = width
-                new_height = int(width / target_ratio)
-            return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-        return image
+        """
+        Crop the decoded image, keeping its mode.
 
-    async def _detect_faces(self, gray_image: np.ndarray) -> np.ndarray:
+        Alpha and palettes survive the crop; ``encode_image`` converts the
+        crop to what the output format can store.
         """
-        Detect faces in the grayscale image asynchronously.
+        cropped = image.crop(crop_coords)
+        memory.track(cropped)
+        return cropped
 
-        Args:
-            gray_image (np.ndarray): Grayscale image for face detection
+    def _run_detection(self, gray_image: np.ndarray) -> Tuple[np.ndarray, str | None]:
+        """
+        Run the detector tiers on a downscaled copy of the image.
 
         Returns:
-            np.ndarray: Array of face coordinates (x, y, w, h)
-
-        Raises:
-            ImageProcessingError: If face detection fails
+            Tuple[np.ndarray, str | None]: Boxes in the coordinates of ``gray_image``
+                and the name of the tier that found them
         """
-        if gray_image is None or gray_image.size == 0:
-            raise ValueError("Invalid grayscale image provided")
-
-        try:
-            # Run face detection in an executor to avoid blocking
-            loop = asyncio.get_event_loop()
-            faces = await loop.run_in_executor(
-                None, self.face_cascade.detectMultiScale, gray_image, 1.3, 5
+        scale = self._detection_scale(gray_image.shape)
+        if scale < 1.0:
+            detection_image = cv2.resize(
+                gray_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
             )
-            # Convert to numpy array if it isn't already
-            return np.array(faces) if not isinstance(faces, np.ndarray) else faces
-        except Exception as e:
-            raise ImageProcessingError(f"Face detection failed: {str(e)}")
+        else:
+            detection_image = gray_image
+
+        min_size, max_size = self._face_size_bounds(detection_image.shape)
+        faces, tier = self.detector.detect(detection_image, min_size, max_size)
+        return self._rescale_faces(faces, scale, gray_image.shape), tier
+
+    def _detection_scale(self, image_shape: Tuple[int, ...]) -> float:
+        """Scale factor that brings the long edge down to the detection resolution."""
+        if not self.detection_max_edge:
+            return 1.0
+        return min(1.0, self.detection_max_edge / max(image_shape[:2]))
+
+    def _face_size_bounds(
+        self, image_shape: Tuple[int, ...]
+    ) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+        """Derive the cascade's minSize/maxSize from the detection image dimensions."""
+        short_edge = min(image_shape[:2])
+        min_edge = int(short_edge * self.min_face_fraction)
+        return (min_edge, min_edge), (short_edge, short_edge)
+
+    def _rescale_faces(
+        self, faces, scale: float, image_shape: Tuple[int, ...]
+    ) -> np.ndarray:
+        """Map detection boxes back into the coordinates of the original image."""
+        faces = np.asarray(faces, dtype=np.float64).reshape(-1, 4)
+        if scale != 1.0:
+            faces = np.rint(faces / scale)
+
+        height, width = image_shape[:2]
+        faces = faces.astype(np.int32)
+        faces[:, 0] = np.clip(faces[:, 0], 0, width - 1)
+        faces[:, 1] = np.clip(faces[:, 1], 0, height - 1)
+        faces[:, 2] = np.minimum(faces[:, 2], width - faces[:, 0])
+        faces[:, 3] = np.minimum(faces[:, 3], height - faces[:, 1])
+        return faces
@@ -0,0 +1,92 @@
+import time
+from collections import OrderedDict
+from typing import Callable, NamedTuple
+
+from .image_processor import Detection
+
+
+class StoredImage(NamedTuple):
+    """An uploaded image kept server-side together with its detection."""
+
+    data: bytes
+    detection: Detection
+
+
+class ImageStore:
+    """
+    Size-capped store of uploaded images with a sliding time-to-live.
+
+    Entries expire ``ttl_seconds`` after they were last used. When the total
+    size of the stored uploads exceeds ``max_bytes``, the least recently used
+    entries are dropped first.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[StoredImage, float]] = OrderedDict()
+        self._size = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def put(self, token: str, data: bytes, detection: Detection) -> bool:
+        """Store an image under ``token``; returns False if it can never fit."""
+        if len(data) > self.max_bytes:
+            return False
+        self._discard(token)
+        self._purge_expired()
+
+        self._entries[token] = (StoredImage(data, detection), self._deadline())
+        self._size += len(data)
+        while self._size > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._size -= len(evicted.data)
+            self.evictions += 1
+        return True
+
+    def get(self, token: str) -> StoredImage | None:
+        """Fetch a stored image and extend its lifetime, or None if unknown or expired."""
+        entry = self._entries.get(token)
+        if entry is None:
+            return None
+        stored, expires_at = entry
+        if expires_at <= self._clock():
+            self._discard(token)
+            self.expirations += 1
+            return None
+        self._entries[token] = (stored, self._deadline())
+        self._entries.move_to_end(token)
+        return stored
+
+    def _deadline(self) -> float:
+        return self._clock() + self.ttl_seconds
+
+    def _discard(self, token: str) -> None:
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            self._size -= len(entry[0].data)
+
+    def _purge_expired(self) -> None:
+        # Entries are ordered by last use, so expired ones are at the front
+        now = self._clock()
+        while self._entries:
+            token, (_, expires_at) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._discard(token)
+            self.expirations += 1
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,442 @@
+"""Background processing of large batches as persistent jobs."""
+
+import asyncio
+import json
+import logging
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path, PurePath
+from typing import BinaryIO, List, Literal, NamedTuple
+
+from .config import settings
+from .encoding import OutputOptions
+from .image_processor import ImageProcessingError, ImageProcessingParams
+from .service import CropService
+from .video import VideoParams
+
+logger = logging.getLogger(__name__)
+
+# How often finished jobs past their time-to-live are removed, in seconds
+_EXPIRY_INTERVAL_SECONDS = 60.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL DEFAULT 'images',
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    output TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id TEXT NOT NULL REFERENCES jobs(id) ON DELETE CASCADE,
+    idx INTEGER NOT NULL,
+    filename TEXT,
+    output_name TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    detector_tier TEXT,
+    stats TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+# Columns added after the first release, for databases created before them
+_ADDED_COLUMNS = {
+    "jobs": {"kind": "TEXT NOT NULL DEFAULT 'images'"},
+    "items": {"stats": "TEXT"},
+}
+
+JobKind = Literal["images", "video"]
+
+
+class JobQueueFullError(Exception):
+    """No more jobs can be queued until running ones finish."""
+
+    pass
+
+
+class JobUpload(NamedTuple):
+    """One image of a submitted job."""
+
+    filename: str | None
+    output_name: str
+    file: BinaryIO
+
+
+class JobStore:
+    """
+    Job and item state in a local SQLite database.
+
+    All access goes through one connection guarded by a lock; the statements
+    are small and the database lives on local disk, so they are run inline.
+    """
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA foreign_keys = ON")
+            self._connection.execute("PRAGMA journal_mode = WAL")
+            self._connection.executescript(_SCHEMA)
+            self._add_missing_columns()
+
+    def _add_missing_columns(self) -> None:
+        for table, columns in _ADDED_COLUMNS.items():
+            rows = self._connection.execute(f"PRAGMA table_info({table})")
+            existing = {row["name"] for row in rows}
+            for name, definition in columns.items():
+                if name not in existing:
+                    self._connection.execute(
+                        f"ALTER TABLE {table} ADD COLUMN {name} {definition}"
+                    )
+
+    def _execute(self, sql: str, *parameters) -> List[sqlite3.Row]:
+        with self._lock, self._connection:
+            return self._connection.execute(sql, parameters).fetchall()
+
+    def create_job(
+        self,
+        job_id: str,
+        params: str,
+        output: str,
+        uploads: List[JobUpload],
+        kind: JobKind = "images",
+    ) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO jobs (id, kind, status, params, output, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, "queued", params, output, time.time()),
+            )
+            self._connection.executemany(
+                "INSERT INTO items (job_id, idx, filename, output_name, status) "
+                "VALUES (?, ?, ?, ?, 'pending')",
+                [
+                    (job_id, index, upload.filename, upload.output_name)
+                    for index, upload in enumerate(uploads)
+                ],
+            )
+
+    def get_job(self, job_id: str) -> dict | None:
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", job_id)
+        return dict(rows[0]) if rows else None
+
+    def get_items(self, job_id: str) -> List[dict]:
+        rows = self._execute("SELECT * FROM items WHERE job_id = ? ORDER BY idx", job_id)
+        return [dict(row) for row in rows]
+
+    def set_status(self, job_id: str, status: str) -> None:
+        finished_at = time.time() if status == "done" else None
+        self._execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?", status, finished_at, job_id
+        )
+
+    def finish_item(
+        self,
+        job_id: str,
+        index: int,
+        status: str,
+        error: str | None = None,
+        detector_tier: str | None = None,
+        stats: str | None = None,
+    ) -> None:
+        self._execute(
+            "UPDATE items SET status = ?, error = ?, detector_tier = ?, stats = ? "
+            "WHERE job_id = ? AND idx = ?",
+            status,
+            error,
+            detector_tier,
+            stats,
+            job_id,
+            index,
+        )
+
+    def unfinished_jobs(self) -> List[str]:
+        rows = self._execute("SELECT id FROM jobs WHERE status != 'done' ORDER BY created_at")
+        return [row["id"] for row in rows]
+
+    def expired_jobs(self, finished_before: float) -> List[str]:
+        rows = self._execute(
+            "SELECT id FROM jobs WHERE status = 'done' AND finished_at < ?", finished_before
+        )
+        return [row["id"] for row in rows]
+
+    def delete_job(self, job_id: str) -> None:
+        self._execute("DELETE FROM jobs WHERE id = ?", job_id)
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class JobManager:
+    """
+    Accept batches and videos as jobs and process them in the background.
+
+    Submitting stores the uploads on disk and the job in SQLite, then queues
+    the job ID; a fixed number of worker tasks take jobs from the bounded
+    queue and crop their images, or reframe their video, through the
+    ``CropService``. Because both the
+    state and the uploads are on disk, jobs that were queued or running when
+    the server stopped are picked up again by ``start``.
+
+    Every state change bumps a version number and wakes the waiters of
+    ``wait_for_change``, which is what the progress stream is built on.
+
+    Reading and writing uploads and results runs in threads, so that large
+    batches do not stall the event loop; the SQLite statements are small and
+    stay inline.
+    """
+
+    def __init__(
+        self,
+        crop_service: CropService,
+        directory: Path = settings.jobs_dir,
+        workers: int = settings.job_workers,
+        queue_size: int = settings.job_queue_size,
+        concurrency: int = settings.batch_concurrency,
+        ttl_seconds: float = settings.job_ttl_seconds,
+    ):
+        self.crop_service = crop_service
+        self.directory = directory
+        self.workers = workers
+        self.queue_size = queue_size
+        self.concurrency = concurrency
+        self.ttl_seconds = ttl_seconds
+        self.store: JobStore | None = None
+        self._queue: asyncio.Queue[str] | None = None
+        # Queue slots taken by submissions still saving their uploads
+        self._reserved = 0
+        self._tasks: List[asyncio.Task] = []
+        self._changed: asyncio.Condition | None = None
+        self.version = 0
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self) -> None:
+        """Open the database, start the workers and re-queue unfinished jobs."""
+        if self.running:
+            return
+        self.store = JobStore(self.directory / "jobs.sqlite3")
+        # Unbounded, so that every unfinished job can be re-queued; new
+        # submissions are limited to queue_size by _create
+        self._queue = asyncio.Queue()
+        self._changed = asyncio.Condition()
+        for job_id in self.store.unfinished_jobs():
+            self._queue.put_nowait(job_id)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._expire()))
+
+    async def stop(self) -> None:
+        """Stop the workers; interrupted jobs resume on the next start."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    async def submit(
+        self,
+        uploads: List[JobUpload],
+        params: ImageProcessingParams,
+        output: OutputOptions,
+    ) -> str:
+        """
+        Persist a batch and queue it for processing.
+
+        Returns:
+            str: The job ID
+
+        Raises:
+            JobQueueFullError: If the queue is full
+        """
+        return await self._create(
+            "images", uploads, params.model_dump_json(), output.model_dump_json()
+        )
+
+    async def submit_video(self, upload: JobUpload, params: VideoParams) -> str:
+        """
+        Persist a video and queue it for reframing.
+
+        The job has one item, whose result is the reframed MPEG-4 video.
+
+        Returns:
+            str: The job ID
+
+        Raises:
+            JobQueueFullError: If the queue is full
+        """
+        return await self._create("video", [upload], params.model_dump_json(), "{}")
+
+    async def _create(
+        self, kind: JobKind, uploads: List[JobUpload], params: str, output: str
+    ) -> str:
+        if not self.running:
+            raise RuntimeError("The job manager is not running")
+        # Checked and taken before the first await, so that concurrent
+        # submissions cannot all pass the check while saving their uploads
+        if self._queue.qsize() + self._reserved >= self.queue_size:
+            raise JobQueueFullError("Too many jobs are queued, try again later")
+        self._reserved += 1
+
+        job_id = uuid.uuid4().hex
+        try:
+            await asyncio.to_thread(self._save_uploads, job_id, kind, uploads)
+            self.store.create_job(job_id, params, output, uploads, kind)
+        except BaseException:
+            await asyncio.to_thread(shutil.rmtree, self._job_dir(job_id), ignore_errors=True)
+            raise
+        finally:
+            self._reserved -= 1
+        self._queue.put_nowait(job_id)
+        await self._notify()
+        return job_id
+
+    def result_path(self, job_id: str, output_name: str) -> Path:
+        """Location of a processed image of a job."""
+        return self._job_dir(job_id) / "output" / output_name
+
+    async def wait_for_change(self, version: int, timeout: float) -> int:
+        """Wait until the state changes after ``version``; returns the new version."""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: self.version != version), timeout
+                )
+            except asyncio.TimeoutError:
+                pass
+            return self.version
+
+    def _job_dir(self, job_id: str) -> Path:
+        return self.directory / job_id
+
+    def _save_uploads(self, job_id: str, kind: JobKind, uploads: List[JobUpload]) -> None:
+        (self._job_dir(job_id) / "input").mkdir(parents=True)
+        for index, upload in enumerate(uploads):
+            with open(self._input_path(job_id, kind, index, upload.filename), "wb") as f:
+                shutil.copyfileobj(upload.file, f)
+
+    def _input_path(self, job_id: str, kind: JobKind, index: int, filename: str | None) -> Path:
+        name = str(index)
+        if kind == "video":
+            # OpenCV picks the demuxer from the extension
+            name += PurePath(filename or "").suffix or ".mp4"
+        return self._job_dir(job_id) / "input" / name
+
+    async def _notify(self) -> None:
+        async with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id)
+            except Exception:
+                # Left unfinished, so the job is picked up again on the next start
+                logger.exception("Job %s failed", job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _expire(self) -> None:
+        while True:
+            try:
+                await self._remove_expired()
+            except Exception:
+                logger.exception("Removing expired jobs failed")
+            await asyncio.sleep(min(self.ttl_seconds, _EXPIRY_INTERVAL_SECONDS))
+
+    async def _run_job(self, job_id: str) -> None:
+        job = self.store.get_job(job_id)
+        if job is None:
+            return
+        self.store.set_status(job_id, "running")
+        await self._notify()
+
+        pending = [item for item in self.store.get_items(job_id) if item["status"] == "pending"]
+        if job["kind"] == "video":
+            params = VideoParams.model_validate_json(job["params"])
+            for item in pending:
+                await self._run_video(job_id, item, params)
+        else:
+            params = ImageProcessingParams.model_validate_json(job["params"])
+            output = OutputOptions.model_validate_json(job["output"])
+            semaphore = asyncio.Semaphore(self.concurrency)
+
+            async def run(item: dict) -> None:
+                async with semaphore:
+                    await self._run_item(job_id, item, params, output)
+
+            await asyncio.gather(*(run(item) for item in pending))
+
+        await asyncio.to_thread(
+            shutil.rmtree, self._job_dir(job_id) / "input", ignore_errors=True
+        )
+        self.store.set_status(job_id, "done")
+        await self._notify()
+
+    async def _run_item(
+        self,
+        job_id: str,
+        item: dict,
+        params: ImageProcessingParams,
+        output: OutputOptions,
+    ) -> None:
+        source = self._job_dir(job_id) / "input" / str(item["idx"])
+        target = self.result_path(job_id, item["output_name"])
+        try:
+            data = await asyncio.to_thread(source.read_bytes)
+            result = await self.crop_service.crop(data, params, output)
+            await asyncio.to_thread(_write_file, target, result.content)
+        except ImageProcessingError as e:
+            self.store.finish_item(job_id, item["idx"], "error", error=str(e))
+        except Exception as e:
+            self.store.finish_item(
+                job_id, item["idx"], "error", error=f"An unexpected error occurred: {str(e)}"
+            )
+        else:
+            self.store.finish_item(
+                job_id, item["idx"], "ok", detector_tier=result.detection.tier
+            )
+        await asyncio.to_thread(source.unlink, missing_ok=True)
+        await self._notify()
+
+    async def _run_video(self, job_id: str, item: dict, params: VideoParams) -> None:
+        source = self._input_path(job_id, "video", item["idx"], item["filename"])
+        target = self.result_path(job_id, item["output_name"])
+        try:
+            await asyncio.to_thread(target.parent.mkdir, parents=True, exist_ok=True)
+            stats = await self.crop_service.video(str(source), str(target), params)
+        except ImageProcessingError as e:
+            self.store.finish_item(job_id, item["idx"], "error", error=str(e))
+        except Exception as e:
+            self.store.finish_item(
+                job_id, item["idx"], "error", error=f"An unexpected error occurred: {str(e)}"
+            )
+        else:
+            summary = {**stats._asdict(), "frames_per_second": stats.frames_per_second}
+            self.store.finish_item(job_id, item["idx"], "ok", stats=json.dumps(summary))
+        await asyncio.to_thread(source.unlink, missing_ok=True)
+        await self._notify()
+
+    async def _remove_expired(self) -> None:
+        for job_id in self.store.expired_jobs(time.time() - self.ttl_seconds):
+            await asyncio.to_thread(shutil.rmtree, self._job_dir(job_id), ignore_errors=True)
+            self.store.delete_job(job_id)
+            await self._notify()
+
+
+def _write_file(path: Path, content: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
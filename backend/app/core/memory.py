@@ -0,0 +1,168 @@
+"""
+Opt-in peak-memory accounting of pipeline tasks.
+
+``trace_memory`` runs a task under ``tracemalloc`` and reports its peak
+memory, overall and per pipeline stage. The peak adds up two parts:
+
+- the traced allocations: Python objects, ``BytesIO`` buffers, encoded
+  bytes, and NumPy and OpenCV arrays;
+- Pillow's image buffers, which are allocated outside Python's allocator
+  where tracemalloc cannot see them. They are counted from the block
+  statistics of Pillow's memory arena, with the block size lowered to
+  ``_PILLOW_BLOCK_BYTES`` while tracing. Within a stage, every block
+  allocated counts as live until the stage ends, so this part is an upper
+  bound.
+
+The pipeline also reports its large buffers (decoded images, detection
+planes, crops, encoded output) with ``track``; the largest per stage is part
+of the report.
+
+Tracing slows a task down severalfold, so it only runs for requests that
+ask for it. tracemalloc and Pillow's statistics are process-wide, so only
+one task per process is traced at a time; others wait for it. Untraced
+tasks running meanwhile (in thread mode) still add their allocations to the
+traced task's report, which is then too high.
+"""
+
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, NamedTuple
+
+import numpy as np
+from PIL import Image
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# Whether the request being handled asked for memory accounting
+current_trace: ContextVar[bool] = ContextVar("current_trace", default=False)
+
+# Pillow arena block size while tracing; small enough for block counts to
+# measure images closely, large enough to hold an image line of any width
+_PILLOW_BLOCK_BYTES = 1024 * 1024
+
+_state = threading.local()
+# Held for the whole of a trace, since the counters it reads are process-wide
+_tracing_lock = threading.Lock()
+
+
+class MemoryReport(NamedTuple):
+    """Memory used by one pipeline task, in bytes."""
+
+    peak_bytes: int
+    stage_peaks: Dict[str, int]
+    largest_buffers: Dict[str, int]
+
+    def header(self) -> str:
+        """The report as an X-Memory-Usage header value, in kilobytes."""
+        entries = [f"peak;kb={self.peak_bytes // 1024}"]
+        for name, peak in self.stage_peaks.items():
+            largest = self.largest_buffers.get(name, 0)
+            entries.append(f"{name};kb={peak // 1024};largest-kb={largest // 1024}")
+        return ", ".join(entries)
+
+
+def _pillow_blocks() -> tuple[int, int]:
+    """Blocks taken from Pillow's arena so far, and blocks given back to it."""
+    stats = Image.core.get_stats()
+    return stats["allocated_blocks"] + stats["reused_blocks"], stats["freed_blocks"]
+
+
+class _Tracer:
+    """Folds the tracemalloc and Pillow peaks into the running stage at every stage boundary."""
+
+    def __init__(self):
+        self.baseline = tracemalloc.get_traced_memory()[0]
+        taken, self.freed = _pillow_blocks()
+        self.pillow_baseline = taken - self.freed
+        self.peak = 0
+        self.stage_peaks: Dict[str, int] = {}
+        self.largest_buffers: Dict[str, int] = {}
+        self.stages: List[str] = []
+        tracemalloc.reset_peak()
+
+    def enter(self, name: str) -> None:
+        self.fold()
+        self.stages.append(name)
+
+    def exit(self) -> None:
+        self.fold()
+        self.stages.pop()
+
+    def fold(self) -> None:
+        taken, freed = _pillow_blocks()
+        # Blocks live when the interval started plus every block taken during it
+        pillow_peak = max(0, taken - self.freed - self.pillow_baseline)
+        self.freed = freed
+        peak = max(0, tracemalloc.get_traced_memory()[1] - self.baseline)
+        peak += pillow_peak * _PILLOW_BLOCK_BYTES
+        self.peak = max(self.peak, peak)
+        if self.stages:
+            name = self.stages[-1]
+            self.stage_peaks[name] = max(self.stage_peaks.get(name, 0), peak)
+        tracemalloc.reset_peak()
+
+    def track(self, size: int) -> None:
+        name = self.stages[-1] if self.stages else "other"
+        self.largest_buffers[name] = max(self.largest_buffers.get(name, 0), size)
+
+    def report(self) -> MemoryReport:
+        self.fold()
+        return MemoryReport(self.peak, self.stage_peaks, self.largest_buffers)
+
+
+@contextmanager
+def trace_memory() -> Iterator[List[MemoryReport]]:
+    """
+    Trace the allocations made on this thread while the block runs.
+
+    Waits for any other trace in the process to finish first. Yields a list
+    that holds the ``MemoryReport`` once the block has exited.
+    """
+    with _tracing_lock:
+        tracemalloc.start()
+        block_size = Image.core.get_block_size()
+        Image.core.set_block_size(_PILLOW_BLOCK_BYTES)
+        tracer = _Tracer()
+        _state.tracer = tracer
+        metrics.set_stage_listener(tracer)
+        reports: List[MemoryReport] = []
+        try:
+            yield reports
+        finally:
+            reports.append(tracer.report())
+            metrics.set_stage_listener(None)
+            _state.tracer = None
+            Image.core.set_block_size(block_size)
+            tracemalloc.stop()
+
+
+def track(buffer) -> None:
+    """Report a large buffer (image, array or bytes) to the active trace, if any."""
+    tracer = getattr(_state, "tracer", None)
+    if tracer is None:
+        return
+    if isinstance(buffer, np.ndarray):
+        size = buffer.nbytes
+    elif isinstance(buffer, Image.Image):
+        size = buffer.width * buffer.height * len(buffer.getbands())
+    else:
+        size = len(buffer)
+    tracer.track(size)
+
+
+def record(task_name: str, report: MemoryReport) -> None:
+    """Feed a task's memory report into the log, the metrics and the current request."""
+    logger.info("Memory used by %s: %s", task_name, report.header())
+    metrics.MEMORY_PEAK_BYTES.observe(report.peak_bytes, stage="total")
+    for name, peak in report.stage_peaks.items():
+        metrics.MEMORY_PEAK_BYTES.observe(peak, stage=name)
+    for name, size in report.largest_buffers.items():
+        metrics.MEMORY_BUFFER_BYTES.observe(size, stage=name)
+    timer = metrics.current_request.get()
+    if timer is not None:
+        timer.memory = report
@@ -0,0 +1,374 @@
+"""
+Minimal Prometheus-style metrics and per-request stage timing.
+
+Metrics live in a process-wide registry and are rendered in the Prometheus
+text exposition format by ``render``. Pipeline code marks its stages with
+``stage(name)``; stage durations are collected per task by the execution
+engine (also inside process workers) and fed back into the ``stage_seconds``
+histogram and the current request's ``Server-Timing`` breakdown.
+"""
+
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        header = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        return header + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    A monotonically increasing count.
+
+    Counts kept by other objects, such as cache hit counters, can be read
+    from callbacks at scrape time instead of being incremented here.
+    """
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = defaultdict(float)
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] += amount
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def value(self, **labels: str) -> float:
+        key = self._key(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0.0)
+
+    def _samples(self) -> List[str]:
+        values = dict(self._values)
+        values.update({key: function() for key, function in self._functions.items()})
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, set directly or read from callbacks at scrape time."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def _samples(self) -> List[str]:
+        values = dict(self._values)
+        values.update({key: function() for key, function in self._functions.items()})
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum and count."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Sequence[float],
+        labels: Sequence[str] = (),
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = defaultdict(float)
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+            self._sums[key] += value
+
+    def count(self, **labels: str) -> int:
+        counts = self._counts.get(self._key(labels))
+        return counts[-1] if counts else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, counts in sorted(self._counts.items()):
+            for bound, count in zip(self.buckets, counts):
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {count}"
+                )
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(self._sums[key])}")
+            lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    """The set of metrics exposed by ``/metrics``."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+REQUESTS = REGISTRY.register(
+    Counter("face_cropper_requests_total", "HTTP requests handled", ["method", "endpoint", "status"])
+)
+REQUEST_SECONDS = REGISTRY.register(
+    Histogram(
+        "face_cropper_request_seconds",
+        "Time to the start of the HTTP response",
+        _LATENCY_BUCKETS,
+        ["endpoint"],
+    )
+)
+STAGE_SECONDS = REGISTRY.register(
+    Histogram(
+        "face_cropper_stage_seconds",
+        "Time spent in each processing stage",
+        _LATENCY_BUCKETS,
+        ["stage"],
+    )
+)
+UPLOAD_BYTES = REGISTRY.register(
+    Histogram(
+        "face_cropper_upload_bytes",
+        "Size of uploaded images",
+        [2**n for n in range(14, 28)],
+    )
+)
+IMAGE_MEGAPIXELS = REGISTRY.register(
+    Histogram(
+        "face_cropper_image_megapixels",
+        "Resolution of processed images",
+        (0.5, 1, 2, 4, 8, 12, 16, 24, 32, 48, 64, 100),
+    )
+)
+FACES_DETECTED = REGISTRY.register(
+    Histogram(
+        "face_cropper_faces_detected",
+        "Number of faces found per image",
+        (0, 1, 2, 3, 5, 10, 20, 50),
+    )
+)
+DETECTIONS = REGISTRY.register(
+    Counter(
+        "face_cropper_detections_total",
+        "Images detected by the detector tier that found their faces, none if no tier did",
+        ["tier"],
+    )
+)
+VIDEO_FRAMES_PER_SECOND = REGISTRY.register(
+    Histogram(
+        "face_cropper_video_frames_per_second",
+        "Processing throughput of reframed videos",
+        (5, 10, 25, 50, 100, 250, 500, 1000),
+    )
+)
+ERRORS = REGISTRY.register(
+    Counter("face_cropper_errors_total", "Processing failures by error class", ["error"])
+)
+MEMORY_PEAK_BYTES = REGISTRY.register(
+    Histogram(
+        "face_cropper_memory_peak_bytes",
+        "Peak traced allocations of memory-traced tasks, overall and per stage",
+        [2**n for n in range(16, 32)],
+        ["stage"],
+    )
+)
+MEMORY_BUFFER_BYTES = REGISTRY.register(
+    Histogram(
+        "face_cropper_memory_largest_buffer_bytes",
+        "Largest image, array or byte buffer of memory-traced tasks per stage",
+        [2**n for n in range(16, 32)],
+        ["stage"],
+    )
+)
+ADMISSIONS = REGISTRY.register(
+    Counter(
+        "face_cropper_admissions_total",
+        "Processing requests admitted, shed on overload, or expired before their work started",
+        ["outcome"],
+    )
+)
+ADMISSION_SLOTS = REGISTRY.register(
+    Gauge(
+        "face_cropper_admission_requests",
+        "Processing requests holding or waiting for an admission slot",
+        ["state"],
+    )
+)
+ENGINE_TASKS = REGISTRY.register(
+    Gauge(
+        "face_cropper_engine_tasks",
+        "Pipeline tasks submitted to the execution engine",
+        ["state"],
+    )
+)
+CACHE_EVENTS = REGISTRY.register(
+    Counter(
+        "face_cropper_cache_events_total",
+        "Result cache hits, misses and evictions since start",
+        ["cache", "event"],
+    )
+)
+CACHE_BYTES = REGISTRY.register(
+    Gauge("face_cropper_cache_bytes", "Bytes held by each result cache", ["cache"])
+)
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return REGISTRY.render()
+
+
+# Stage timing ---------------------------------------------------------------
+
+StageTimings = List[Tuple[str, float]]
+
+_collector = threading.local()
+
+
+class RequestTimer:
+    """Stage durations of one HTTP request, reported in its Server-Timing header."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.memory = None  # A MemoryReport, for requests that asked for one
+
+    def add(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def header(self) -> str:
+        """The stages as a Server-Timing header value, durations in milliseconds."""
+        stages = {**self.stages, "total": self.elapsed()}
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages.items())
+
+
+current_request: ContextVar[RequestTimer | None] = ContextVar("current_request", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time a pipeline stage, if a collector is active on this thread."""
+    timings = getattr(_collector, "timings", None)
+    listener = getattr(_collector, "listener", None)
+    if timings is None and listener is None:
+        yield
+        return
+    if listener is not None:
+        listener.enter(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings.append((name, time.perf_counter() - start))
+        if listener is not None:
+            listener.exit()
+
+
+def set_stage_listener(listener) -> None:
+    """Notify ``listener.enter(name)`` and ``listener.exit()`` around this thread's stages."""
+    _collector.listener = listener
+
+
+@contextmanager
+def collect_stages() -> Iterator[StageTimings]:
+    """Collect the stages timed on this thread while the block runs."""
+    previous = getattr(_collector, "timings", None)
+    _collector.timings = timings = []
+    try:
+        yield timings
+    finally:
+        _collector.timings = previous
+
+
+def record_stage(name: str, seconds: float) -> None:
+    """Feed a stage duration into the histogram and the current request's timer."""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timer = current_request.get()
+    if timer is not None:
+        timer.add(name, seconds)
@@ -0,0 +1,226 @@
+"""Pipeline tasks executed inside ProcessingEngine workers."""
+
+import os
+from pathlib import Path
+from typing import BinaryIO, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .encoding import OutputOptions, encode_image
+from .image_processor import (
+    Detection,
+    ImageProcessingError,
+    ImageProcessingParams,
+    ImageProcessor,
+    Rendition,
+    processing_errors,
+    select_faces,
+)
+from .metrics import stage
+from .video import VideoParams, VideoReframer, VideoStats
+
+# How far the preview's aspect ratio may be off the original's, from rounding its size
+_PREVIEW_RATIO_TOLERANCE = 0.03
+
+
+def detect_task(processor: ImageProcessor, image_data: BinaryIO) -> Detection:
+    """Decode an image and detect the faces in it."""
+    with processing_errors():
+        with stage("decode"):
+            image = processor.load_image(image_data)
+        with stage("detect"):
+            return processor.detect(image)
+
+
+def crop_task(
+    processor: ImageProcessor,
+    image_data: BinaryIO,
+    params: ImageProcessingParams,
+    output: OutputOptions = OutputOptions(),
+    detection: Detection | None = None,
+) -> tuple[Detection, bytes]:
+    """
+    Detect, crop and encode an image.
+
+    When a previous detection for the same image is given, the cascade is skipped.
+
+    Returns:
+        tuple[Detection, bytes]: The detection used for the crop and the encoded output
+    """
+    with processing_errors():
+        with stage("decode"):
+            image = processor.load_image(image_data)
+        if detection is None:
+            with stage("detect"):
+                detection = processor.detect(image)
+        processed_image = processor.crop_faces(image, detection.faces, params)
+        with stage("encode"):
+            return detection, encode_image(processed_image, output)
+
+
+def crop_to_file_task(
+    processor: ImageProcessor,
+    image_data: BinaryIO,
+    params: ImageProcessingParams,
+    output: OutputOptions,
+    target: str,
+) -> tuple[Detection, int]:
+    """
+    Detect, crop and encode an image, writing the result straight to ``target``.
+
+    The file is written under a temporary name and renamed into place, so
+    readers never see a partial image.
+
+    Returns:
+        tuple[Detection, int]: The detection and the number of bytes written
+    """
+    detection, content = crop_task(processor, image_data, params, output)
+    temporary = Path(target).with_name(f".{Path(target).name}.tmp")
+    temporary.write_bytes(content)
+    os.replace(temporary, target)
+    return detection, len(content)
+
+
+def geometry_task(
+    processor: ImageProcessor,
+    image_data: BinaryIO,
+    params: ImageProcessingParams,
+    original_size: Tuple[int, int],
+    detection: Detection | None = None,
+) -> tuple[Detection, np.ndarray, Tuple[int, int, int, int]]:
+    """
+    Locate the faces and the crop of an image from a downscaled preview of it.
+
+    Detection runs on the preview; its face boxes are scaled up to the
+    original's size and the crop is planned there, so that the client can
+    cut the crop from the original itself. No pixels are encoded.
+
+    Args:
+        original_size (Tuple[int, int]): Width and height of the original image
+        detection (Detection | None): A previous detection of the same preview
+
+    Returns:
+        tuple: The preview's detection, the face boxes and the crop
+            (start_x, start_y, end_x, end_y) in original coordinates
+
+    Raises:
+        ImageProcessingError: If the preview cannot be decoded or does not have
+            the original's aspect ratio
+    """
+    with processing_errors():
+        if detection is None:
+            with stage("decode"):
+                image = processor.load_image(image_data)
+            with stage("detect"):
+                detection = processor.detect(image)
+
+    width, height = original_size
+    scale_x, scale_y = width / detection.width, height / detection.height
+    if abs(scale_x / scale_y - 1) > _PREVIEW_RATIO_TOLERANCE:
+        raise ImageProcessingError(
+            f"The preview ({detection.width}x{detection.height}) does not have "
+            f"the aspect ratio of the original ({width}x{height})"
+        )
+    faces = np.rint(detection.faces * np.array([scale_x, scale_y, scale_x, scale_y]))
+    faces = processor._rescale_faces(faces, 1.0, (height, width))
+    return detection, faces, processor.crop_box((height, width), faces, params)
+
+
+def renditions_task(
+    processor: ImageProcessor,
+    image_data: BinaryIO,
+    renditions: List[Rendition],
+    zoom: float,
+    output: OutputOptions = OutputOptions(),
+    detection: Detection | None = None,
+) -> tuple[Detection, List[bytes]]:
+    """
+    Produce several renditions of an image from one decode and one detection.
+
+    Each aspect ratio is cropped once and every requested width is resized from
+    that crop.
+
+    Returns:
+        tuple[Detection, List[bytes]]: The detection and the encoded renditions,
+            in the order they were requested
+    """
+    with processing_errors():
+        with stage("decode"):
+            image = processor.load_image(image_data)
+        if detection is None:
+            with stage("detect"):
+                detection = processor.detect(image)
+
+        crops: dict = {}
+        encoded = []
+        for rendition in renditions:
+            crop = crops.get(rendition.aspect_ratio)
+            if crop is None:
+                params = ImageProcessingParams(aspect_ratio=rendition.aspect_ratio, zoom=zoom)
+                crop = crops[rendition.aspect_ratio] = processor.crop_faces(
+                    image, detection.faces, params
+                )
+            with stage("resize"):
+                resized = _resize_to_width(crop, rendition.width)
+            with stage("encode"):
+                encoded.append(encode_image(resized, output))
+        return detection, encoded
+
+
+def faces_task(
+    processor: ImageProcessor,
+    image_data: BinaryIO,
+    params: ImageProcessingParams,
+    min_relative_size: float,
+    output: OutputOptions = OutputOptions(),
+    detection: Detection | None = None,
+) -> tuple[Detection, List[tuple[np.ndarray, bytes]]]:
+    """
+    Crop every distinct face of an image, from one decode and one detection.
+
+    Overlapping detections are merged and faces whose side is below
+    ``min_relative_size`` of the largest face's are dropped (see ``select_faces``).
+
+    Returns:
+        tuple[Detection, List[tuple[np.ndarray, bytes]]]: The detection and, for
+            each kept face from largest to smallest, its box and encoded crop
+    """
+    with processing_errors():
+        with stage("decode"):
+            image = processor.load_image(image_data)
+        if detection is None:
+            with stage("detect"):
+                detection = processor.detect(image)
+
+        crops = []
+        for face in select_faces(detection.faces, min_relative_size=min_relative_size):
+            crop = processor.crop_faces(image, face.reshape(1, 4), params)
+            with stage("encode"):
+                crops.append((face, encode_image(crop, output)))
+        return detection, crops
+
+
+def video_task(
+    processor: ImageProcessor, source: str, destination: str, params: VideoParams
+) -> VideoStats:
+    """
+    Reframe the video at ``source`` around the main face, writing MPEG-4 to ``destination``.
+
+    Run with ``ProcessingEngine.run_path``: OpenCV only reads and writes videos
+    by path, so neither file passes through memory as a whole. The output has
+    no audio track, as OpenCV's writer only writes video.
+
+    Returns:
+        VideoStats: Frame counts, output size and throughput
+    """
+    with processing_errors():
+        return VideoReframer(processor).reframe(source, destination, params)
+
+
+def _resize_to_width(image: Image.Image, width: int | None) -> Image.Image:
+    """Downscale to the target width, keeping the aspect ratio; never upscales."""
+    if not width or width >= image.width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
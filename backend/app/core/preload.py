@@ -0,0 +1,10 @@
+"""
+Imported by the process pool's fork server before it forks any worker.
+
+Loading the face detection model here means every worker process starts
+with it already in memory, shared copy-on-write with the fork server.
+"""
+
+from .engine import preload_processor
+
+preload_processor()
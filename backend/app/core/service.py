@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import json
+import time
+from typing import Awaitable, Callable, Hashable, List, NamedTuple, TypeVar
+
+import numpy as np
+
+from . import metrics
+from .admission import DeadlineExceededError, current_deadline
+from .cache import LRUCache, SingleFlight
+from .config import settings
+from .encoding import OutputOptions
+from .engine import ProcessingEngine
+from .image_processor import Detection, ImageProcessingParams, Rendition
+from .image_store import ImageStore
+from .pipeline import (
+    crop_task,
+    detect_task,
+    faces_task,
+    geometry_task,
+    renditions_task,
+    video_task,
+)
+from .video import VideoParams, VideoStats
+
+T = TypeVar("T")
+
+# Rough per-entry bookkeeping cost on top of the payload, used for cache sizing
+_ENTRY_OVERHEAD = 256
+
+# Bump whenever a pipeline change alters the output for the same input and parameters
+PROCESSOR_VERSION = "3"
+
+
+class CropResult(NamedTuple):
+    """Encoded crop and the detection it was computed from."""
+
+    content: bytes
+    detection: Detection
+
+
+def content_hash(data: bytes) -> str:
+    """Content address of an uploaded image."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _observe(detection: Detection) -> None:
+    """Record the size, face count and detector tier of an image the pipeline just processed."""
+    metrics.IMAGE_MEGAPIXELS.observe(detection.width * detection.height / 1_000_000)
+    metrics.FACES_DETECTED.observe(len(detection.faces))
+    metrics.DETECTIONS.inc(tier=detection.tier or "none")
+
+
+def output_etag(
+    digest: str, params: ImageProcessingParams, output: OutputOptions
+) -> str:
+    """
+    Strong ETag of a crop, computable before (and without) running the pipeline.
+
+    It covers the input content hash, the parameters, the output encoding, the
+    processor version and the detection settings that change the result.
+    """
+    fingerprint = json.dumps(
+        [
+            PROCESSOR_VERSION,
+            settings.detector_tiers,
+            settings.detection_max_edge,
+            settings.min_face_fraction,
+            settings.face_overlap_threshold,
+            settings.min_relative_face_size,
+            digest,
+            params.model_dump(mode="json"),
+            output.model_dump(mode="json"),
+        ],
+        sort_keys=True,
+    )
+    return f'"{hashlib.sha256(fingerprint.encode()).hexdigest()[:32]}"'
+
+
+class CropService:
+    """
+    Entry point of the API into the processing pipeline.
+
+    Results are cached in two tiers: detections by content hash, so a re-upload
+    with different settings skips face detection, and encoded outputs by content
+    hash plus parameters, so an identical request skips the pipeline entirely.
+    Concurrent identical requests share one computation.
+
+    Uploads can also be kept server-side (see ``detect``) and cropped later by
+    token, so interactive re-cropping does not re-send the image.
+    """
+
+    def __init__(
+        self,
+        engine: ProcessingEngine,
+        detection_cache_bytes: int = settings.detection_cache_bytes,
+        output_cache_bytes: int = settings.output_cache_bytes,
+        image_store: ImageStore | None = None,
+    ):
+        self.engine = engine
+        self.detections: LRUCache[Detection] = LRUCache(detection_cache_bytes)
+        self.outputs: LRUCache[CropResult] = LRUCache(output_cache_bytes)
+        self.flights = SingleFlight()
+        self.images = image_store or ImageStore(
+            settings.image_store_bytes, settings.image_store_ttl_seconds
+        )
+
+    async def detect(self, data: bytes) -> tuple[str | None, Detection]:
+        """
+        Detect faces and keep the upload server-side for later crops.
+
+        Returns:
+            tuple[str | None, Detection]: The image token, or None if the upload
+                is too large for the image store, and the detection
+        """
+        digest = content_hash(data)
+        detection = self.detections.get(digest)
+        if detection is None:
+            detection = await self._shared(
+                ("detect", digest), lambda: self.engine.run(detect_task, data)
+            )
+            _observe(detection)
+            self._remember_detection(digest, detection)
+
+        if not self.images.put(digest, data, detection):
+            return None, detection
+        return digest, detection
+
+    async def geometry(
+        self, data: bytes, params: ImageProcessingParams, original_size: tuple[int, int]
+    ) -> tuple[Detection, np.ndarray, tuple[int, int, int, int]]:
+        """
+        Plan the crop of an original image from a preview of it; see ``geometry_task``.
+
+        Detections are cached by the preview's content, so changing the
+        parameters for the same preview skips detection.
+        """
+        digest = content_hash(data)
+        cached = self.detections.get(digest)
+        detection, faces, box = await self.engine.run(
+            geometry_task, data, params, original_size, cached
+        )
+        if cached is None:
+            _observe(detection)
+            self._remember_detection(digest, detection)
+        return detection, faces, box
+
+    async def crop_stored(
+        self,
+        token: str,
+        params: ImageProcessingParams,
+        output: OutputOptions = OutputOptions(),
+    ) -> CropResult | None:
+        """Crop an image kept by ``detect``; returns None for unknown or expired tokens."""
+        stored = self.images.get(token)
+        if stored is None:
+            return None
+        # Passed on directly: the detection cache may be disabled or have evicted it
+        return await self.crop(
+            stored.data, params, output, digest=token, detection=stored.detection
+        )
+
+    async def crop(
+        self,
+        data: bytes,
+        params: ImageProcessingParams,
+        output: OutputOptions = OutputOptions(),
+        digest: str | None = None,
+        detection: Detection | None = None,
+    ) -> CropResult:
+        """
+        Return the encoded crop of an image, computing it at most once.
+
+        Detection is skipped when ``detection`` is given or cached for the image.
+        """
+        digest = digest or content_hash(data)
+        key = (digest, params.model_dump_json(), output.model_dump_json())
+
+        result = self.outputs.get(key)
+        if result is not None:
+            return result
+
+        async def compute() -> CropResult:
+            known = detection or self.detections.get(digest)
+            used, content = await self.engine.run(crop_task, data, params, output, known)
+            _observe(used)
+            self._remember_detection(digest, used)
+            result = CropResult(content, used)
+            self.outputs.put(key, result, len(content) + _ENTRY_OVERHEAD)
+            return result
+
+        return await self._shared(key, compute)
+
+    async def renditions(
+        self,
+        data: bytes,
+        renditions: List[Rendition],
+        zoom: float,
+        output: OutputOptions = OutputOptions(),
+    ) -> tuple[Detection, List[bytes]]:
+        """Encode every requested rendition of an image from a single decode and detection."""
+        digest = content_hash(data)
+        detection, encoded = await self.engine.run(
+            renditions_task, data, renditions, zoom, output, self.detections.get(digest)
+        )
+        _observe(detection)
+        self._remember_detection(digest, detection)
+        return detection, encoded
+
+    async def faces(
+        self,
+        data: bytes,
+        params: ImageProcessingParams,
+        min_relative_size: float = settings.min_relative_face_size,
+        output: OutputOptions = OutputOptions(),
+    ) -> tuple[Detection, List[tuple[np.ndarray, bytes]]]:
+        """Encode one crop per distinct face from a single decode and detection."""
+        digest = content_hash(data)
+        detection, crops = await self.engine.run(
+            faces_task, data, params, min_relative_size, output, self.detections.get(digest)
+        )
+        _observe(detection)
+        self._remember_detection(digest, detection)
+        return detection, crops
+
+    async def video(self, source: str, destination: str, params: VideoParams) -> VideoStats:
+        """Reframe a video file around the main face into another file; videos are not cached."""
+        stats = await self.engine.run_path(video_task, source, destination, params)
+        metrics.VIDEO_FRAMES_PER_SECOND.observe(stats.frames_per_second)
+        return stats
+
+    async def _shared(self, key: Hashable, compute: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run ``compute`` once for all concurrent callers of ``key``, each held to its own deadline.
+
+        The shared computation serves callers with different deadlines, so it
+        runs without one; each caller instead stops waiting when its own
+        deadline (``admission.current_deadline``) passes. Once every caller
+        has stopped waiting, the computation is cancelled.
+
+        Raises:
+            DeadlineExceededError: If this caller's deadline passed first
+        """
+        deadline = current_deadline.get()
+
+        async def undated() -> T:
+            # Runs in a task of its own, so this does not touch the caller's context
+            current_deadline.set(None)
+            return await compute()
+
+        if deadline is None:
+            return await self.flights.run(key, undated)
+        try:
+            return await asyncio.wait_for(
+                self.flights.run(key, undated), max(0.0, deadline - time.time())
+            )
+        except asyncio.TimeoutError:
+            metrics.ADMISSIONS.inc(outcome="expired")
+            raise DeadlineExceededError("Deadline exceeded while waiting for the result")
+
+    def _remember_detection(self, digest: str, detection: Detection) -> None:
+        self.detections.put(digest, detection, detection.faces.nbytes + _ENTRY_OVERHEAD)
+
+    def stats(self) -> dict:
+        """Cache counters, for tuning the cache budgets."""
+        return {
+            "detections": self.detections.stats(),
+            "outputs": self.outputs.stats(),
+            "images": self.images.stats(),
+            "coalesced": self.flights.coalesced,
+        }
@@ -0,0 +1,236 @@
+"""Face-following reframing of videos and frame sequences."""
+
+import time
+from typing import List, NamedTuple, Tuple
+
+import cv2
+import numpy as np
+from pydantic import BaseModel, Field
+
+from .config import settings
+from .image_processor import AspectRatio, ImageProcessingError, ImageProcessor, select_faces
+from .metrics import stage
+
+# Side of the thumbnails compared to detect scene cuts
+_SCENE_THUMBNAIL = (64, 64)
+
+Point = Tuple[float, float]
+
+
+class VideoParams(BaseModel):
+    """Parameters for reframing a video."""
+
+    aspect_ratio: AspectRatio = Field(
+        default=AspectRatio.PORTRAIT,
+        description="Aspect ratio of the output video",
+    )
+    zoom: float = Field(
+        default=0.0,
+        ge=0.0,
+        le=1.0,
+        description="0.0 uses the largest window of the aspect ratio that fits the frame, "
+        "1.0 half of it",
+    )
+    keyframe_interval: int = Field(
+        default=settings.video_keyframe_interval,
+        ge=1,
+        description="Run face detection on every n-th frame",
+    )
+    scene_threshold: float = Field(
+        default=settings.video_scene_threshold,
+        gt=0.0,
+        le=1.0,
+        description="Mean absolute frame difference (0-1) treated as a scene cut",
+    )
+    smoothing: float = Field(
+        default=settings.video_smoothing,
+        gt=0.0,
+        le=1.0,
+        description="Weight of the new position when smoothing the window (1.0 disables it)",
+    )
+
+
+class VideoStats(NamedTuple):
+    """Summary of a reframed video."""
+
+    frames: int
+    keyframes: int
+    scene_cuts: int
+    width: int
+    height: int
+    fps: float
+    seconds: float
+
+    @property
+    def frames_per_second(self) -> float:
+        """Processing throughput."""
+        return self.frames / self.seconds if self.seconds else 0.0
+
+
+class VideoReframer:
+    """
+    Crop a video to a fixed-size window that follows the main face.
+
+    Faces are only detected on keyframes: every ``keyframe_interval`` frames
+    and on scene cuts. Frames in between are held back until the next
+    keyframe so that the window centre can be interpolated between the two
+    detections; it is then smoothed over time with an exponential moving
+    average that is reset on every cut. At most ``keyframe_interval`` decoded
+    frames are buffered at any time.
+
+    Sources are anything ``cv2.VideoCapture`` opens, including frame sequences
+    given as a printf-style pattern such as ``frames/%04d.png``.
+    """
+
+    def __init__(self, processor: ImageProcessor):
+        self.processor = processor
+
+    def reframe(self, source: str, destination: str, params: VideoParams) -> VideoStats:
+        """
+        Write the reframed video to ``destination`` as MPEG-4.
+
+        Raises:
+            ImageProcessingError: If the source cannot be read or the output cannot be written
+        """
+        start = time.perf_counter()
+        capture = cv2.VideoCapture(source)
+        if not capture.isOpened():
+            raise ImageProcessingError("Invalid video format: could not open the video")
+
+        try:
+            ok, frame = capture.read()
+            if not ok:
+                raise ImageProcessingError("Invalid video format: the video has no frames")
+
+            fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+            height, width = frame.shape[:2]
+            window = _window_size(width, height, params)
+            writer = cv2.VideoWriter(destination, cv2.VideoWriter_fourcc(*"mp4v"), fps, window)
+            if not writer.isOpened():
+                raise ImageProcessingError("Could not create the output video")
+
+            try:
+                counts = self._reframe_frames(capture, frame, writer, window, params)
+            finally:
+                writer.release()
+        finally:
+            capture.release()
+
+        frames, keyframes, scene_cuts = counts
+        return VideoStats(
+            frames, keyframes, scene_cuts, *window, fps, time.perf_counter() - start
+        )
+
+    def _reframe_frames(
+        self,
+        capture: cv2.VideoCapture,
+        frame: np.ndarray,
+        writer: cv2.VideoWriter,
+        window: Tuple[int, int],
+        params: VideoParams,
+    ) -> Tuple[int, int, int]:
+        """Crop and write every frame; returns the frame, keyframe and scene cut counts."""
+        frame_shape = frame.shape[:2]
+        smoothed: Point | None = None
+
+        def emit(frame: np.ndarray, target: Point) -> None:
+            nonlocal smoothed
+            if smoothed is not None:
+                target = _interpolate(smoothed, target, params.smoothing)
+            smoothed = target
+            with stage("encode"):
+                writer.write(_crop_window(frame, target, window))
+
+        index = keyframes = scene_cuts = 0
+        last_key_index = 0
+        last_center: Point = (frame_shape[1] / 2, frame_shape[0] / 2)
+        previous_thumbnail = None
+        pending: List[np.ndarray] = []
+
+        while True:
+            thumbnail = _scene_thumbnail(frame)
+            cut = (
+                previous_thumbnail is not None
+                and _frame_difference(previous_thumbnail, thumbnail) > params.scene_threshold
+            )
+            previous_thumbnail = thumbnail
+
+            if index == 0 or cut or index - last_key_index >= params.keyframe_interval:
+                with stage("detect"):
+                    center = self._face_center(frame) or last_center
+                keyframes += 1
+
+                if cut:
+                    # Hold the old position up to the cut and jump without smoothing
+                    scene_cuts += 1
+                    for held in pending:
+                        emit(held, last_center)
+                    smoothed = None
+                else:
+                    steps = len(pending) + 1
+                    for offset, buffered in enumerate(pending, start=1):
+                        emit(buffered, _interpolate(last_center, center, offset / steps))
+                pending.clear()
+
+                emit(frame, center)
+                last_center, last_key_index = center, index
+            else:
+                pending.append(frame)
+
+            with stage("decode"):
+                ok, frame = capture.read()
+            if not ok:
+                break
+            index += 1
+
+        for held in pending:
+            emit(held, last_center)
+        return index + 1, keyframes, scene_cuts
+
+    def _face_center(self, frame: np.ndarray) -> Point | None:
+        """Centre of the largest distinct face in a frame, if any."""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        faces = select_faces(self.processor.detect_frame(gray).faces)
+        if len(faces) == 0:
+            return None
+        x, y, w, h = faces[0]
+        return (x + w / 2, y + h / 2)
+
+
+def _window_size(width: int, height: int, params: VideoParams) -> Tuple[int, int]:
+    """Largest window of the target aspect ratio inside the frame, shrunk by the zoom."""
+    ratio = params.aspect_ratio.get_ratio() or width / height
+    if width / height > ratio:
+        window_width, window_height = height * ratio, height
+    else:
+        window_width, window_height = width, width / ratio
+
+    # Most codecs need even dimensions
+    scale = 1.0 - params.zoom / 2
+    return (
+        max(2, int(window_width * scale) // 2 * 2),
+        max(2, int(window_height * scale) // 2 * 2),
+    )
+
+
+def _crop_window(frame: np.ndarray, center: Point, window: Tuple[int, int]) -> np.ndarray:
+    """Cut the window centred on ``center`` out of the frame, kept inside its bounds."""
+    window_width, window_height = window
+    frame_height, frame_width = frame.shape[:2]
+    x = min(max(0, round(center[0] - window_width / 2)), frame_width - window_width)
+    y = min(max(0, round(center[1] - window_height / 2)), frame_height - window_height)
+    return np.ascontiguousarray(frame[y : y + window_height, x : x + window_width])
+
+
+def _scene_thumbnail(frame: np.ndarray) -> np.ndarray:
+    thumbnail = cv2.resize(frame, _SCENE_THUMBNAIL, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+
+
+def _frame_difference(a: np.ndarray, b: np.ndarray) -> float:
+    """Mean absolute difference of two thumbnails, from 0 (identical) to 1."""
+    return float(cv2.absdiff(a, b).mean()) / 255
+
+
+def _interpolate(a: Point, b: Point, t: float) -> Point:
+    return (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
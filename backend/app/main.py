@@ -1,17 +1,60 @@
 # NOTE: This file was partially generated using AI assistance.
-import uvicorn
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from .api.limits import BodySizeLimitMiddleware
+from .api.routes import admission, crop_service, engine, job_manager, raw_router, router
+from .api.session import router as session_router
+from .api.timing import MetricsMiddleware
+from .core import metrics
+from .core.config import REQUEST_OVERHEAD_BYTES, settings
+from .core.engine import preload_processor
+
+if settings.preload_model:
+    preload_processor()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await job_manager.start()
+    # Warm up in the background so the server accepts connections (and
+    # answers /health) right away; /ready reports when it is done
+    warm_up = asyncio.create_task(engine.warm_up()) if settings.warm_up else None
+    yield
+    if warm_up is not None:
+        warm_up.cancel()
+        # A failed warm-up only leaves the server unready; it must not fail shutdown
+        with suppress(asyncio.CancelledError, Exception):
+            await warm_up
+    await job_manager.stop()
+    engine.shutdown()
 
-from .api.routes import router
 
 app = FastAPI(
     title="Face Detection and Cropping API",
     description="API for detecting faces in images and cropping them appropriately",
     version="1.0.0",
+    lifespan=lifespan,
+)
+
+# Reject oversized request bodies while they stream in (added first so the
+# CORS middleware wraps it and 413 responses stay readable by the browser).
+# Only batch endpoints may receive more than one full-size upload.
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_bytes=settings.max_upload_bytes + REQUEST_OVERHEAD_BYTES,
+    path_limits={
+        f"/api/v1{path}": settings.max_request_bytes for path in ("/process-batch", "/jobs")
+    },
 )
 
+# Count requests (including rejected ones) and add Server-Timing headers
+app.add_middleware(MetricsMiddleware)
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -22,10 +65,34 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the frontend read which detector tier found the face
+    expose_headers=["X-Detector-Tier"],
 )
 
 # Include routers
 app.include_router(router, prefix="/api/v1")
+app.include_router(raw_router, prefix="/api/v1")
+app.include_router(session_router, prefix="/api/v1")
+
+
+# Gauges and counters read from the engine and the caches when /metrics is scraped
+metrics.ADMISSION_SLOTS.set_function(lambda: admission.in_flight, state="in_flight")
+metrics.ADMISSION_SLOTS.set_function(lambda: admission.queued, state="queued")
+metrics.ENGINE_TASKS.set_function(lambda: engine.in_flight, state="in_flight")
+metrics.ENGINE_TASKS.set_function(lambda: engine.queue_depth, state="queued")
+for _name, _cache in (("detections", crop_service.detections), ("outputs", crop_service.outputs)):
+    for _event in ("hits", "misses", "evictions"):
+        metrics.CACHE_EVENTS.set_function(
+            lambda cache=_cache, event=_event: cache.stats()[event], cache=_name, event=_event
+        )
+    metrics.CACHE_BYTES.set_function(lambda cache=_cache: cache.stats()["bytes"], cache=_name)
+metrics.CACHE_BYTES.set_function(lambda: crop_service.images.stats()["bytes"], cache="images")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Processing metrics in the Prometheus text exposition format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 
 # Health check endpoint
@@ -34,5 +101,15 @@ async def health_check():
     return JSONResponse({"status": "healthy"})
 
 
+@app.get("/ready")
+async def readiness_check():
+    """Ready once every worker has loaded its model and run a warm-up crop."""
+    if not settings.warm_up or engine.ready:
+        return JSONResponse({"status": "ready", "warm_up_seconds": engine.warm_up_seconds})
+    return JSONResponse({"status": "warming_up"}, status_code=503)
+
+
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
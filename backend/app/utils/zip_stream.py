@@ -0,0 +1,54 @@
+import io
+import zipfile
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only, non-seekable buffer that hands out what was written since the last drain."""
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ZipStream:
+    """
+    Incrementally build a ZIP archive without holding it in memory.
+
+    Every call returns the archive bytes produced by that call, so they can be
+    yielded to the client straight away. Because the sink cannot seek, zipfile
+    writes data descriptors after each member instead of patching local headers.
+    """
+
+    def __init__(self):
+        self._sink = _ChunkSink()
+        self._archive = zipfile.ZipFile(self._sink, mode="w")
+
+    def add(self, name: str, data: bytes, compress: bool = False) -> bytes:
+        """Append a member and return the bytes written for it."""
+        self._archive.writestr(
+            name,
+            data,
+            compress_type=zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED,
+        )
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        """Write the central directory and return the trailing bytes."""
+        self._archive.close()
+        return self._sink.drain()
@@ -0,0 +1,129 @@
+"""
+Measure cold start: import time, time until /ready and first-request latency.
+
+Usage:
+    uv run python -m benchmarks.bench_cold_start [--runs 3] [--engine-mode thread]
+        [--megapixels 6] [--output results.json]
+
+Every run starts a fresh interpreter, imports the app, runs its lifespan and
+polls /ready, then sends two /api/v1/process-image requests through httpx's
+ASGI transport. Runs are made with the warm-up on and off, so the difference
+in first-request latency shows what the warm-up moves out of the request
+path. Medians per configuration are printed and written to a JSON file.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from .common import synthetic_jpeg, write_results
+
+_READY_POLL_SECONDS = 0.01
+
+
+async def _child(image: Path) -> dict:
+    start = time.perf_counter()
+    import httpx
+
+    from app.main import app
+
+    imported = time.perf_counter()
+    data = image.read_bytes()
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            while (await client.get("/ready")).status_code != 200:
+                await asyncio.sleep(_READY_POLL_SECONDS)
+            ready = time.perf_counter()
+
+            latencies = []
+            for index in range(2):
+                # A unique trailer after the JPEG data defeats content-hash caching
+                body = data + index.to_bytes(8, "big")
+                request_start = time.perf_counter()
+                response = await client.post(
+                    "/api/v1/process-image",
+                    files={"file": ("bench.jpg", body, "image/jpeg")},
+                    data={"aspect_ratio": "9:16"},
+                )
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - request_start)
+
+    return {
+        "import_ms": (imported - start) * 1000,
+        "ready_ms": (ready - start) * 1000,
+        "first_request_ms": latencies[0] * 1000,
+        "second_request_ms": latencies[1] * 1000,
+    }
+
+
+def _run(image: Path, warm_up: bool, engine_mode: str) -> dict:
+    environment = {
+        **os.environ,
+        "FACE_CROPPER_WARM_UP": str(warm_up).lower(),
+        "FACE_CROPPER_ENGINE_MODE": engine_mode,
+    }
+    completed = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_cold_start", "--child", str(image)],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=environment,
+        cwd=Path(__file__).parent.parent,
+    )
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--engine-mode", choices=["thread", "process"], default="thread")
+    parser.add_argument("--megapixels", type=float, default=6)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--child", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(_child(args.child))))
+        return
+
+    image = Path(__file__).parent / "results" / "cold-start-input.jpg"
+    image.parent.mkdir(parents=True, exist_ok=True)
+    image.write_bytes(synthetic_jpeg(args.megapixels))
+
+    results = []
+    print(f"{'warm-up':>8} {'import':>8} {'ready':>8} {'1st req':>8} {'2nd req':>8}  (ms)")
+    for warm_up in (False, True):
+        runs = [_run(image, warm_up, args.engine_mode) for _ in range(args.runs)]
+        result = {"warm_up": warm_up}
+        for key in runs[0]:
+            result[key] = statistics.median(run[key] for run in runs)
+        results.append(result)
+        print(
+            f"{'on' if warm_up else 'off':>8} {result['import_ms']:>8.0f} "
+            f"{result['ready_ms']:>8.0f} {result['first_request_ms']:>8.0f} "
+            f"{result['second_request_ms']:>8.0f}"
+        )
+    image.unlink()
+
+    path = write_results(
+        "cold_start",
+        {
+            "megapixels": args.megapixels,
+            "engine_mode": args.engine_mode,
+            "runs": args.runs,
+            "configurations": results,
+        },
+        args.output,
+    )
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
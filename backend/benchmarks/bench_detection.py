@@ -0,0 +1,93 @@
+"""
+Compare face detection on the full-resolution image against the downscaled path.
+
+Usage:
+    uv run python -m benchmarks.bench_detection [--megapixels 3 12 24] [image ...]
+
+For every image and target size the script reports the median latency of both
+paths, the speed-up, and how well the downscaled detections agree with the
+full-resolution ones (face count and IoU of the largest face).
+"""
+
+import argparse
+import statistics
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from app.core.config import settings
+from app.core.image_processor import ImageProcessor
+
+DEFAULT_IMAGE = Path(__file__).parent.parent / "tests" / "test_data" / "test_image.jpg"
+
+
+def _load_gray(path: Path, megapixels: float) -> np.ndarray:
+    image = Image.open(path).convert("L")
+    scale = (megapixels * 1_000_000 / (image.width * image.height)) ** 0.5
+    size = (round(image.width * scale), round(image.height * scale))
+    return np.array(image.resize(size, Image.Resampling.BICUBIC))
+
+
+def _time(processor: ImageProcessor, gray: np.ndarray, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        faces, _ = processor._run_detection(gray)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), faces
+
+
+def _largest(faces: np.ndarray):
+    return max(faces, key=lambda face: face[2] * face[3]) if len(faces) else None
+
+
+def _iou(a, b) -> float:
+    if a is None or b is None:
+        return float(a is None and b is None)
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    iw = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    ih = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = iw * ih
+    return inter / (aw * ah + bw * bh - inter)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("images", nargs="*", type=Path, default=[DEFAULT_IMAGE])
+    parser.add_argument("--megapixels", nargs="+", type=float, default=[3, 12, 24])
+    parser.add_argument("--max-edge", type=int, default=settings.detection_max_edge)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # The pre-existing path: full resolution and no lower bound on the face size
+    full_res = ImageProcessor(
+        detection_max_edge=None, min_face_fraction=0.0, detector_tiers=["default"]
+    )
+    downscaled = ImageProcessor(
+        detection_max_edge=args.max_edge, detector_tiers=["default"]
+    )
+
+    print(
+        f"{'image':<20} {'MP':>5} {'full (ms)':>10} {'capped (ms)':>12} "
+        f"{'speed-up':>9} {'faces':>7} {'IoU':>6}"
+    )
+    for path in args.images:
+        for megapixels in args.megapixels:
+            gray = _load_gray(path, megapixels)
+            full_time, full_faces = _time(full_res, gray, args.repeat)
+            capped_time, capped_faces = _time(downscaled, gray, args.repeat)
+            iou = _iou(_largest(full_faces), _largest(capped_faces))
+            print(
+                f"{path.name[:20]:<20} {megapixels:>5.1f} {full_time * 1000:>10.1f} "
+                f"{capped_time * 1000:>12.1f} {full_time / capped_time:>8.1f}x "
+                f"{len(full_faces):>3}/{len(capped_faces):<3} {iou:>6.2f}"
+            )
+
+
+if __name__ == "__main__":
+    cv2.setNumThreads(1)
+    main()
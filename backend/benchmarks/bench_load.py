@@ -0,0 +1,117 @@
+"""
+Drive /api/v1/process-image in-process at a fixed concurrency.
+
+Usage:
+    uv run python -m benchmarks.bench_load [--concurrency 1 4 8] [--requests 40]
+        [--megapixels 6] [--cache] [--output results.json]
+
+Requests go through the real ASGI app (multipart parsing, engine, encoding)
+via httpx's ASGI transport, without a network socket. Result caches are
+disabled unless --cache is given, so every request runs the full pipeline.
+Throughput and p50/p95/p99 latency per concurrency level are printed and
+written to a JSON file.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import httpx
+
+from app.api.routes import crop_service, engine
+from app.main import app
+
+from .common import percentile, synthetic_jpeg, write_results
+
+
+async def _run_level(
+    client: httpx.AsyncClient, data: bytes, concurrency: int, requests: int
+) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for index in remaining:
+            # A unique trailer after the JPEG data defeats content-hash caching
+            body = data + index.to_bytes(8, "big") + os.urandom(8)
+            start = time.perf_counter()
+            response = await client.post(
+                "/api/v1/process-image",
+                files={"file": ("bench.jpg", body, "image/jpeg")},
+                data={"aspect_ratio": "9:16"},
+            )
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def _main(args) -> list[dict]:
+    if not args.cache:
+        crop_service.detections.max_bytes = 0
+        crop_service.outputs.max_bytes = 0
+
+    data = synthetic_jpeg(args.megapixels, args.faces)
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm up the worker pool so pool start-up is not measured
+        await _run_level(client, data, engine.workers, engine.workers)
+
+        print(f"{'conc':>5} {'req/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'errors':>7}")
+        for concurrency in args.concurrency:
+            result = await _run_level(client, data, concurrency, args.requests)
+            results.append(result)
+            print(
+                f"{concurrency:>5} {result['throughput_rps']:>8.2f} {result['p50_ms']:>9.1f} "
+                f"{result['p95_ms']:>9.1f} {result['p99_ms']:>9.1f} {result['errors']:>7}"
+            )
+    engine.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 8])
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--megapixels", type=float, default=6)
+    parser.add_argument("--faces", type=int, default=1)
+    parser.add_argument("--cache", action="store_true", help="keep the result caches on")
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    results = asyncio.run(_main(args))
+    path = write_results(
+        "load",
+        {
+            "megapixels": args.megapixels,
+            "faces": args.faces,
+            "engine_mode": engine.mode,
+            "engine_workers": engine.workers,
+            "cache": args.cache,
+            "levels": results,
+        },
+        args.output,
+    )
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
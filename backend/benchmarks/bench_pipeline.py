@@ -0,0 +1,89 @@
+"""
+Measure latency and peak memory of ImageProcessor.crop_image per megapixel.
+
+Usage:
+    uv run python -m benchmarks.bench_pipeline [--megapixels 3 12 24] [image]
+
+Every measurement runs in a fresh process. The reported peak is the growth of
+the resident set's high-water mark over the resident size just before
+processing starts; the mark is reset through /proc/self/clear_refs, so this
+benchmark needs Linux.
+"""
+
+import argparse
+import multiprocessing
+import re
+import statistics
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+DEFAULT_IMAGE = Path(__file__).parent.parent / "tests" / "test_data" / "test_image.jpg"
+
+
+def _make_jpeg(path: Path, megapixels: float) -> bytes:
+    image = Image.open(path).convert("RGB")
+    scale = (megapixels * 1_000_000 / (image.width * image.height)) ** 0.5
+    size = (round(image.width * scale), round(image.height * scale))
+    output = BytesIO()
+    image.resize(size, Image.Resampling.BICUBIC).save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def _memory_kb(field: str) -> int:
+    status = Path("/proc/self/status").read_text()
+    return int(re.search(rf"{field}:\s+(\d+) kB", status).group(1))
+
+
+def _measure(data: bytes, repeat: int, results) -> None:
+    import cv2
+
+    from app.core.image_processor import ImageProcessingParams, ImageProcessor
+
+    cv2.setNumThreads(1)
+    processor = ImageProcessor()
+    params = ImageProcessingParams()
+
+    # Warm up lazy OpenCV/Pillow initialisation on a small image first
+    warm_up = BytesIO()
+    Image.effect_noise((640, 480), 64).convert("RGB").save(warm_up, format="JPEG")
+    processor.crop_image(warm_up, params)
+    Path("/proc/self/clear_refs").write_text("5")  # reset the high-water mark
+    baseline_kb = _memory_kb("VmRSS")
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        processor.crop_image(BytesIO(data), params)
+        timings.append(time.perf_counter() - start)
+
+    peak_kb = _memory_kb("VmHWM")
+    results.put((statistics.median(timings), (peak_kb - baseline_kb) / 1024))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("image", nargs="?", type=Path, default=DEFAULT_IMAGE)
+    parser.add_argument("--megapixels", nargs="+", type=float, default=[3, 12, 24])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    print(f"{'MP':>5} {'latency (ms)':>13} {'ms/MP':>7} {'peak (MB)':>10} {'MB/MP':>7}")
+    for megapixels in args.megapixels:
+        data = _make_jpeg(args.image, megapixels)
+        results = context.Queue()
+        worker = context.Process(target=_measure, args=(data, args.repeat, results))
+        worker.start()
+        latency, peak_mb = results.get()
+        worker.join()
+        print(
+            f"{megapixels:>5.1f} {latency * 1000:>13.1f} {latency * 1000 / megapixels:>7.1f} "
+            f"{peak_mb:>10.1f} {peak_mb / megapixels:>7.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Time every stage of the crop pipeline on synthetic images.
+
+Usage:
+    uv run python -m benchmarks.bench_stages [--megapixels 1 6 12 24 50] [--faces 1 4]
+        [--repeat 3] [--output results.json]
+
+Stages: decode, colour conversion (detection luminance plane), face detection,
+crop geometry, crop, and encode. Medians per stage are printed and written to
+a JSON file so runs on different commits can be diffed.
+"""
+
+import argparse
+import statistics
+import time
+from io import BytesIO
+from pathlib import Path
+
+import cv2
+
+from app.core.encoding import encode_image
+from app.core.image_processor import AspectRatio, ImageProcessor, fit_aspect_ratio
+
+from .common import synthetic_jpeg, write_results
+
+STAGES = ["decode", "colour", "detect", "geometry", "crop", "encode"]
+
+
+def _time_stages(processor: ImageProcessor, data: bytes, aspect_ratio: AspectRatio) -> dict:
+    timings = {}
+    clock = time.perf_counter
+
+    start = clock()
+    image = processor.load_image(BytesIO(data))
+    timings["decode"] = clock() - start
+
+    start = clock()
+    gray, reduction = processor._luminance_plane(image)
+    timings["colour"] = clock() - start
+
+    start = clock()
+    faces, _ = processor._run_detection(gray)
+    faces = processor._rescale_faces(faces, 1 / reduction, (image.height, image.width))
+    timings["detect"] = clock() - start
+
+    start = clock()
+    image_shape = (image.height, image.width)
+    box = (0, 0, image.width, image.height)
+    if len(faces):
+        box = processor._calculate_crop_coordinates(image_shape, faces, 0.2)
+        box = fit_aspect_ratio(image_shape, box, aspect_ratio)
+    timings["geometry"] = clock() - start
+
+    start = clock()
+    cropped = processor._crop_image(image, box)
+    timings["crop"] = clock() - start
+
+    start = clock()
+    encode_image(cropped)
+    timings["encode"] = clock() - start
+
+    timings["faces"] = len(faces)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--megapixels", nargs="+", type=float, default=[1, 6, 12, 24, 50])
+    parser.add_argument("--faces", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cv2-threads", type=int, default=1)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    cv2.setNumThreads(args.cv2_threads)
+    processor = ImageProcessor()
+    results = []
+
+    # Warm up lazy OpenCV initialisation so it is not charged to the first size
+    _time_stages(processor, synthetic_jpeg(0.5, 1), AspectRatio.PORTRAIT)
+
+    print(f"{'MP':>5} {'faces':>5} " + " ".join(f"{stage:>9}" for stage in STAGES) + f" {'total':>9}")
+    for megapixels in args.megapixels:
+        for faces in args.faces:
+            data = synthetic_jpeg(megapixels, faces)
+            runs = [
+                _time_stages(processor, data, AspectRatio.PORTRAIT)
+                for _ in range(args.repeat)
+            ]
+            medians = {
+                stage: statistics.median(run[stage] for run in runs) * 1000
+                for stage in STAGES
+            }
+            total = sum(medians.values())
+            results.append(
+                {
+                    "megapixels": megapixels,
+                    "faces": faces,
+                    "faces_detected": runs[0]["faces"],
+                    "input_bytes": len(data),
+                    "stages_ms": medians,
+                    "total_ms": total,
+                }
+            )
+            print(
+                f"{megapixels:>5.1f} {faces:>5} "
+                + " ".join(f"{medians[stage]:>9.1f}" for stage in STAGES)
+                + f" {total:>9.1f}"
+            )
+
+    path = write_results(
+        "stages", {"cv2_threads": args.cv2_threads, "runs": results}, args.output
+    )
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Compare multipart uploads to /process-image with raw bodies to /process-image-raw.
+
+Usage:
+    uv run python -m benchmarks.bench_upload [--megapixels 1 6 24] [--requests 20]
+        [--output results.json]
+
+Requests go through the real ASGI app via httpx's ASGI transport. Each image
+is first processed once to learn its ETag; the measured requests then send
+it with If-None-Match, so they are answered with 412 after the body has been
+received, parsed and hashed but before any image work. What remains is the
+upload handling itself. Mean and p95 latency per route and image size are
+printed and written to a JSON file.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from pathlib import Path
+
+import httpx
+
+from app.api.routes import engine
+from app.main import app
+
+from .common import percentile, synthetic_jpeg, write_results
+
+
+def _multipart(data: bytes, etag: str | None = None) -> dict:
+    return {
+        "url": "/api/v1/process-image",
+        "files": {"file": ("bench.jpg", data, "image/jpeg")},
+        "data": {"aspect_ratio": "9:16"},
+        "headers": {"If-None-Match": etag} if etag else {},
+    }
+
+
+def _raw(data: bytes, etag: str | None = None) -> dict:
+    return {
+        "url": "/api/v1/process-image-raw",
+        "params": {"aspect_ratio": "9:16", "filename": "bench.jpg"},
+        "content": data,
+        "headers": {"Content-Type": "image/jpeg", **({"If-None-Match": etag} if etag else {})},
+    }
+
+
+async def _measure(client: httpx.AsyncClient, build, data: bytes, requests: int) -> dict:
+    response = await client.post(**build(data))
+    response.raise_for_status()
+    etag = response.headers["ETag"]
+
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        response = await client.post(**build(data, etag))
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 412, response.status_code
+    return {
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+    }
+
+
+async def _main(args) -> list[dict]:
+    transport = httpx.ASGITransport(app=app)
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'MP':>5} {'MB':>6} {'multipart (ms)':>15} {'raw (ms)':>9} {'speed-up':>9}")
+        for megapixels in args.megapixels:
+            data = synthetic_jpeg(megapixels)
+            multipart = await _measure(client, _multipart, data, args.requests)
+            raw = await _measure(client, _raw, data, args.requests)
+            results.append(
+                {
+                    "megapixels": megapixels,
+                    "bytes": len(data),
+                    "multipart": multipart,
+                    "raw": raw,
+                }
+            )
+            print(
+                f"{megapixels:>5g} {len(data) / 1e6:>6.1f} {multipart['mean_ms']:>15.2f} "
+                f"{raw['mean_ms']:>9.2f} {multipart['mean_ms'] / raw['mean_ms']:>8.1f}x"
+            )
+    engine.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--megapixels", nargs="+", type=float, default=[1, 6, 24])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--output", type=Path)
+    args = parser.parse_args()
+
+    results = asyncio.run(_main(args))
+    path = write_results("upload", {"requests": args.requests, "sizes": results}, args.output)
+    print(f"Results written to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Helpers shared by the benchmarks: synthetic inputs and result files."""
+
+import json
+import math
+import platform
+import subprocess
+import time
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+DEFAULT_IMAGE = Path(__file__).parent.parent / "tests" / "test_data" / "test_image.jpg"
+RESULTS_DIR = Path(__file__).parent / "results"
+
+# Face region of the test portrait, with some margin, as fractions of its size
+_FACE_REGION = (0.25, 0.2, 0.8, 0.6)
+
+
+@lru_cache(maxsize=1)
+def _face_tile() -> Image.Image:
+    portrait = Image.open(DEFAULT_IMAGE).convert("RGB")
+    left, top, right, bottom = _FACE_REGION
+    return portrait.crop(
+        (
+            int(portrait.width * left),
+            int(portrait.height * top),
+            int(portrait.width * right),
+            int(portrait.height * bottom),
+        )
+    )
+
+
+def synthetic_image(megapixels: float, faces: int = 1, aspect: float = 4 / 3) -> Image.Image:
+    """
+    Build an RGB test image of roughly ``megapixels`` containing ``faces`` faces.
+
+    The faces are copies of the test portrait's face laid out on a grid over a
+    textured background, so detection has real work to do at every size.
+    """
+    height = int(math.sqrt(megapixels * 1_000_000 / aspect))
+    width = int(height * aspect)
+    # Low-frequency texture that looks the same at every resolution
+    texture = Image.effect_noise((max(1, width // 32), max(1, height // 32)), 60)
+    background = ImageOps.autocontrast(texture).convert("RGB")
+    background = background.resize((width, height), Image.Resampling.BICUBIC)
+
+    if faces:
+        columns = math.ceil(math.sqrt(faces))
+        rows = math.ceil(faces / columns)
+        cell_width, cell_height = width // columns, height // rows
+        tile = _face_tile()
+        scale = min(cell_width / tile.width, cell_height / tile.height) * 0.8
+        tile = tile.resize((int(tile.width * scale), int(tile.height * scale)))
+        for index in range(faces):
+            row, column = divmod(index, columns)
+            background.paste(
+                tile,
+                (
+                    column * cell_width + (cell_width - tile.width) // 2,
+                    row * cell_height + (cell_height - tile.height) // 2,
+                ),
+            )
+    return background
+
+
+def synthetic_jpeg(megapixels: float, faces: int = 1, quality: int = 90) -> bytes:
+    """A synthetic image encoded as JPEG."""
+    output = BytesIO()
+    synthetic_image(megapixels, faces).save(output, format="JPEG", quality=quality)
+    return output.getvalue()
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).parent,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_results(name: str, results: dict, output: Path | None = None) -> Path:
+    """
+    Save benchmark results as JSON, tagged with the commit and machine they came from.
+
+    By default files go to ``benchmarks/results/<name>-<commit>.json`` so runs on
+    different commits can be diffed.
+    """
+    commit = _git_commit()
+    path = output or RESULTS_DIR / f"{name}-{commit or 'unknown'}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    document = {
+        "benchmark": name,
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    path.write_text(json.dumps(document, indent=2))
+    return path
@@ -0,0 +1,71 @@
+import asyncio
+import time
+
+import pytest
+from app.core.admission import AdmissionController, DeadlineExceededError, OverloadedError
+
+
+async def _hold(controller: AdmissionController, release: asyncio.Event, order: list, name: str):
+    async with controller.admit():
+        order.append(name)
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_admission_queues_in_order_and_hands_over_slots():
+    """Test that requests over the limit wait and are admitted in arrival order."""
+    controller = AdmissionController(max_in_flight=1, max_queued=2, queue_timeout=5)
+    release = asyncio.Event()
+    order: list[str] = []
+    tasks = [asyncio.create_task(_hold(controller, release, order, name)) for name in "abc"]
+    await asyncio.sleep(0.01)
+
+    assert order == ["a"]
+    assert (controller.in_flight, controller.queued) == (1, 2)
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert order == ["a", "b", "c"]
+    assert (controller.in_flight, controller.queued) == (0, 0)
+
+
+@pytest.mark.asyncio
+async def test_admission_sheds_when_queue_is_full():
+    """Test that a request finding the queue full is rejected at once with a retry hint."""
+    controller = AdmissionController(max_in_flight=1, max_queued=0, queue_timeout=5)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(controller, release, [], "a"))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(OverloadedError) as error:
+        async with controller.admit():
+            pass
+    assert error.value.retry_after >= 1
+
+    release.set()
+    await holder
+    assert controller.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_admission_queue_timeout_and_deadline():
+    """Test that waiting ends with shedding after the budget, or expiry at the deadline."""
+    controller = AdmissionController(max_in_flight=1, max_queued=4, queue_timeout=0.05)
+    release = asyncio.Event()
+    holder = asyncio.create_task(_hold(controller, release, [], "a"))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(OverloadedError):
+        async with controller.admit():
+            pass
+    with pytest.raises(DeadlineExceededError):
+        async with controller.admit(deadline=time.time() + 0.01):
+            pass
+    with pytest.raises(DeadlineExceededError):
+        async with controller.admit(deadline=time.time() - 1):
+            pass
+    assert controller.queued == 0
+
+    release.set()
+    await holder
+    assert controller.in_flight == 0
@@ -1,6 +1,12 @@
 # NOTE: This file was partially generated using AI assistance.
+import json
+import time
+import zipfile
 from io import BytesIO
 
+from app.api.routes import admission, crop_service
+from app.core import metrics
+from app.core.config import settings
 from app.core.image_processor import AspectRatio
 from app.main import app
 from fastapi.testclient import TestClient
@@ -16,6 +22,20 @@ def test_health_check():
     assert response.json() == {"status": "healthy"}
 
 
+def test_readiness_check():
+    """Test that the app reports ready only after the startup warm-up."""
+    assert client.get("/ready").status_code == 503
+
+    with TestClient(app) as started:
+        deadline = time.monotonic() + 60
+        while (response := started.get("/ready")).status_code == 503:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    assert response.json()["warm_up_seconds"] > 0
+
+
 def test_process_image_success(test_image_path):
     """Test successful image processing with default parameters."""
     with open(test_image_path, "rb") as f:
@@ -123,3 +143,598 @@ def test_process_no_file():
     response = client.post("/api/v1/process-image")
     assert response.status_code == 400
     assert "No file provided" in response.json()["detail"]
+
+
+def test_process_batch(test_image_bytes):
+    """Test batch processing streams a ZIP with crops and a manifest of failures."""
+    files = [
+        ("files", ("a.jpg", test_image_bytes, "image/jpeg")),
+        ("files", ("a.jpg", test_image_bytes, "image/jpeg")),
+        ("files", ("notes.txt", b"not an image", "text/plain")),
+    ]
+    response = client.post(
+        "/api/v1/process-batch",
+        files=files,
+        data={"aspect_ratio": AspectRatio.SQUARE.value},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+
+    with zipfile.ZipFile(BytesIO(response.content)) as archive:
+        names = set(archive.namelist())
+        assert names == {"processed_a.jpg", "processed_a_1.jpg", "manifest.json"}
+
+        manifest = json.loads(archive.read("manifest.json"))["files"]
+        assert [entry["status"] for entry in manifest] == ["ok", "ok", "error"]
+        assert manifest[2]["error"] == "Invalid image format"
+
+        img = Image.open(BytesIO(archive.read("processed_a.jpg")))
+        width, height = img.size
+        assert abs(width - height) <= 1
+
+
+def test_process_batch_reads_uploads_while_streaming(test_image_bytes, monkeypatch):
+    """Test that the streamed crops come from open uploads, inside the admission slot."""
+    in_flight = []
+    crop = crop_service.crop
+
+    async def admitted_crop(*args, **kwargs):
+        in_flight.append(admission.in_flight)
+        return await crop(*args, **kwargs)
+
+    monkeypatch.setattr(crop_service, "crop", admitted_crop)
+    files = [("files", (f"{name}.jpg", test_image_bytes, "image/jpeg")) for name in "ab"]
+    with client.stream("POST", "/api/v1/process-batch", files=files) as response:
+        assert response.status_code == 200
+        content = b"".join(response.iter_bytes())
+
+    with zipfile.ZipFile(BytesIO(content)) as archive:
+        manifest = json.loads(archive.read("manifest.json"))["files"]
+        assert [entry["status"] for entry in manifest] == ["ok", "ok"]
+        for name in ("processed_a.jpg", "processed_b.jpg"):
+            assert Image.open(BytesIO(archive.read(name))).format == "JPEG"
+    assert in_flight and min(in_flight) >= 1
+
+
+def test_process_batch_no_files():
+    """Test batch request without files."""
+    response = client.post("/api/v1/process-batch")
+    assert response.status_code == 400
+    assert "No files provided" in response.json()["detail"]
+
+
+def test_process_batch_too_many_files(test_image_bytes, monkeypatch):
+    """Test that batches over the file limit are refused."""
+    monkeypatch.setattr(settings, "max_batch_files", 1)
+    files = [("files", (f"{name}.jpg", test_image_bytes, "image/jpeg")) for name in "ab"]
+    response = client.post("/api/v1/process-batch", files=files)
+    assert response.status_code == 413
+    assert "Too many files" in response.json()["detail"]
+
+
+def test_cache_stats(test_image_bytes):
+    """Test that repeated uploads are served from the cache and counted."""
+    files = {"file": ("test.jpg", test_image_bytes, "image/jpeg")}
+    data = {"aspect_ratio": AspectRatio.PHOTO.value, "zoom": "0.35"}
+    first = client.post("/api/v1/process-image", files=files, data=data)
+    second = client.post("/api/v1/process-image", files=files, data=data)
+    assert first.content == second.content
+
+    response = client.get("/api/v1/cache-stats")
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["outputs"]["hits"] >= 1
+    assert set(stats["detections"]) >= {"hits", "misses", "evictions"}
+
+
+def test_detect_then_crop(test_image_bytes):
+    """Test the two-phase flow: detect once, then crop by token with new settings."""
+    files = {"file": ("test.jpg", test_image_bytes, "image/jpeg")}
+    response = client.post("/api/v1/detect", files=files)
+    assert response.status_code == 200
+    detection = response.json()
+    assert detection["stored"] is True
+    assert detection["width"] > 0 and detection["height"] > 0
+    assert len(detection["faces"]) > 0
+
+    for aspect_ratio, ratio in [(AspectRatio.SQUARE, 1.0), (AspectRatio.PORTRAIT, 9 / 16)]:
+        response = client.post(
+            "/api/v1/crop",
+            data={
+                "image_token": detection["image_token"],
+                "aspect_ratio": aspect_ratio.value,
+            },
+        )
+        assert response.status_code == 200
+        width, height = Image.open(BytesIO(response.content)).size
+        assert abs(width / height - ratio) < 0.01
+
+
+def test_crop_reuses_the_stored_detection(test_image_bytes, monkeypatch):
+    """Test that /crop skips detection even when the detection cache is disabled."""
+    monkeypatch.setattr(crop_service.detections, "max_bytes", 0)
+    files = {"file": ("test.jpg", test_image_bytes, "image/jpeg")}
+    token = client.post("/api/v1/detect", files=files).json()["image_token"]
+
+    response = client.post(
+        "/api/v1/crop", data={"image_token": token, "aspect_ratio": "2:3", "zoom": "0.37"}
+    )
+    assert response.status_code == 200
+    stages = {
+        entry.split(";")[0].strip() for entry in response.headers["server-timing"].split(",")
+    }
+    assert {"crop", "encode"} <= stages
+    assert "detect" not in stages
+
+
+def test_detect_without_room_to_store(test_image_bytes, monkeypatch):
+    """Test that an upload the image store cannot keep is not given a token."""
+    monkeypatch.setattr(crop_service.images, "max_bytes", 0)
+    files = {"file": ("test.jpg", test_image_bytes, "image/jpeg")}
+    response = client.post("/api/v1/detect", files=files)
+    assert response.status_code == 200
+    detection = response.json()
+    assert detection["image_token"] is None
+    assert detection["stored"] is False
+    assert len(detection["faces"]) > 0
+
+
+def test_crop_unknown_token():
+    """Test cropping with a token that was never issued."""
+    response = client.post("/api/v1/crop", data={"image_token": "missing"})
+    assert response.status_code == 404
+
+
+def test_process_image_reports_detector_tier(test_image_bytes):
+    """Test that the detector tier that found the face is reported."""
+    files = {"file": ("test.jpg", test_image_bytes, "image/jpeg")}
+    response = client.post("/api/v1/process-image", files=files)
+    assert response.headers["x-detector-tier"] == "default"
+
+
+def test_detector_tiers_are_counted(test_image_bytes):
+    """Test that each detection is counted by tier, faceless images as none, and exposed to CORS."""
+    default = metrics.DETECTIONS.value(tier="default")
+    none = metrics.DETECTIONS.value(tier="none")
+
+    blank = BytesIO()
+    Image.new("RGB", (64, 48), "white").save(blank, format="PNG")
+    files = {"file": ("blank.png", blank.getvalue(), "image/png")}
+    response = client.post("/api/v1/process-image", files=files)
+    assert response.headers["x-detector-tier"] == "none"
+
+    files = {"file": ("test.jpg", test_image_bytes, "image/jpeg")}
+    response = client.post(
+        "/api/v1/process-image",
+        files=files,
+        data={"zoom": "0.43"},
+        headers={"Origin": "http://localhost:3000"},
+    )
+    assert "X-Detector-Tier" in response.headers["access-control-expose-headers"]
+
+    assert metrics.DETECTIONS.value(tier="default") == default + 1
+    assert metrics.DETECTIONS.value(tier="none") == none + 1
+    assert 'face_cropper_detections_total{tier="none"}' in client.get("/metrics").text
+
+
+def test_process_image_output_options(test_image_bytes):
+    """Test that output format and maximum edge are applied to the response."""
+    files = {"file": ("test.jpg", test_image_bytes, "image/jpeg")}
+    response = client.post(
+        "/api/v1/process-image",
+        files=files,
+        data={"output_format": "webp", "quality": "60", "max_edge": "256"},
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert 'filename="processed_test.webp"' in response.headers["content-disposition"]
+
+    img = Image.open(BytesIO(response.content))
+    assert img.format == "WEBP"
+    assert max(img.size) == 256
+
+
+def test_process_image_invalid_output_options(test_image_bytes):
+    """Test that invalid output options are rejected."""
+    files = {"file": ("test.jpg", test_image_bytes, "image/jpeg")}
+    for data in ({"output_format": "gif"}, {"quality": "0"}, {"subsampling": "4:1:1"}):
+        response = client.post("/api/v1/process-image", files=files, data=data)
+        assert response.status_code == 422
+
+
+def test_process_renditions(test_image_bytes):
+    """Test that every aspect ratio is rendered at every width in one request."""
+    files = {"file": ("portrait.jpg", test_image_bytes, "image/jpeg")}
+    data = {
+        "aspect_ratios": [AspectRatio.PORTRAIT.value, AspectRatio.SQUARE.value],
+        "widths": ["320", "160"],
+    }
+    response = client.post("/api/v1/process-renditions", files=files, data=data)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+
+    with zipfile.ZipFile(BytesIO(response.content)) as archive:
+        index = json.loads(archive.read("renditions.json"))
+        assert len(index["renditions"]) == 4
+
+        for entry in index["renditions"]:
+            img = Image.open(BytesIO(archive.read(entry["file"])))
+            assert img.size[0] == entry["width"]
+            expected = AspectRatio(entry["aspect_ratio"]).get_ratio()
+            assert abs(img.size[0] / img.size[1] - expected) < 0.01
+
+        assert "processed_portrait_9x16_320.jpg" in archive.namelist()
+
+
+def test_process_renditions_validation(test_image_bytes):
+    """Test that missing or excessive renditions are rejected."""
+    files = {"file": ("test.jpg", test_image_bytes, "image/jpeg")}
+    response = client.post("/api/v1/process-renditions", files=files)
+    assert response.status_code == 422
+
+    data = {
+        "aspect_ratios": [AspectRatio.SQUARE.value],
+        "widths": [str(width) for width in range(1, 50)],
+    }
+    response = client.post("/api/v1/process-renditions", files=files, data=data)
+    assert response.status_code == 422
+
+
+def test_process_image_upload_too_large(test_image_bytes, monkeypatch):
+    """Test that files over the per-image limit are rejected with 413."""
+    monkeypatch.setattr(settings, "max_upload_bytes", 1024)
+    files = {"file": ("test.jpg", test_image_bytes, "image/jpeg")}
+    response = client.post("/api/v1/process-image", files=files)
+    assert response.status_code == 413
+
+
+def test_metrics_endpoint(test_image_bytes):
+    """Test that processing is reflected in the Prometheus metrics."""
+    files = {"file": ("test.jpg", BytesIO(test_image_bytes), "image/jpeg")}
+    response = client.post("/api/v1/process-image", files=files, data={"zoom": "0.33"})
+    assert response.status_code == 200
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert (
+        'face_cropper_requests_total{method="POST",endpoint="process_image",status="200"}'
+        in text
+    )
+    assert 'face_cropper_stage_seconds_count{stage="upload"}' in text
+    assert "face_cropper_upload_bytes_count" in text
+    assert 'face_cropper_engine_tasks{state="queued"}' in text
+    assert 'face_cropper_cache_events_total{cache="outputs",event="hits"}' in text
+
+
+def test_server_timing_header(test_image_bytes):
+    """Test that image responses carry their per-stage timing breakdown."""
+    files = {"file": ("test.jpg", BytesIO(test_image_bytes), "image/jpeg")}
+    response = client.post(
+        "/api/v1/process-image",
+        files=files,
+        data={"aspect_ratio": AspectRatio.SQUARE.value, "zoom": "0.41"},
+    )
+    assert response.status_code == 200
+
+    stages = {
+        entry.split(";")[0].strip() for entry in response.headers["server-timing"].split(",")
+    }
+    assert {"upload", "queue", "decode", "crop", "encode", "total"} <= stages
+
+
+def test_memory_usage_header(test_image_bytes, monkeypatch):
+    """Test that requests asking for memory tracing get their peak memory reported."""
+    files = {"file": ("test.jpg", BytesIO(test_image_bytes), "image/jpeg")}
+    data = {"zoom": "0.43"}
+    headers = {"X-Memory-Trace": "1"}
+    response = client.post("/api/v1/process-image", files=files, data=data, headers=headers)
+    assert "x-memory-usage" not in response.headers  # Tracing is off by default
+
+    monkeypatch.setattr(settings, "memory_tracing", True)
+    files = {"file": ("test.jpg", BytesIO(test_image_bytes), "image/jpeg")}
+    data = {"zoom": "0.44"}
+    response = client.post("/api/v1/process-image", files=files, data=data, headers=headers)
+    assert response.status_code == 200
+    entries = [entry.strip() for entry in response.headers["x-memory-usage"].split(",")]
+    assert entries[0].startswith("peak;kb=")
+    assert any(entry.startswith("decode;kb=") for entry in entries)
+    assert 'face_cropper_memory_peak_bytes_count{stage="total"}' in client.get("/metrics").text
+
+
+def _group_photo(test_image_bytes) -> bytes:
+    """Two copies of the test portrait at different sizes, side by side."""
+    portrait = Image.open(BytesIO(test_image_bytes)).convert("RGB").resize((600, 824))
+    group = Image.new("RGB", (1300, 824), "white")
+    group.paste(portrait, (0, 0))
+    group.paste(portrait.resize((450, 618)), (750, 150))
+    buffer = BytesIO()
+    group.save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def test_process_faces(test_image_bytes):
+    """Test that every face of a group photo is cropped, largest first."""
+    files = {"file": ("group.jpg", BytesIO(_group_photo(test_image_bytes)), "image/jpeg")}
+    response = client.post(
+        "/api/v1/process-faces", files=files, data={"aspect_ratio": AspectRatio.SQUARE.value}
+    )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(BytesIO(response.content)) as archive:
+        index = json.loads(archive.read("faces.json"))
+        assert [face["file"] for face in index["faces"]] == [
+            "processed_group_face1.jpg",
+            "processed_group_face2.jpg",
+        ]
+        first, second = index["faces"]
+        assert first["box"]["width"] > second["box"]["width"]
+        for face in index["faces"]:
+            crop = Image.open(BytesIO(archive.read(face["file"])))
+            assert crop.width == crop.height
+
+    # Raising the size filter above the smaller face leaves only the largest
+    files = {"file": ("group.jpg", BytesIO(_group_photo(test_image_bytes)), "image/jpeg")}
+    response = client.post(
+        "/api/v1/process-faces", files=files, data={"min_face_size": "0.9"}
+    )
+    with zipfile.ZipFile(BytesIO(response.content)) as archive:
+        assert len(json.loads(archive.read("faces.json"))["faces"]) == 1
+
+
+def test_process_image_group_framing(test_image_bytes):
+    """Test that group framing produces a crop spanning all faces."""
+    group_photo = _group_photo(test_image_bytes)
+    sizes = {}
+    for framing in ("largest", "group"):
+        files = {"file": ("group.jpg", BytesIO(group_photo), "image/jpeg")}
+        response = client.post(
+            "/api/v1/process-image", files=files, data={"framing": framing, "zoom": "0.5"}
+        )
+        assert response.status_code == 200
+        sizes[framing] = Image.open(BytesIO(response.content)).size
+
+    assert sizes["group"][0] > sizes["largest"][0]
+
+    files = {"file": ("group.jpg", BytesIO(group_photo), "image/jpeg")}
+    response = client.post("/api/v1/process-image", files=files, data={"framing": "all"})
+    assert response.status_code == 422
+
+
+def test_process_path(test_image_path, tmp_path, monkeypatch):
+    """Test cropping a file on the server's filesystem into an allowed target directory."""
+    output_dir = tmp_path / "out"
+    monkeypatch.setattr(settings, "local_read_roots", [test_image_path.parent])
+    monkeypatch.setattr(settings, "local_write_roots", [output_dir])
+
+    response = client.post(
+        "/api/v1/process-path",
+        json={
+            "source": str(test_image_path),
+            "target": str(output_dir / "nested" / "crop.webp"),
+            "params": {"aspect_ratio": "9:16"},
+            "output": {"format": "webp"},
+        },
+    )
+
+    assert response.status_code == 200
+    result = response.json()
+    assert result["bytes_written"] == (output_dir / "nested" / "crop.webp").stat().st_size
+    assert len(result["faces"]) == 1
+    assert Image.open(output_dir / "nested" / "crop.webp").format == "WEBP"
+
+
+def test_process_path_restrictions(test_image_path, tmp_path, monkeypatch):
+    """Test that paths outside the configured roots are refused."""
+    request = {"source": str(test_image_path), "target": str(tmp_path / "crop.jpg")}
+    assert client.post("/api/v1/process-path", json=request).status_code == 403  # Disabled
+
+    monkeypatch.setattr(settings, "local_read_roots", [tmp_path / "in"])
+    monkeypatch.setattr(settings, "local_write_roots", [tmp_path])
+    assert client.post("/api/v1/process-path", json=request).status_code == 403
+
+    monkeypatch.setattr(settings, "local_read_roots", [test_image_path.parent])
+    escape = {**request, "target": str(tmp_path / ".." / "escaped.jpg")}
+    assert client.post("/api/v1/process-path", json=escape).status_code == 403
+
+    missing = {**request, "source": str(test_image_path.parent / "missing.jpg")}
+    assert client.post("/api/v1/process-path", json=missing).status_code == 404
+
+
+def test_process_image_conditional_request(test_image_bytes, monkeypatch):
+    """Test that a client holding the crop gets 412 without the pipeline running."""
+    data = {"aspect_ratio": AspectRatio.PHOTO.value, "zoom": "0.27"}
+    files = {"file": ("test.jpg", BytesIO(test_image_bytes), "image/jpeg")}
+    response = client.post("/api/v1/process-image", files=files, data=data)
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert response.headers["cache-control"].startswith("private, max-age=")
+
+    async def fail(*args, **kwargs):
+        raise AssertionError("The pipeline should not run")
+
+    monkeypatch.setattr(crop_service, "crop", fail)
+    files = {"file": ("test.jpg", BytesIO(test_image_bytes), "image/jpeg")}
+    response = client.post(
+        "/api/v1/process-image", files=files, data=data, headers={"If-None-Match": etag}
+    )
+    # A conditional POST that fails is answered with 412, not 304 (RFC 9110, 13.1.2)
+    assert response.status_code == 412
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    # Other parameters give another ETag
+    files = {"file": ("test.jpg", BytesIO(test_image_bytes), "image/jpeg")}
+    monkeypatch.undo()
+    response = client.post(
+        "/api/v1/process-image",
+        files=files,
+        data={**data, "zoom": "0.28"},
+        headers={"If-None-Match": etag},
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_get_image_crop_by_token(test_image_bytes):
+    """Test the cacheable GET URL for stored uploads and its revalidation."""
+    files = {"file": ("test.jpg", BytesIO(test_image_bytes), "image/jpeg")}
+    token = client.post("/api/v1/detect", files=files).json()["image_token"]
+
+    url = f"/api/v1/images/{token}?aspect_ratio=square&output_format=png"
+    response = client.get(url)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    assert response.headers["cache-control"].startswith("public, max-age=")
+    etag = response.headers["etag"]
+
+    # The POST form of the same crop has the same validator, but only GET gets 304
+    data = {"image_token": token, "aspect_ratio": "square", "output_format": "png"}
+    response = client.post("/api/v1/crop", data=data)
+    assert response.headers["etag"] == etag
+    assert response.headers["cache-control"].startswith("private, max-age=")
+    response = client.post("/api/v1/crop", data=data, headers={"If-None-Match": etag})
+    assert response.status_code == 412
+    assert response.content == b""
+
+    response = client.get(url, headers={"If-None-Match": f'"other", W/{etag}'})
+    assert response.status_code == 304
+
+    assert client.get("/api/v1/images/unknown").status_code == 404
+    assert client.get(f"/api/v1/images/{token}?quality=500").status_code == 422
+
+
+def test_process_image_sheds_load(test_image_bytes, monkeypatch):
+    """Test that a request over the admission limits gets 503 with Retry-After."""
+    monkeypatch.setattr(admission, "in_flight", admission.max_in_flight)
+    monkeypatch.setattr(admission, "max_queued", 0)
+    files = {"file": ("test.jpg", BytesIO(test_image_bytes), "image/jpeg")}
+    response = client.post("/api/v1/process-image", files=files)
+
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert 'face_cropper_admissions_total{outcome="shed"}' in client.get("/metrics").text
+
+
+def test_process_image_request_timeout(test_image_bytes):
+    """Test the X-Request-Timeout deadline header."""
+    files = {"file": ("test.jpg", BytesIO(test_image_bytes), "image/jpeg")}
+    response = client.post(
+        "/api/v1/process-image", files=files, headers={"X-Request-Timeout": "0.000001"}
+    )
+    assert response.status_code == 504
+
+    files = {"file": ("test.jpg", BytesIO(test_image_bytes), "image/jpeg")}
+    response = client.post(
+        "/api/v1/process-image", files=files, headers={"X-Request-Timeout": "30"}
+    )
+    assert response.status_code == 200
+
+    response = client.post(
+        "/api/v1/process-image", files=files, headers={"X-Request-Timeout": "soon"}
+    )
+    assert response.status_code == 400
+
+
+def test_process_image_raw_matches_multipart(test_image_bytes):
+    """Test that a raw-body upload gives the same crop and headers as the multipart route."""
+    files = {"file": ("test.jpg", BytesIO(test_image_bytes), "image/jpeg")}
+    multipart = client.post(
+        "/api/v1/process-image", files=files, data={"aspect_ratio": "9:16", "zoom": "0.5"}
+    )
+    raw = client.post(
+        "/api/v1/process-image-raw",
+        params={"aspect_ratio": "9:16", "zoom": "0.5", "filename": "test.jpg"},
+        content=test_image_bytes,
+        headers={"Content-Type": "application/octet-stream"},
+    )
+
+    assert raw.status_code == multipart.status_code == 200
+    assert raw.content == multipart.content
+    for header in ("content-type", "content-disposition", "etag", "x-detector-tier"):
+        assert raw.headers[header] == multipart.headers[header]
+
+    cached = client.post(
+        "/api/v1/process-image-raw",
+        params={"aspect_ratio": "9:16", "zoom": "0.5"},
+        content=test_image_bytes,
+        headers={"Content-Type": "image/jpeg", "If-None-Match": raw.headers["etag"]},
+    )
+    assert cached.status_code == 412
+
+
+def test_process_image_raw_records_upload_once(test_image_bytes):
+    """Test that the raw route's upload stage is timed by the body reader alone."""
+    count = metrics.STAGE_SECONDS.count(stage="upload")
+    response = client.post(
+        "/api/v1/process-image-raw",
+        params={"aspect_ratio": "square"},
+        content=test_image_bytes,
+        headers={"Content-Type": "image/jpeg"},
+    )
+    assert response.status_code == 200
+    assert metrics.STAGE_SECONDS.count(stage="upload") == count + 1
+
+
+def test_process_image_raw_rejects_invalid_bodies(test_image_bytes, monkeypatch):
+    """Test the raw-body route's content type, emptiness and size checks."""
+    url = "/api/v1/process-image-raw"
+    response = client.post(url, content=b"text", headers={"Content-Type": "text/plain"})
+    assert response.status_code == 400
+
+    response = client.post(url, content=b"", headers={"Content-Type": "image/jpeg"})
+    assert response.status_code == 400
+
+    response = client.post(
+        url, params={"zoom": "2"}, content=test_image_bytes, headers={"Content-Type": "image/jpeg"}
+    )
+    assert response.status_code == 422
+
+    monkeypatch.setattr(settings, "max_upload_bytes", 1024)
+    response = client.post(url, content=test_image_bytes, headers={"Content-Type": "image/jpeg"})
+    assert response.status_code == 413
+
+
+def _preview(test_image_bytes, width):
+    image = Image.open(BytesIO(test_image_bytes))
+    preview = image.resize((width, round(image.height * width / image.width)))
+    buffer = BytesIO()
+    preview.save(buffer, format="JPEG")
+    return image.size, buffer.getvalue()
+
+
+def test_crop_geometry_from_preview(test_image_bytes):
+    """Test that a preview yields face boxes and an exact-ratio crop in original coordinates."""
+    (width, height), preview = _preview(test_image_bytes, 400)
+    response = client.post(
+        "/api/v1/geometry",
+        files={"file": ("preview.jpg", BytesIO(preview), "image/jpeg")},
+        data={"original_width": width, "original_height": height, "aspect_ratio": "9:16"},
+    )
+    assert response.status_code == 200
+    geometry = response.json()
+    assert (geometry["width"], geometry["height"]) == (width, height)
+
+    # The test image's face, found on the full-resolution image, is at (927, 1017, 435, 435)
+    [face] = geometry["faces"]
+    assert abs(face["x"] - 927) < 40 and abs(face["y"] - 1017) < 40
+    assert abs(face["width"] - 435) < 60
+
+    crop = geometry["crop"]
+    assert crop["width"] * 16 == crop["height"] * 9
+    assert 0 <= crop["x"] and crop["x"] + crop["width"] <= width
+    assert 0 <= crop["y"] and crop["y"] + crop["height"] <= height
+    assert crop["x"] <= face["x"] and face["x"] + face["width"] <= crop["x"] + crop["width"]
+
+
+def test_crop_geometry_rejects_mismatched_preview(test_image_bytes):
+    """Test that a preview with another aspect ratio than the original is refused."""
+    (width, height), preview = _preview(test_image_bytes, 400)
+    response = client.post(
+        "/api/v1/geometry",
+        files={"file": ("preview.jpg", BytesIO(preview), "image/jpeg")},
+        data={"original_width": width, "original_height": width},
+    )
+    assert response.status_code == 422
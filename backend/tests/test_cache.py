@@ -0,0 +1,167 @@
+import asyncio
+import time
+
+import pytest
+from app.core.admission import DeadlineExceededError, current_deadline
+from app.core.cache import LRUCache, SingleFlight
+from app.core.engine import ProcessingEngine
+from app.core.image_processor import AspectRatio, ImageProcessingParams
+from app.core.service import CropService
+
+
+@pytest.fixture
+def crop_service():
+    engine = ProcessingEngine(mode="thread", workers=2)
+    yield CropService(engine)
+    engine.shutdown()
+
+
+def test_lru_cache_evicts_least_recently_used():
+    """Test that the cache stays within its byte budget, evicting the oldest entries."""
+    cache = LRUCache(max_bytes=10)
+    cache.put("a", "A", 4)
+    cache.put("b", "B", 4)
+    assert cache.get("a") == "A"  # "b" is now least recently used
+
+    cache.put("c", "C", 4)
+    assert cache.get("b") is None
+    assert cache.get("c") == "C"
+    assert cache.stats() == {
+        "hits": 2,
+        "misses": 1,
+        "evictions": 1,
+        "entries": 2,
+        "bytes": 8,
+        "max_bytes": 10,
+    }
+
+    # Values larger than the whole budget are never stored
+    cache.put("huge", "H", 11)
+    assert cache.get("huge") is None
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_concurrent_calls():
+    """Test that concurrent calls for one key run the computation once."""
+    flights = SingleFlight()
+    calls = 0
+
+    async def compute():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return calls
+
+    results = await asyncio.gather(*(flights.run("key", compute) for _ in range(5)))
+    assert results == [1] * 5
+    assert calls == 1
+    assert flights.coalesced == 4
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_errors():
+    """Test that a failed computation is reported to every waiter."""
+    flights = SingleFlight()
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(
+        *(flights.run("key", compute) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_crop_service_cache_tiers(crop_service, test_image_bytes):
+    """Test that re-requests hit the output tier and new params reuse the detection."""
+    square = ImageProcessingParams(aspect_ratio=AspectRatio.SQUARE)
+    first = await crop_service.crop(test_image_bytes, square)
+    second = await crop_service.crop(test_image_bytes, square)
+    assert first.content == second.content
+    assert first.detection.tier == "default"
+    assert crop_service.outputs.hits == 1
+
+    # A settings change misses the output tier but skips face detection
+    portrait = ImageProcessingParams(aspect_ratio=AspectRatio.PORTRAIT)
+    await crop_service.crop(test_image_bytes, portrait)
+    assert crop_service.detections.hits == 1
+    assert crop_service.stats()["outputs"]["entries"] == 2
+
+
+@pytest.mark.asyncio
+async def test_crop_service_coalesces_identical_requests(crop_service, test_image_bytes):
+    """Test that identical concurrent requests run the pipeline once."""
+    params = ImageProcessingParams()
+    results = await asyncio.gather(
+        *(crop_service.crop(test_image_bytes, params) for _ in range(3))
+    )
+    assert len({result.content for result in results}) == 1
+    assert crop_service.flights.coalesced == 2
+    assert crop_service.detections.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_crop_service_holds_each_caller_to_its_own_deadline(
+    crop_service, test_image_bytes, monkeypatch
+):
+    """Test that a coalesced caller is not failed by the deadline of the caller it joined."""
+    deadlines = []
+    run = crop_service.engine.run
+
+    async def slow_run(*args):
+        deadlines.append(current_deadline.get())
+        await asyncio.sleep(0.2)
+        return await run(*args)
+
+    monkeypatch.setattr(crop_service.engine, "run", slow_run)
+
+    async def crop(deadline):
+        current_deadline.set(deadline)
+        return await crop_service.crop(test_image_bytes, ImageProcessingParams())
+
+    leader = asyncio.create_task(crop(time.time() + 0.05))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(crop(None))
+
+    with pytest.raises(DeadlineExceededError):
+        await leader
+    assert (await follower).content
+    assert crop_service.flights.coalesced == 1
+    # The shared computation itself ran without the leader's deadline
+    assert deadlines == [None]
+
+
+@pytest.mark.asyncio
+async def test_single_flight_survives_a_cancelled_caller():
+    """Test that cancelling one caller neither cancels the others nor the computation."""
+    flights = SingleFlight()
+    started = asyncio.Event()
+    cancelled = False
+
+    async def compute():
+        nonlocal cancelled
+        started.set()
+        try:
+            await asyncio.sleep(0.05)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        return "done"
+
+    leader = asyncio.create_task(flights.run("key", compute))
+    follower = asyncio.create_task(flights.run("key", compute))
+    await started.wait()
+    leader.cancel()
+    assert await follower == "done"
+    assert leader.cancelled()
+    assert not cancelled
+
+    # Once every caller has gone, the computation is cancelled too
+    lone = asyncio.create_task(flights.run("other", compute))
+    await asyncio.sleep(0.01)
+    lone.cancel()
+    await asyncio.gather(lone, return_exceptions=True)
+    await asyncio.sleep(0)
+    assert cancelled
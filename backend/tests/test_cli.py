@@ -0,0 +1,89 @@
+import json
+import shutil
+
+import pytest
+from app.cli import MANIFEST_NAME, main
+from PIL import Image
+
+
+@pytest.fixture
+def source_tree(test_image_path, tmp_path):
+    source = tmp_path / "photos"
+    (source / "2024" / "june").mkdir(parents=True)
+    shutil.copy(test_image_path, source / "portrait.jpg")
+    shutil.copy(test_image_path, source / "2024" / "june" / "copy.jpg")
+    (source / "2024" / "broken.png").write_bytes(b"not an image")
+    (source / "notes.txt").write_text("ignored")
+    return source
+
+
+def _manifest(output):
+    with open(output / MANIFEST_NAME) as f:
+        return {entry["path"]: entry for entry in map(json.loads, f)}
+
+
+def test_cli_processes_tree_and_resumes(source_tree, tmp_path, capsys):
+    """Test that crops mirror the source tree and unchanged files are skipped on rerun."""
+    output = tmp_path / "crops"
+    args = [str(source_tree), str(output), "--aspect-ratio", "square", "--workers", "1"]
+
+    assert main(args) == 1  # broken.png failed
+
+    crop = Image.open(output / "2024" / "june" / "copy.jpg")
+    assert crop.width == crop.height
+    assert (output / "portrait.jpg").exists()
+
+    manifest = _manifest(output)
+    assert set(manifest) == {"portrait.jpg", "2024/june/copy.jpg", "2024/broken.png"}
+    assert manifest["portrait.jpg"]["status"] == "ok"
+    assert manifest["portrait.jpg"]["settings"]["params"]["aspect_ratio"] == "square"
+    assert manifest["2024/broken.png"]["status"] == "error"
+    assert "2 processed, 0 skipped, 1 failed" in capsys.readouterr().err
+
+    # Rerun: the successful files are skipped, the broken one is retried
+    main(args)
+    assert "0 processed, 2 skipped, 1 failed" in capsys.readouterr().err
+
+    # Changed settings reprocess everything
+    main(args[:2] + ["--aspect-ratio", "9:16", "--workers", "1"])
+    assert "2 processed, 0 skipped, 1 failed" in capsys.readouterr().err
+    assert _manifest(output)["portrait.jpg"]["settings"]["params"]["aspect_ratio"] == "9:16"
+
+
+def test_cli_skips_output_inside_source(source_tree, capsys):
+    """Test that crops written below the source directory are not picked up again."""
+    output = source_tree / "crops"
+    args = [str(source_tree), str(output), "--workers", "1"]
+
+    main(args)
+    main(args)
+
+    assert "0 processed, 2 skipped, 1 failed" in capsys.readouterr().err.splitlines()[-1]
+
+
+def test_cli_reports_colliding_outputs(source_tree, tmp_path, capsys):
+    """Test that files mapping to the same crop are failed instead of overwriting each other."""
+    shutil.copy(source_tree / "portrait.jpg", source_tree / "portrait.png")
+    output = tmp_path / "crops"
+
+    assert main([str(source_tree), str(output), "--workers", "1"]) == 1
+
+    manifest = _manifest(output)
+    for name in ("portrait.jpg", "portrait.png"):
+        assert manifest[name]["status"] == "error"
+        assert "portrait.jpg is also the output of" in manifest[name]["error"]
+    assert manifest["2024/june/copy.jpg"]["status"] == "ok"
+    assert "1 processed, 0 skipped, 3 failed" in capsys.readouterr().err
+
+
+def test_cli_records_write_errors_and_continues(source_tree, tmp_path, capsys):
+    """Test that a file whose crop cannot be written is failed without aborting the run."""
+    output = tmp_path / "crops"
+    (output / "portrait.jpg").mkdir(parents=True)  # A directory where the crop goes
+
+    assert main([str(source_tree), str(output), "--workers", "1"]) == 1
+
+    manifest = _manifest(output)
+    assert manifest["portrait.jpg"]["status"] == "error"
+    assert manifest["2024/june/copy.jpg"]["status"] == "ok"
+    assert "1 processed, 0 skipped, 2 failed" in capsys.readouterr().err
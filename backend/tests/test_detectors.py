@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+import pytest
+from app.core.detectors import DETECTORS, TieredDetector, create_detector
+from app.core.image_processor import ImageProcessingError, ImageProcessor
+from PIL import Image
+
+
+@pytest.fixture
+def gray_image(test_image_path):
+    return np.array(Image.open(test_image_path).convert("L").reduce(4))
+
+
+@pytest.mark.parametrize("name", list(DETECTORS))
+def test_registered_detectors_load(name):
+    """Test that every registered cascade ships with OpenCV and loads."""
+    detector = create_detector(name)
+    assert detector.name == name
+
+
+def test_unknown_detector():
+    """Test that unknown detector names are rejected."""
+    with pytest.raises(ValueError):
+        create_detector("missing")
+    with pytest.raises(ImageProcessingError):
+        ImageProcessor(detector_tiers=["missing"])
+
+
+def test_tiered_detector_stops_at_first_hit(gray_image):
+    """Test that a face found by the first tier is reported with that tier."""
+    result = TieredDetector(["default", "alt2"]).detect(gray_image, (20, 20), (800, 800))
+    assert len(result.faces) > 0
+    assert result.tier == "default"
+
+
+def test_tiered_detector_escalates(gray_image):
+    """Test that later tiers run when earlier ones find nothing."""
+    detector = TieredDetector(["default", "alt2"])
+    # Make the first tier blind
+    first = detector.tiers[0]
+    first.detect = lambda image, min_size, max_size: np.empty((0, 4), dtype=np.int32)
+
+    result = detector.detect(gray_image, (20, 20), (800, 800))
+    assert result.tier == "alt2"
+    assert len(result.faces) > 0
+
+
+def test_tiered_detector_no_faces():
+    """Test that no tier is reported when nothing is found."""
+    blank = np.full((200, 200), 255, dtype=np.uint8)
+    result = TieredDetector(["default", "profile"]).detect(blank, (20, 20), (200, 200))
+    assert result.tier is None
+    assert result.faces.shape == (0, 4)
+
+
+def test_mirrored_detector_maps_boxes_back(gray_image):
+    """Test that faces found on the mirrored image are flipped back."""
+    detector = create_detector("default")
+    detector.mirror = True
+    faces = detector.detect(cv2.flip(gray_image, 1), (20, 20), (800, 800))
+    plain = create_detector("default").detect(gray_image, (20, 20), (800, 800))
+
+    x, y, w, h = plain[0]
+    mirrored_x = gray_image.shape[1] - x - w
+    assert any(abs(fx - mirrored_x) <= 2 and abs(fy - y) <= 2 for fx, fy, _, _ in faces)
@@ -0,0 +1,80 @@
+from io import BytesIO
+
+import pytest
+from app.core.encoding import (
+    ChromaSubsampling,
+    OutputFormat,
+    OutputOptions,
+    encode_image,
+    iter_chunks,
+)
+from PIL import Image, ImageCms
+
+
+@pytest.mark.parametrize("output_format", list(OutputFormat))
+@pytest.mark.parametrize("mode", ["RGB", "RGBA", "P", "L"])
+def test_encode_all_formats_and_modes(output_format, mode):
+    """Test that every input mode can be encoded to every output format."""
+    image = Image.new("RGB", (64, 48), (200, 100, 50)).convert(mode)
+    encoded = encode_image(image, OutputOptions(format=output_format))
+
+    decoded = Image.open(BytesIO(encoded))
+    assert decoded.format == output_format.value.upper()
+    assert decoded.size == (64, 48)
+
+
+def test_encode_flattens_alpha_for_jpeg():
+    """Test that transparent pixels become white in a JPEG."""
+    image = Image.new("RGBA", (16, 16), (0, 0, 0, 0))
+    decoded = Image.open(BytesIO(encode_image(image)))
+    assert decoded.mode == "RGB"
+    assert all(channel > 250 for channel in decoded.getpixel((8, 8)))
+
+
+def test_encode_max_edge():
+    """Test that the output is downscaled to the maximum edge, keeping the aspect ratio."""
+    image = Image.new("RGB", (400, 200))
+    decoded = Image.open(BytesIO(encode_image(image, OutputOptions(max_edge=100))))
+    assert decoded.size == (100, 50)
+
+
+def test_encode_jpeg_options():
+    """Test that quality, progressive and subsampling reach the JPEG encoder."""
+    image = Image.effect_noise((128, 128), 50).convert("RGB")
+    small = encode_image(image, OutputOptions(quality=20))
+    large = encode_image(image, OutputOptions(quality=95))
+    assert len(small) < len(large)
+
+    options = OutputOptions(progressive=True, subsampling=ChromaSubsampling.S444)
+    decoded = Image.open(BytesIO(encode_image(image, options)))
+    assert decoded.info.get("progressive")
+    assert decoded.layer[0][1:3] == decoded.layer[1][1:3]  # no chroma subsampling
+
+
+def test_encode_metadata_passthrough():
+    """Test that ICC profiles are kept by default and EXIF only on request."""
+    image = Image.new("RGB", (16, 16))
+    image.info["icc_profile"] = ImageCms.ImageCmsProfile(
+        ImageCms.createProfile("sRGB")
+    ).tobytes()
+    exif = Image.Exif()
+    exif[0x010F] = "Camera Maker"
+    image.info["exif"] = exif.tobytes()
+
+    plain = Image.open(BytesIO(encode_image(image)))
+    assert plain.info.get("icc_profile") == image.info["icc_profile"]
+    assert "exif" not in plain.info
+
+    with_exif = Image.open(BytesIO(encode_image(image, OutputOptions(keep_exif=True))))
+    assert with_exif.getexif()[0x010F] == "Camera Maker"
+
+    stripped = Image.open(
+        BytesIO(encode_image(image, OutputOptions(keep_icc_profile=False)))
+    )
+    assert "icc_profile" not in stripped.info
+
+
+def test_iter_chunks():
+    """Test that encoded bytes are split into fixed-size chunks."""
+    chunks = list(iter_chunks(b"abcdefg", chunk_size=3))
+    assert [bytes(chunk) for chunk in chunks] == [b"abc", b"def", b"g"]
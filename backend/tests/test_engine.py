@@ -0,0 +1,186 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from pathlib import Path
+
+import pytest
+from app.core.encoding import OutputOptions
+from app.core import engine as engine_module
+from app.core.admission import DeadlineExceededError, current_deadline
+from app.core.engine import ProcessingEngine, preload_processor
+from app.core.image_processor import (
+    AspectRatio,
+    ImageProcessingError,
+    ImageProcessingParams,
+)
+from app.core.pipeline import crop_task, crop_to_file_task
+from PIL import Image
+
+
+@pytest.fixture(params=["thread", "process"])
+def engine(request):
+    engine = ProcessingEngine(mode=request.param, workers=2, cv2_threads=1)
+    yield engine
+    engine.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_engine_runs_crop_task(engine, test_image_bytes):
+    """Test that both engine modes run the whole pipeline and return encoded bytes."""
+    params = ImageProcessingParams(aspect_ratio=AspectRatio.SQUARE)
+    _, output = await engine.run(crop_task, test_image_bytes, params)
+
+    img = Image.open(BytesIO(output))
+    assert img.format == "JPEG"
+    assert abs(img.size[0] - img.size[1]) <= 1
+
+
+@pytest.mark.asyncio
+async def test_engine_runs_task_on_mapped_file(engine, test_image_path, tmp_path):
+    """Test that workers can read the image from a path and write the crop to a file."""
+    target = tmp_path / "crop.png"
+    params = ImageProcessingParams(aspect_ratio=AspectRatio.SQUARE)
+    detection, written = await engine.run_file(
+        crop_to_file_task, str(test_image_path), params, OutputOptions(format="png"), str(target)
+    )
+
+    assert len(detection.faces) == 1
+    assert written == target.stat().st_size
+    assert Image.open(target).format == "PNG"
+    assert list(tmp_path.iterdir()) == [target]
+
+
+@pytest.mark.asyncio
+async def test_engine_propagates_errors(engine):
+    """Test that pipeline errors raised in a worker reach the caller."""
+    with pytest.raises(ImageProcessingError):
+        await engine.run(crop_task, b"not an image", ImageProcessingParams())
+
+
+def _crash(processor, image_data):
+    os._exit(1)
+
+
+@pytest.mark.asyncio
+async def test_engine_replaces_a_broken_process_pool(test_image_bytes):
+    """Test that a worker dying only fails its own task, not the ones run after it."""
+    engine = ProcessingEngine(mode="process", workers=1)
+    try:
+        with pytest.raises(BrokenProcessPool):
+            await engine.run(_crash, b"x")
+        _, output = await engine.run(crop_task, test_image_bytes, ImageProcessingParams())
+        assert output
+    finally:
+        engine.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_engine_process_mode_releases_shared_memory(test_image_bytes):
+    """Test that shared memory blocks are unlinked after each task."""
+    engine = ProcessingEngine(mode="process", workers=1)
+    before = set(Path("/dev/shm").iterdir())
+    try:
+        await engine.run(crop_task, test_image_bytes, ImageProcessingParams())
+    finally:
+        engine.shutdown()
+    assert set(Path("/dev/shm").iterdir()) <= before
+
+
+@pytest.mark.asyncio
+async def test_engine_thread_workers_own_processors():
+    """Test that every worker thread loads its own processor."""
+
+    def slow_task(processor, image_data):
+        time.sleep(0.2)
+        return id(processor)
+
+    engine = ProcessingEngine(mode="thread", workers=2)
+    try:
+        ids = await asyncio.gather(*(engine.run(slow_task, b"x") for _ in range(2)))
+    finally:
+        engine.shutdown()
+    assert len(set(ids)) == 2
+
+
+@pytest.mark.asyncio
+async def test_engine_warm_up(engine):
+    """Test that the warm-up runs on the pool and marks the engine ready until shutdown."""
+    assert not engine.ready
+    seconds = await engine.warm_up()
+
+    assert engine.ready
+    assert engine.warm_up_seconds == seconds > 0
+    engine.shutdown()
+    assert not engine.ready
+
+
+@pytest.mark.asyncio
+async def test_engine_warm_up_runs_on_every_worker(monkeypatch):
+    """Test that each worker runs exactly one warm-up crop, however fast the crops are."""
+    threads = []
+    monkeypatch.setattr(
+        engine_module, "crop_task", lambda *args: threads.append(threading.get_ident())
+    )
+    engine = ProcessingEngine(mode="thread", workers=4)
+    try:
+        await engine.warm_up()
+    finally:
+        engine.shutdown()
+    assert len(threads) == len(set(threads)) == 4
+
+
+@pytest.mark.asyncio
+async def test_engine_warm_up_retries_and_logs_failures(monkeypatch, caplog):
+    """Test that a failed warm-up is logged and retried, and leaves the engine unready."""
+    calls = []
+
+    def flaky_crop(*args):
+        calls.append(args)
+        if len(calls) == 1:
+            raise ImageProcessingError("cold")
+
+    monkeypatch.setattr(engine_module, "crop_task", flaky_crop)
+    engine = ProcessingEngine(mode="thread", workers=2)
+    try:
+        await engine.warm_up(retry_delay=0)
+        assert engine.ready
+        assert "warm-up attempt 1 of 3 failed" in caplog.text
+
+        engine.shutdown()
+        monkeypatch.setattr(engine_module, "crop_task", lambda *args: 1 / 0)
+        with pytest.raises(ZeroDivisionError):
+            await engine.warm_up(attempts=2, retry_delay=0)
+        assert not engine.ready
+        assert "warm-up attempt 2 of 2 failed" in caplog.text
+    finally:
+        engine.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_engine_adopts_preloaded_processor():
+    """Test that the first worker takes over a processor loaded ahead of the pool."""
+    preload_processor()
+    preloaded = engine_module._preloaded
+
+    engine = ProcessingEngine(mode="thread", workers=1)
+    try:
+        processor_id = await engine.run(lambda processor, image_data: id(processor), b"x")
+    finally:
+        engine.shutdown()
+    assert processor_id == id(preloaded)
+    assert engine_module._preloaded is None
+
+
+@pytest.mark.asyncio
+async def test_engine_drops_work_past_its_deadline(engine, test_image_bytes):
+    """Test that a task whose request deadline has passed is not run."""
+
+    async def run_with_deadline():
+        current_deadline.set(time.time() - 1)
+        await engine.run(crop_task, test_image_bytes, ImageProcessingParams())
+
+    with pytest.raises(DeadlineExceededError):
+        await asyncio.create_task(run_with_deadline())
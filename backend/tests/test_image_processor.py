@@ -4,12 +4,20 @@ from io import BytesIO
 import cv2
 import numpy as np
 import pytest
+from app.core.encoding import OutputFormat, OutputOptions
+from app.core.engine import ProcessingEngine
 from app.core.image_processor import (
     AspectRatio,
+    FaceFraming,
     ImageProcessingError,
     ImageProcessingParams,
     ImageProcessor,
+    fit_aspect_ratio,
+    select_faces,
 )
+from app.core.pipeline import crop_task
+from hypothesis import given
+from hypothesis import strategies as st
 from PIL import Image
 
 
@@ -18,6 +26,26 @@ def image_processor():
     return ImageProcessor()
 
 
+# Shared by the property-based tests, which cannot use function-scoped fixtures
+_PROCESSOR = ImageProcessor()
+
+
+@pytest.fixture
+def engine():
+    engine = ProcessingEngine(mode="thread", workers=1)
+    yield engine
+    engine.shutdown()
+
+
+def _crop_image_task(processor, image_data, params):
+    return processor.crop_image(image_data, params)
+
+
+async def _process(engine, image_data, params=ImageProcessingParams()) -> Image.Image:
+    """Run the detect-and-crop pipeline in an engine worker, returning the cropped image."""
+    return await engine.run(_crop_image_task, image_data.getvalue(), params)
+
+
 @pytest.fixture
 def test_image_bytes(test_image_path):
     return test_image_path.read_bytes()
@@ -29,10 +57,10 @@ def test_image_bytesio(test_image_bytes):
 
 
 @pytest.mark.asyncio
-async def test_process_image_with_face(image_processor, test_image_bytesio):
+async def test_process_image_with_face(engine, test_image_bytesio):
     """Test processing an image that contains a face."""
     # Process the image with default parameters
-    result = await image_processor.process_image(test_image_bytesio)
+    result = await _process(engine, test_image_bytesio)
 
     # Verify the result is a PIL Image
     assert isinstance(result, Image.Image)
@@ -46,37 +74,37 @@ async def test_process_image_with_face(image_processor, test_image_bytesio):
 
 
 @pytest.mark.asyncio
-async def test_process_image_with_square_ratio(image_processor, test_image_bytesio):
+async def test_process_image_with_square_ratio(engine, test_image_bytesio):
     """Test processing an image with square aspect ratio."""
     params = ImageProcessingParams(aspect_ratio=AspectRatio.SQUARE)
-    result = await image_processor.process_image(test_image_bytesio, params)
+    result = await _process(engine, test_image_bytesio, params)
 
     # Verify square aspect ratio
     width, height = result.size
-    assert abs(width - height) <= 1  # Allow for rounding
+    assert width == height
 
 
 @pytest.mark.asyncio
-async def test_process_image_with_portrait_ratio(image_processor, test_image_bytesio):
+async def test_process_image_with_portrait_ratio(engine, test_image_bytesio):
     """Test processing an image with portrait (9:16) aspect ratio."""
     params = ImageProcessingParams(aspect_ratio=AspectRatio.PORTRAIT)
-    result = await image_processor.process_image(test_image_bytesio, params)
+    result = await _process(engine, test_image_bytesio, params)
 
-    # Verify portrait aspect ratio (9:16)
+    # Verify portrait aspect ratio (9:16), exactly
     width, height = result.size
-    assert abs((width / height) - (9 / 16)) < 0.01  # Allow for rounding
+    assert width * 16 == height * 9
 
 
 @pytest.mark.asyncio
-async def test_process_image_with_zoom(image_processor, test_image_bytesio):
+async def test_process_image_with_zoom(engine, test_image_bytesio):
     """Test processing an image with different zoom levels."""
     # Test tight crop
     tight_params = ImageProcessingParams(zoom=1.0)
-    tight_result = await image_processor.process_image(test_image_bytesio, tight_params)
+    tight_result = await _process(engine, test_image_bytesio, tight_params)
 
     # Test loose crop
     loose_params = ImageProcessingParams(zoom=0.0)
-    loose_result = await image_processor.process_image(test_image_bytesio, loose_params)
+    loose_result = await _process(engine, test_image_bytesio, loose_params)
 
     # Tight crop should be smaller than loose crop
     tight_width, tight_height = tight_result.size
@@ -86,7 +114,7 @@ async def test_process_image_with_zoom(image_processor, test_image_bytesio):
 
 
 @pytest.mark.asyncio
-async def test_process_image_no_face(image_processor):
+async def test_process_image_no_face(engine):
     """Test processing an image without faces returns original image."""
     # Create a simple test image without faces
     img = Image.new("RGB", (100, 100), color="white")
@@ -95,7 +123,7 @@ async def test_process_image_no_face(image_processor):
     img_bytes.seek(0)
 
     # Process the image
-    result = await image_processor.process_image(img_bytes)
+    result = await _process(engine, img_bytes)
 
     # Should return the original image
     assert isinstance(result, Image.Image)
@@ -103,18 +131,17 @@ async def test_process_image_no_face(image_processor):
 
 
 @pytest.mark.asyncio
-async def test_process_invalid_image(image_processor):
+async def test_process_invalid_image(engine):
     """Test processing invalid image data raises appropriate error."""
     invalid_data = BytesIO(b"not an image")
 
     with pytest.raises(ImageProcessingError) as exc_info:
-        await image_processor.process_image(invalid_data)
+        await _process(engine, invalid_data)
 
     assert "Invalid image format" in str(exc_info.value)
 
 
-@pytest.mark.asyncio
-async def test_face_detection(image_processor, test_image_bytesio):
+def test_face_detection(image_processor, test_image_bytesio):
     """Test the face detection specifically."""
     # Load and convert image for face detection
     image = Image.open(test_image_bytesio)
@@ -122,7 +149,7 @@ async def test_face_detection(image_processor, test_image_bytesio):
     gray = cv2.cvtColor(cv_image, cv2.COLOR_BGR2GRAY)
 
     # Detect faces
-    faces = await image_processor._detect_faces(gray)
+    faces = image_processor.detect_frame(gray).faces
 
     # Verify faces were found
     assert len(faces) > 0
@@ -144,3 +171,186 @@ async def test_invalid_zoom_value():
         ImageProcessingParams(zoom=1.5)
     with pytest.raises(ValueError):
         ImageProcessingParams(zoom=-0.5)
+
+
+def test_face_detection_downscaled(test_image_bytesio):
+    """Test that detecting on a downscaled image maps boxes back to full resolution."""
+    gray = np.array(Image.open(test_image_bytesio).convert("L"))
+    full_res = ImageProcessor(detection_max_edge=None)
+    downscaled = ImageProcessor(detection_max_edge=512)
+
+    assert downscaled._detection_scale(gray.shape) < 1.0
+
+    full_faces = full_res.detect_frame(gray).faces
+    small_faces = downscaled.detect_frame(gray).faces
+    assert len(small_faces) > 0
+
+    # The largest face should land in the same place in original coordinates
+    fx, fy, fw, fh = max(full_faces, key=lambda face: face[2] * face[3])
+    sx, sy, sw, sh = max(small_faces, key=lambda face: face[2] * face[3])
+    assert abs((fx + fw / 2) - (sx + sw / 2)) < fw * 0.1
+    assert abs((fy + fh / 2) - (sy + sh / 2)) < fh * 0.1
+    assert abs(fw - sw) < fw * 0.2
+
+
+def test_rescale_faces_stays_in_bounds(image_processor):
+    """Test that rescaled boxes are clamped to the original image."""
+    faces = np.array([[0, 0, 10, 10], [95, 45, 10, 10]])
+    rescaled = image_processor._rescale_faces(faces, 0.5, (100, 200))
+
+    assert rescaled.tolist() == [[0, 0, 20, 20], [190, 90, 10, 10]]
+    assert image_processor._rescale_faces((), 0.5, (100, 200)).shape == (0, 4)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["L", "RGBA", "P"])
+async def test_process_image_non_rgb_modes(engine, test_image_bytes, mode):
+    """Test that non-RGB inputs are decoded once and cropped without changing mode."""
+    source = Image.open(BytesIO(test_image_bytes)).convert(mode)
+    png_bytes = BytesIO()
+    source.save(png_bytes, format="PNG")
+    png_bytes.seek(0)
+
+    params = ImageProcessingParams(aspect_ratio=AspectRatio.SQUARE)
+    result = await _process(engine, png_bytes, params)
+
+    assert result.mode == mode
+    assert result.size[0] < source.size[0]
+    assert abs(result.size[0] - result.size[1]) <= 1
+
+
+@pytest.mark.parametrize(
+    "output_format, keeps_alpha",
+    [(OutputFormat.PNG, True), (OutputFormat.WEBP, True), (OutputFormat.JPEG, False)],
+)
+def test_crop_keeps_alpha_for_the_output_format(
+    image_processor, test_image_bytes, output_format, keeps_alpha
+):
+    """Test that transparency survives the crop and is only flattened for JPEG."""
+    source = Image.open(BytesIO(test_image_bytes)).convert("RGBA")
+    # Transparent pixels with a colour that must not leak into the output
+    source.paste((255, 0, 0, 0), (0, 0, source.width, source.height // 4))
+    png_bytes = BytesIO()
+    source.save(png_bytes, format="PNG")
+    png_bytes.seek(0)
+
+    params = ImageProcessingParams(aspect_ratio=AspectRatio.SQUARE, zoom=0.0)
+    _, encoded = crop_task(image_processor, png_bytes, params, OutputOptions(format=output_format))
+
+    result = Image.open(BytesIO(encoded))
+    corner = result.getpixel((0, 0))
+    if keeps_alpha:
+        assert result.mode == "RGBA"
+        assert corner[3] == 0
+    else:
+        assert result.mode == "RGB"
+        assert all(channel > 240 for channel in corner)  # Flattened onto white
+
+
+def test_select_faces_suppresses_overlaps_and_small_faces():
+    """Test that duplicates and faces far smaller than the largest are dropped."""
+    faces = np.array(
+        [
+            [100, 100, 50, 50],  # Smaller than the largest face but kept
+            [0, 0, 100, 100],  # Largest face
+            [5, 5, 95, 95],  # Duplicate of the largest face
+            [300, 300, 10, 10],  # Too small
+        ],
+        dtype=np.int32,
+    )
+
+    kept = select_faces(faces, overlap_threshold=0.3, min_relative_size=0.25)
+
+    assert kept.tolist() == [[0, 0, 100, 100], [100, 100, 50, 50]]
+    assert select_faces(np.empty((0, 4), dtype=np.int32)).shape == (0, 4)
+
+
+def test_group_framing_contains_every_face(image_processor):
+    """Test that a group crop frames all faces instead of only the largest one."""
+    image = Image.new("RGB", (1000, 600))
+    faces = np.array([[100, 100, 80, 80], [700, 300, 60, 60]], dtype=np.int32)
+
+    largest = image_processor.crop_faces(image, faces, ImageProcessingParams(zoom=1.0))
+    group = image_processor.crop_faces(
+        image, faces, ImageProcessingParams(zoom=1.0, framing=FaceFraming.GROUP)
+    )
+
+    assert largest.size == (80, 80)
+    assert group.size == (660, 260)
+
+
+@st.composite
+def _image_and_box(draw):
+    """An image size and a box inside it."""
+    width = draw(st.integers(16, 4000))
+    height = draw(st.integers(16, 4000))
+    start_x = draw(st.integers(0, width - 1))
+    start_y = draw(st.integers(0, height - 1))
+    end_x = draw(st.integers(start_x + 1, width))
+    end_y = draw(st.integers(start_y + 1, height))
+    return (height, width), (start_x, start_y, end_x, end_y)
+
+
+@given(_image_and_box(), st.sampled_from(AspectRatio))
+def test_fit_aspect_ratio_is_exact_and_inside_image(image_and_box, aspect_ratio):
+    """Test that fitted boxes have the exact ratio, stay in the image and fill the box."""
+    (image_height, image_width), box = image_and_box
+    fitted = fit_aspect_ratio((image_height, image_width), box, aspect_ratio)
+
+    if aspect_ratio == AspectRatio.ORIGINAL:
+        assert fitted == box
+        return
+
+    start_x, start_y, end_x, end_y = fitted
+    width, height = end_x - start_x, end_y - start_y
+    ratio_width, ratio_height = aspect_ratio.get_fraction()
+    assert width * ratio_height == height * ratio_width
+    assert 0 <= start_x < end_x <= image_width
+    assert 0 <= start_y < end_y <= image_height
+
+    box_width, box_height = box[2] - box[0], box[3] - box[1]
+    if box_width >= ratio_width and box_height >= ratio_height:
+        # The largest box of the ratio inside the original one, centred on it
+        assert box[0] <= start_x and end_x <= box[2]
+        assert box[1] <= start_y and end_y <= box[3]
+        assert width + ratio_width > box_width or height + ratio_height > box_height
+        assert abs((start_x + end_x) - (box[0] + box[2])) <= 1
+        assert abs((start_y + end_y) - (box[1] + box[3])) <= 1
+
+
+@st.composite
+def _image_and_faces(draw):
+    """An image size and one to three face boxes inside it."""
+    width = draw(st.integers(16, 1200))
+    height = draw(st.integers(16, 1200))
+    faces = []
+    for _ in range(draw(st.integers(1, 3))):
+        w = draw(st.integers(1, width))
+        h = draw(st.integers(1, height))
+        faces.append(
+            [draw(st.integers(0, width - w)), draw(st.integers(0, height - h)), w, h]
+        )
+    return (width, height), np.array(faces, dtype=np.int32)
+
+
+@given(
+    _image_and_faces(),
+    st.floats(0.0, 1.0),
+    st.sampled_from(AspectRatio),
+    st.sampled_from(FaceFraming),
+)
+def test_crop_faces_never_resamples(image_and_faces, zoom, aspect_ratio, framing):
+    """Test that crops have the exact target ratio and keep the source's pixels."""
+    (width, height), faces = image_and_faces
+    gradient = np.add.outer(np.arange(height), np.arange(width)).astype(np.uint8)
+    image = Image.fromarray(gradient).convert("RGB")
+    params = ImageProcessingParams(aspect_ratio=aspect_ratio, zoom=zoom, framing=framing)
+
+    result = _PROCESSOR.crop_faces(image, faces, params)
+
+    fraction = aspect_ratio.get_fraction()
+    if fraction is not None:
+        assert result.width * fraction[1] == result.height * fraction[0]
+    # An unscaled crop continues the gradient: each pixel is one more than its left neighbour
+    pixels = np.asarray(result.convert("L")).astype(np.int16)
+    assert np.all((np.diff(pixels, axis=1) % 256) == 1)
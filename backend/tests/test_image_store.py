@@ -0,0 +1,47 @@
+import numpy as np
+from app.core.image_processor import Detection
+from app.core.image_store import ImageStore
+
+DETECTION = Detection(10, 10, np.empty((0, 4), dtype=np.int32))
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_image_store_expires_after_ttl():
+    """Test that images expire after the TTL, which is extended on every use."""
+    clock = FakeClock()
+    store = ImageStore(max_bytes=100, ttl_seconds=10, clock=clock)
+    store.put("a", b"12345", DETECTION)
+
+    clock.now = 8
+    assert store.get("a").data == b"12345"  # refreshes the TTL
+
+    clock.now = 16
+    assert store.get("a") is not None
+
+    clock.now = 30
+    assert store.get("a") is None
+    assert store.stats()["expirations"] == 1
+    assert store.stats()["bytes"] == 0
+
+
+def test_image_store_evicts_over_capacity():
+    """Test that the least recently used images are dropped to stay within budget."""
+    store = ImageStore(max_bytes=10, ttl_seconds=60, clock=FakeClock())
+    store.put("a", b"aaaa", DETECTION)
+    store.put("b", b"bbbb", DETECTION)
+    store.get("a")
+    store.put("c", b"cccc", DETECTION)
+
+    assert store.get("b") is None
+    assert store.get("a") is not None
+    assert store.get("c") is not None
+    assert store.stats()["evictions"] == 1
+
+    assert store.put("huge", b"x" * 11, DETECTION) is False
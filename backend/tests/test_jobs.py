@@ -0,0 +1,228 @@
+import asyncio
+import json
+import sqlite3
+import time
+import zipfile
+from io import BytesIO
+
+import pytest
+from app.api.routes import job_manager
+from app.core.encoding import OutputOptions
+from app.core.image_processor import ImageProcessingParams
+from app.core.jobs import JobManager, JobQueueFullError, JobStore, JobUpload
+from app.main import app
+from fastapi.testclient import TestClient
+from PIL import Image
+
+
+@pytest.fixture
+def jobs_client(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_manager, "directory", tmp_path)
+    with TestClient(app) as client:
+        yield client
+
+
+def _submit(client, test_image_bytes):
+    files = [
+        ("files", ("first.jpg", BytesIO(test_image_bytes), "image/jpeg")),
+        ("files", ("broken.jpg", BytesIO(b"not an image"), "image/jpeg")),
+        ("files", ("second.jpg", BytesIO(test_image_bytes), "image/jpeg")),
+    ]
+    response = client.post("/api/v1/jobs", files=files, data={"aspect_ratio": "square"})
+    assert response.status_code == 202
+    return response.json()
+
+
+def _wait_until_done(client, job_id, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get(f"/api/v1/jobs/{job_id}").json()
+        if status["status"] == "done":
+            return status
+        time.sleep(0.05)
+    raise AssertionError("Job did not finish in time")
+
+
+def test_job_lifecycle(jobs_client, test_image_bytes):
+    """Test submitting a job, following it to completion and downloading the results."""
+    job = _submit(jobs_client, test_image_bytes)
+    assert job["total"] == 3
+    assert job["status"] in ("queued", "running", "done")
+
+    status = _wait_until_done(jobs_client, job["job_id"])
+    assert (status["completed"], status["failed"]) == (2, 1)
+    assert [item["status"] for item in status["items"]] == ["ok", "error", "ok"]
+
+    response = jobs_client.get(f"/api/v1/jobs/{job['job_id']}/results/0")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    crop = Image.open(BytesIO(response.content))
+    assert crop.width == crop.height
+
+    assert jobs_client.get(f"/api/v1/jobs/{job['job_id']}/results/1").status_code == 409
+    assert jobs_client.get(f"/api/v1/jobs/{job['job_id']}/results/9").status_code == 404
+
+    response = jobs_client.get(f"/api/v1/jobs/{job['job_id']}/archive")
+    assert response.status_code == 200
+    with zipfile.ZipFile(BytesIO(response.content)) as archive:
+        assert sorted(archive.namelist()) == [
+            "manifest.json",
+            "processed_first.jpg",
+            "processed_second.jpg",
+        ]
+        manifest = json.loads(archive.read("manifest.json"))
+        assert [entry["status"] for entry in manifest["files"]] == ["ok", "error", "ok"]
+
+
+def test_job_events(jobs_client, test_image_bytes):
+    """Test that progress is streamed as server-sent events until the job is done."""
+    job = _submit(jobs_client, test_image_bytes)
+
+    with jobs_client.stream("GET", f"/api/v1/jobs/{job['job_id']}/events") as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [line for line in response.iter_lines() if line.startswith("event:")]
+
+    assert events[-1] == "event: done"
+    assert all(event in ("event: progress", "event: done") for event in events)
+    assert events.count("event: done") == 1
+
+
+def test_unknown_job(jobs_client):
+    """Test that unknown jobs are reported as 404."""
+    assert jobs_client.get("/api/v1/jobs/missing").status_code == 404
+    assert jobs_client.get("/api/v1/jobs/missing/archive").status_code == 404
+
+
+async def test_unfinished_jobs_resume_after_restart(tmp_path, test_image_bytes):
+    """Test that a job persisted before a restart is processed by the next start."""
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    (tmp_path / "pending" / "input").mkdir(parents=True)
+    (tmp_path / "pending" / "input" / "0").write_bytes(test_image_bytes)
+    store.create_job(
+        "pending",
+        ImageProcessingParams().model_dump_json(),
+        OutputOptions().model_dump_json(),
+        [JobUpload("photo.jpg", "processed_photo.jpg", BytesIO())],
+    )
+    store.close()
+
+    original_directory = job_manager.directory
+    job_manager.directory = tmp_path
+    try:
+        await job_manager.start()
+        version = job_manager.version
+        while job_manager.store.get_job("pending")["status"] != "done":
+            version = await job_manager.wait_for_change(version, 10.0)
+    finally:
+        await job_manager.stop()
+        job_manager.directory = original_directory
+
+    assert (tmp_path / "pending" / "output" / "processed_photo.jpg").exists()
+    assert not (tmp_path / "pending" / "input").exists()
+
+
+def test_job_store_adds_columns_to_older_databases(tmp_path):
+    """Test that a database created before the video columns existed is upgraded."""
+    path = tmp_path / "jobs.sqlite3"
+    with sqlite3.connect(path) as connection:
+        connection.executescript(
+            "CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, params TEXT NOT NULL, "
+            "output TEXT NOT NULL, created_at REAL NOT NULL, finished_at REAL);"
+            "INSERT INTO jobs VALUES ('old', 'done', '{}', '{}', 0, 0);"
+        )
+    connection.close()
+
+    store = JobStore(path)
+    try:
+        assert store.get_job("old")["kind"] == "images"
+        store.create_job("new", "{}", "{}", [JobUpload("clip.mp4", "out.mp4", BytesIO())], "video")
+        assert store.get_job("new")["kind"] == "video"
+        assert store.get_items("new")[0]["stats"] is None
+    finally:
+        store.close()
+
+
+async def test_expired_jobs_are_removed_while_idle(tmp_path):
+    """Test that finished jobs past their time-to-live are removed without new jobs."""
+    manager = JobManager(job_manager.crop_service, directory=tmp_path, ttl_seconds=0.05)
+    store = JobStore(tmp_path / "jobs.sqlite3")
+    store.create_job("old", "{}", "{}", [])
+    store.set_status("old", "done")
+    store.close()
+    (tmp_path / "old" / "output").mkdir(parents=True)
+
+    await manager.start()
+    try:
+        deadline = time.monotonic() + 5
+        while manager.store.get_job("old") is not None:
+            assert time.monotonic() < deadline
+            await asyncio.sleep(0.02)
+    finally:
+        await manager.stop()
+    assert not (tmp_path / "old").exists()
+
+
+async def test_worker_survives_a_failing_job(tmp_path, test_image_bytes, monkeypatch):
+    """Test that an unexpected error in one job does not stop the worker."""
+    manager = JobManager(job_manager.crop_service, directory=tmp_path, workers=1)
+    run_job = manager._run_job
+    failed = []
+
+    async def fail_first(job_id):
+        if not failed:
+            failed.append(job_id)
+            raise RuntimeError("database is locked")
+        await run_job(job_id)
+
+    monkeypatch.setattr(manager, "_run_job", fail_first)
+    await manager.start()
+    try:
+        uploads = [JobUpload("photo.jpg", "processed_photo.jpg", BytesIO(test_image_bytes))]
+        params, output = ImageProcessingParams(), OutputOptions()
+        await manager.submit(uploads, params, output)
+        uploads = [JobUpload("photo.jpg", "processed_photo.jpg", BytesIO(test_image_bytes))]
+        second = await manager.submit(uploads, params, output)
+
+        version = manager.version
+        while manager.store.get_job(second)["status"] != "done":
+            version = await manager.wait_for_change(version, 10.0)
+    finally:
+        await manager.stop()
+
+
+async def test_concurrent_submissions_respect_the_queue_size(
+    tmp_path, test_image_bytes, monkeypatch
+):
+    """Test that submissions racing for the last queue slot get one job queued and errors."""
+    manager = JobManager(job_manager.crop_service, directory=tmp_path, workers=1, queue_size=1)
+    release = asyncio.Event()
+
+    async def blocked(job_id):
+        await release.wait()
+
+    monkeypatch.setattr(manager, "_run_job", blocked)
+    await manager.start()
+    try:
+        params, output = ImageProcessingParams(), OutputOptions()
+
+        def uploads():
+            return [JobUpload("photo.jpg", "processed_photo.jpg", BytesIO(test_image_bytes))]
+
+        # The worker takes the first job, leaving the single queue slot free
+        running = await manager.submit(uploads(), params, output)
+        while not manager._queue.empty():
+            await asyncio.sleep(0.01)
+
+        results = await asyncio.gather(
+            *(manager.submit(uploads(), params, output) for _ in range(3)),
+            return_exceptions=True,
+        )
+        queued = [result for result in results if isinstance(result, str)]
+        assert len(queued) == 1
+        refused = [result for result in results if result not in queued]
+        assert all(isinstance(error, JobQueueFullError) for error in refused)
+        assert sorted(manager.store.unfinished_jobs()) == sorted([running, *queued])
+        assert {path.name for path in tmp_path.iterdir() if path.is_dir()} == {running, *queued}
+    finally:
+        release.set()
+        await manager.stop()
@@ -0,0 +1,82 @@
+from io import BytesIO
+
+import pytest
+from app.api.limits import BodySizeLimitMiddleware
+from app.core.config import REQUEST_OVERHEAD_BYTES, Settings
+from app.core.image_processor import (
+    ImageProcessingError,
+    ImageProcessor,
+    ImageTooLargeError,
+)
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def limited_client():
+    app = FastAPI()
+    app.add_middleware(BodySizeLimitMiddleware, max_bytes=100, path_limits={"/batch": 1000})
+
+    @app.post("/echo")
+    @app.post("/batch")
+    async def echo(request: Request):
+        return {"size": len(await request.body())}
+
+    return TestClient(app)
+
+
+def test_body_limit_rejects_declared_length(limited_client):
+    """Test that a Content-Length over the limit is refused up front."""
+    response = limited_client.post("/echo", content=b"x" * 101)
+    assert response.status_code == 413
+    assert "limit is 100 bytes" in response.json()["detail"]
+
+
+def test_body_limit_rejects_streamed_body(limited_client):
+    """Test that bodies without Content-Length are cut off once they cross the limit."""
+
+    def chunks():
+        for _ in range(10):
+            yield b"x" * 20
+
+    response = limited_client.post("/echo", content=chunks())
+    assert response.status_code == 413
+
+
+def test_body_limit_allows_small_bodies(limited_client):
+    """Test that bodies within the limit pass through untouched."""
+    response = limited_client.post("/echo", content=b"x" * 100)
+    assert response.status_code == 200
+    assert response.json() == {"size": 100}
+
+
+def test_body_limit_per_path(limited_client):
+    """Test that listed paths get their own limit and others keep the default."""
+    assert limited_client.post("/batch", content=b"x" * 1000).status_code == 200
+    response = limited_client.post("/batch", content=b"x" * 1001)
+    assert response.status_code == 413
+    assert "limit is 1000 bytes" in response.json()["detail"]
+    assert limited_client.post("/echo", content=b"x" * 101).status_code == 413
+
+
+def test_request_limit_derived_from_batch_size():
+    """Test that the default request limit fits a full batch of full-size uploads."""
+    limits = Settings(max_upload_bytes=1000, max_batch_files=3)
+    assert limits.max_request_bytes == 3000 + REQUEST_OVERHEAD_BYTES
+    assert Settings(max_request_bytes=5).max_request_bytes == 5
+
+
+def test_megapixel_limit_checked_before_decode(test_image_bytes):
+    """Test that oversized images are rejected from their header."""
+    processor = ImageProcessor(max_megapixels=1)
+    with pytest.raises(ImageTooLargeError) as exc_info:
+        processor.load_image(BytesIO(test_image_bytes))
+    assert "limit is 1" in str(exc_info.value)
+    assert isinstance(exc_info.value, ImageProcessingError)
+
+
+def test_truncated_image_rejected_by_header_check(test_image_bytes):
+    """Test that the size check runs before any pixel data is needed."""
+    processor = ImageProcessor(max_megapixels=1)
+    with pytest.raises(ImageTooLargeError):
+        processor.load_image(BytesIO(test_image_bytes[:16384]))
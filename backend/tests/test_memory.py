@@ -0,0 +1,155 @@
+import threading
+import time
+from io import BytesIO
+
+import numpy as np
+import pytest
+from app.core import memory, metrics
+from app.core.engine import ProcessingEngine
+from app.core.image_processor import ImageProcessingParams, ImageProcessor
+from app.core.pipeline import crop_task
+from PIL import Image
+
+# Budgets for one crop, Pillow's buffers included. Pillow holds a decoded RGB
+# image at 4 bytes per pixel; the crop and the encoded output need about one
+# more. Detection works at a bounded resolution and gets a fixed allowance.
+# A full-frame copy costs at least 1 more byte per pixel (a grayscale NumPy
+# plane) and breaks the budget at 16 megapixels; a full-frame Pillow copy
+# costs 4 and breaks it at any size.
+_FIXED_BUDGET = 8 * 1024 * 1024
+_PER_PIXEL_BUDGET = 5
+_DECODED_BYTES_PER_PIXEL = 3
+
+
+@pytest.fixture(scope="module")
+def processor():
+    return ImageProcessor()
+
+
+def _resized_jpeg(test_image_path, megapixels: float) -> tuple[bytes, int]:
+    image = Image.open(test_image_path)
+    scale = (megapixels * 1_000_000 / (image.width * image.height)) ** 0.5
+    image = image.resize((round(image.width * scale), round(image.height * scale)))
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue(), image.width * image.height
+
+
+def _traced_crop(processor, data: bytes) -> memory.MemoryReport:
+    with metrics.collect_stages(), memory.trace_memory() as reports:
+        crop_task(processor, BytesIO(data), ImageProcessingParams())
+    return reports[0]
+
+
+@pytest.mark.parametrize("megapixels", [2, 16])
+def test_crop_stays_within_memory_budget(processor, test_image_path, megapixels):
+    """Test that a crop's peak memory stays within its per-megapixel budget."""
+    data, pixels = _resized_jpeg(test_image_path, megapixels)
+    report = _traced_crop(processor, data)
+
+    assert report.peak_bytes <= _FIXED_BUDGET + _PER_PIXEL_BUDGET * pixels
+    assert set(report.stage_peaks) >= {"decode", "detect", "crop", "encode"}
+    # Decoded once, as RGB, with no larger intermediate
+    assert report.largest_buffers["decode"] == _DECODED_BYTES_PER_PIXEL * pixels
+    for name in ("detect", "crop", "encode"):
+        assert report.largest_buffers[name] < _DECODED_BYTES_PER_PIXEL * pixels
+
+
+@pytest.mark.parametrize("megapixels", [2, 16])
+def test_memory_budget_catches_pillow_copies(processor, test_image_path, megapixels, monkeypatch):
+    """Test that a transient full-frame Pillow copy, invisible to tracemalloc, breaks the budget."""
+    crop_image = processor._crop_image
+    monkeypatch.setattr(
+        processor, "_crop_image", lambda image, coords: crop_image(image.copy(), coords)
+    )
+    data, pixels = _resized_jpeg(test_image_path, megapixels)
+    report = _traced_crop(processor, data)
+
+    assert report.peak_bytes > _FIXED_BUDGET + _PER_PIXEL_BUDGET * pixels
+
+
+def test_trace_memory_counts_pillow_buffers():
+    """Test that Pillow images allocated in a stage count towards its peak, freed or not."""
+    with metrics.collect_stages(), memory.trace_memory() as reports:
+        with metrics.stage("decode"):
+            image = Image.new("RGB", (1000, 1000))
+            Image.new("RGB", (1000, 1000))
+        with metrics.stage("encode"):
+            pass
+    del image
+
+    report = reports[0]
+    assert report.stage_peaks["decode"] >= 2 * 4_000_000
+    # The image kept alive is still counted in the next stage, the freed one is not
+    assert 4_000_000 <= report.stage_peaks["encode"] < 2 * 4_000_000
+
+
+def test_trace_memory_is_exclusive():
+    """Test that a second trace waits for the first, so their peaks cannot interfere."""
+    order = []
+
+    def trace(name):
+        with memory.trace_memory():
+            order.append(f"{name} start")
+            time.sleep(0.05)
+            order.append(f"{name} end")
+
+    threads = [threading.Thread(target=trace, args=(name,)) for name in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert order in (
+        ["a start", "a end", "b start", "b end"],
+        ["b start", "b end", "a start", "a end"],
+    )
+
+
+def test_trace_memory_reports_array_allocations_per_stage():
+    """Test that traced NumPy allocations and tracked buffers land in their stage."""
+    with metrics.collect_stages(), memory.trace_memory() as reports:
+        with metrics.stage("decode"):
+            frame = np.ones((1000, 1000, 3), dtype=np.uint8)
+            memory.track(frame)
+        del frame
+        with metrics.stage("encode"):
+            memory.track(b"x" * 1000)
+
+    report = reports[0]
+    assert report.peak_bytes >= 3_000_000
+    assert report.stage_peaks["decode"] >= 3_000_000
+    assert report.stage_peaks["encode"] < 3_000_000
+    assert report.largest_buffers == {"decode": 3_000_000, "encode": 1000}
+    assert report.header().startswith(f"peak;kb={report.peak_bytes // 1024}, decode;kb=")
+
+
+def test_track_is_a_no_op_without_a_trace():
+    """Test that tracking outside a trace costs nothing and records nothing."""
+    memory.track(np.zeros(10))
+    with memory.trace_memory() as reports:
+        pass
+    assert reports[0].largest_buffers == {}
+
+
+async def test_engine_traces_requests_that_ask_for_it(test_image_bytes):
+    """Test that the engine traces tasks only for requests that asked and reports them."""
+    engine = ProcessingEngine(mode="thread", workers=1)
+    count = metrics.MEMORY_PEAK_BYTES.count(stage="total")
+    timer = metrics.RequestTimer()
+    request_token = metrics.current_request.set(timer)
+    try:
+        await engine.run(crop_task, test_image_bytes, ImageProcessingParams())
+        assert timer.memory is None
+
+        trace_token = memory.current_trace.set(True)
+        try:
+            await engine.run(crop_task, test_image_bytes, ImageProcessingParams())
+        finally:
+            memory.current_trace.reset(trace_token)
+    finally:
+        metrics.current_request.reset(request_token)
+        engine.shutdown()
+
+    assert timer.memory is not None
+    assert timer.memory.largest_buffers["decode"] == 2400 * 3297 * 3
+    assert metrics.MEMORY_PEAK_BYTES.count(stage="total") == count + 1
@@ -0,0 +1,72 @@
+from app.core import metrics
+from app.core.engine import ProcessingEngine
+from app.core.metrics import Counter, Gauge, Histogram, Registry
+
+
+def _stage_count(name: str) -> int:
+    return metrics.STAGE_SECONDS.count(stage=name)
+
+
+def _timed_task(processor, image_data):
+    with metrics.stage("decode"):
+        return image_data.read()
+
+
+def test_registry_renders_prometheus_text():
+    """Test the text exposition of counters, gauges and histograms."""
+    registry = Registry()
+    requests = registry.register(Counter("requests_total", "Requests", ["status"]))
+    depth = registry.register(Gauge("depth", "Queue depth"))
+    sizes = registry.register(Histogram("size", "Sizes", [1, 10]))
+
+    requests.inc(status="200")
+    requests.inc(2, status="200")
+    requests.set_function(lambda: 7, status="500")
+    depth.set_function(lambda: 3)
+    sizes.observe(0.5)
+    sizes.observe(5)
+    sizes.observe(50)
+
+    text = registry.render()
+    assert "# TYPE requests_total counter" in text
+    assert 'requests_total{status="200"} 3' in text
+    assert 'requests_total{status="500"} 7' in text
+    assert "depth 3" in text
+    assert 'size_bucket{le="1"} 1' in text
+    assert 'size_bucket{le="10"} 2' in text
+    assert 'size_bucket{le="+Inf"} 3' in text
+    assert "size_sum 55.5" in text
+    assert "size_count 3" in text
+
+
+def test_stages_are_only_timed_inside_a_collector():
+    """Test that stage() is a no-op outside collect_stages and records inside it."""
+    with metrics.stage("decode"):
+        pass
+
+    with metrics.collect_stages() as timings:
+        with metrics.stage("decode"):
+            pass
+        with metrics.stage("encode"):
+            pass
+
+    assert [name for name, _ in timings] == ["decode", "encode"]
+    assert all(seconds >= 0 for _, seconds in timings)
+
+
+async def test_engine_reports_worker_stages():
+    """Test that stages timed in a worker reach the histograms and the request timer."""
+    engine = ProcessingEngine(mode="thread", workers=1)
+    decode_count = _stage_count("decode")
+    timer = metrics.RequestTimer()
+    token = metrics.current_request.set(timer)
+    try:
+        assert await engine.run(_timed_task, b"data") == b"data"
+    finally:
+        metrics.current_request.reset(token)
+        engine.shutdown()
+
+    assert _stage_count("decode") == decode_count + 1
+    assert set(timer.stages) == {"queue", "decode"}
+    assert engine.in_flight == 0
+    assert timer.header().startswith("queue;dur=")
@@ -0,0 +1,65 @@
+import json
+from io import BytesIO
+
+from app.core.config import settings
+from app.main import app
+from fastapi.testclient import TestClient
+from PIL import Image
+
+client = TestClient(app)
+
+
+def _receive_result(websocket):
+    """Read the next result or error message, and the crop that follows a result."""
+    message = json.loads(websocket.receive_text())
+    content = websocket.receive_bytes() if message["type"] == "result" else None
+    return message, content
+
+
+def test_session_crops_images_with_changing_params(test_image_bytes):
+    """Test that images are cropped with the settings in effect when they were sent."""
+    with client.websocket_connect("/api/v1/session") as websocket:
+        session = json.loads(websocket.receive_text())
+        assert session["type"] == "session"
+        assert session["max_in_flight"] == settings.session_max_in_flight
+
+        websocket.send_text(json.dumps({"type": "params", "aspect_ratio": "square"}))
+        assert json.loads(websocket.receive_text())["params"]["aspect_ratio"] == "square"
+        websocket.send_bytes(test_image_bytes)
+        first, first_crop = _receive_result(websocket)
+
+        websocket.send_text(
+            json.dumps({"type": "params", "aspect_ratio": "9:16", "output": {"format": "png"}})
+        )
+        assert json.loads(websocket.receive_text())["output"]["format"] == "png"
+        websocket.send_bytes(test_image_bytes)
+        second, second_crop = _receive_result(websocket)
+
+    assert first["type"] == "result" and first["id"] == 0
+    assert first["size"] == len(first_crop)
+    square = Image.open(BytesIO(first_crop))
+    assert square.format == "JPEG" and square.width == square.height
+
+    assert second["id"] == 1 and second["media_type"] == "image/png"
+    portrait = Image.open(BytesIO(second_crop))
+    assert portrait.format == "PNG" and portrait.width * 16 == portrait.height * 9
+
+
+def test_session_reports_errors_and_keeps_going(test_image_bytes, monkeypatch):
+    """Test that bad messages and images get errors without ending the session."""
+    monkeypatch.setattr(settings, "session_max_in_flight", 1)
+    with client.websocket_connect("/api/v1/session") as websocket:
+        assert json.loads(websocket.receive_text())["max_in_flight"] == 1
+
+        websocket.send_text("not json")
+        assert json.loads(websocket.receive_text())["status"] == 400
+        websocket.send_text(json.dumps({"type": "params", "zoom": 3}))
+        assert json.loads(websocket.receive_text())["status"] == 422
+
+        for data in (b"not an image", test_image_bytes, test_image_bytes):
+            websocket.send_bytes(data)
+        results = [_receive_result(websocket)[0] for _ in range(3)]
+
+    assert [result["id"] for result in results] == [0, 1, 2]
+    assert results[0]["type"] == "error" and results[0]["status"] == 422
+    assert [result["type"] for result in results[1:]] == ["result", "result"]
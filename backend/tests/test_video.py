@@ -0,0 +1,112 @@
+import time
+
+import cv2
+import numpy as np
+import pytest
+from app.core.image_processor import AspectRatio, ImageProcessor
+from app.core.video import VideoParams, VideoReframer, _window_size
+from app.api.routes import job_manager
+from app.main import app
+from fastapi.testclient import TestClient
+
+FRAME_SIZE = (640, 360)
+
+
+@pytest.fixture
+def test_video_path(test_image_path, tmp_path):
+    """A face drifting across the frame for 30 frames, then a cut to a new shot for 10."""
+    portrait = cv2.resize(cv2.imread(str(test_image_path)), (200, 275))
+    path = tmp_path / "clip.mp4"
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 25, FRAME_SIZE)
+    for index in range(40):
+        frame = np.full((FRAME_SIZE[1], FRAME_SIZE[0], 3), 200, dtype=np.uint8)
+        if index < 30:
+            x = 20 + index * 12
+        else:
+            frame[:] = 40
+            x = 40
+        frame[40:315, x : x + 200] = portrait
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def test_reframe_video(test_video_path, tmp_path):
+    """Test that every frame is cropped to the window, detecting only on keyframes."""
+    output = tmp_path / "out.mp4"
+    params = VideoParams(aspect_ratio=AspectRatio.PORTRAIT, keyframe_interval=10)
+
+    stats = VideoReframer(ImageProcessor()).reframe(str(test_video_path), str(output), params)
+
+    assert stats.frames == 40
+    assert stats.scene_cuts == 1
+    assert stats.keyframes == 4  # Frames 0, 10, 20 and 30, which is also the cut
+    assert (stats.width, stats.height) == (202, 360)
+    assert stats.frames_per_second > 0
+
+    # The window follows the face, so it stays in view on every frame
+    processor = ImageProcessor()
+    capture = cv2.VideoCapture(str(output))
+    frames = 0
+    while True:
+        ok, frame = capture.read()
+        if not ok:
+            break
+        assert frame.shape[:2] == (360, 202)
+        if frames % 5 == 0:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            assert len(processor.detect_frame(gray).faces) == 1, f"no face in frame {frames}"
+        frames += 1
+    capture.release()
+    assert frames == 40
+
+
+def test_window_size():
+    """Test that the window keeps the target ratio, fits the frame and has even sides."""
+    assert _window_size(1920, 1080, VideoParams()) == (606, 1080)
+    assert _window_size(1920, 1080, VideoParams(zoom=1.0)) == (302, 540)
+    assert _window_size(1080, 1920, VideoParams(aspect_ratio=AspectRatio.SQUARE)) == (1080, 1080)
+
+
+def test_process_video_job(test_video_path, tmp_path, monkeypatch):
+    """Test that a video is reframed as a job and its result downloaded as a file."""
+    monkeypatch.setattr(job_manager, "directory", tmp_path)
+    with TestClient(app) as client, open(test_video_path, "rb") as f:
+        response = client.post(
+            "/api/v1/process-video",
+            files={"file": ("clip.mp4", f, "video/mp4")},
+            data={"aspect_ratio": AspectRatio.SQUARE.value},
+        )
+        assert response.status_code == 202
+        job = response.json()
+        assert job["kind"] == "video"
+
+        deadline = time.monotonic() + 30
+        while (status := client.get(f"/api/v1/jobs/{job['job_id']}").json())["status"] != "done":
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        item = status["items"][0]
+        assert item["status"] == "ok"
+        assert item["output"] == "processed_clip.mp4"
+        assert item["video"]["frames"] == 40
+        assert item["video"]["frames_per_second"] > 0
+
+        response = client.get(f"/api/v1/jobs/{job['job_id']}/results/0")
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "video/mp4"
+        result = tmp_path / "result.mp4"
+        result.write_bytes(response.content)
+        capture = cv2.VideoCapture(str(result))
+        assert capture.get(cv2.CAP_PROP_FRAME_COUNT) == 40
+        capture.release()
+
+        response = client.post(
+            "/api/v1/process-video",
+            files={"file": ("clip.mp4", b"not a video", "video/mp4")},
+        )
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        while (status := client.get(f"/api/v1/jobs/{job_id}").json())["status"] != "done":
+            time.sleep(0.05)
+        assert status["items"][0]["status"] == "error"
+        assert "Invalid video format" in status["items"][0]["error"]